@@ -15,6 +15,62 @@ MARELLA_DB_NAME = os.environ.get("MARELLA_POSTGRESQL_DBNAME")
 MARELLA_DB_USER = os.environ.get("MARELLA_POSTGRESQL_USER")
 MARELLA_DB_PASS = os.environ.get("MARELLA_POSTGRESQL_PASSWORD")
 
+# Число параллельных писателей товаров при синхронизации (не больше размера пула соединений)
+NURSACE_SYNC_SHARDS = int(os.environ.get("NURSACE_SYNC_SHARDS", 1))
+MARELLA_SYNC_SHARDS = int(os.environ.get("MARELLA_SYNC_SHARDS", 1))
+
+# Как часто воркер проверяет очередь синхронизаций, секунд
+WORKER_POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS", 5))
+
+# Расписание синхронизаций: интервал в минутах (0 — выключено), тихие часы вида "01:00-06:00"
+# по местному времени (UTC+SCHEDULE_UTC_OFFSET_HOURS) и случайная задержка запуска в секундах
+NURSACE_SYNC_INTERVAL_MINUTES = float(os.environ.get("NURSACE_SYNC_INTERVAL_MINUTES", 0))
+NURSACE_SYNC_QUIET_HOURS = os.environ.get("NURSACE_SYNC_QUIET_HOURS", "")
+NURSACE_SYNC_JITTER_SECONDS = float(os.environ.get("NURSACE_SYNC_JITTER_SECONDS", 0))
+MARELLA_SYNC_INTERVAL_MINUTES = float(os.environ.get("MARELLA_SYNC_INTERVAL_MINUTES", 0))
+MARELLA_SYNC_QUIET_HOURS = os.environ.get("MARELLA_SYNC_QUIET_HOURS", "")
+MARELLA_SYNC_JITTER_SECONDS = float(os.environ.get("MARELLA_SYNC_JITTER_SECONDS", 0))
+SCHEDULE_UTC_OFFSET_HOURS = float(os.environ.get("SCHEDULE_UTC_OFFSET_HOURS", 6))
+
+# Бюджет записи синхронизации по умолчанию (0 — без ограничения). Ограничение действует
+# в часы SYNC_THROTTLE_HOURS (например "09:00-21:00", пусто — всегда), а при задержке
+# коммита больше SYNC_MAX_COMMIT_LATENCY_MS скорость автоматически снижается
+SYNC_ROWS_PER_SECOND = float(os.environ.get("SYNC_ROWS_PER_SECOND", 0))
+SYNC_STATEMENTS_PER_SECOND = float(os.environ.get("SYNC_STATEMENTS_PER_SECOND", 0))
+SYNC_THROTTLE_HOURS = os.environ.get("SYNC_THROTTLE_HOURS", "")
+SYNC_MAX_COMMIT_LATENCY_MS = float(os.environ.get("SYNC_MAX_COMMIT_LATENCY_MS", 0))
+
+# Деактивация пропавших из выгрузки товаров пропускается, если пропала большая доля
+# товаров с остатком (0 — без ограничения): так обрезанная выгрузка не обнулит каталог
+SYNC_MAX_DEACTIVATE_SHARE = float(os.environ.get("SYNC_MAX_DEACTIVATE_SHARE", 0.3))
+
+# Папка, куда выгружаются файлы Торгсофт
+SHARED_FILES_DIR = os.environ.get("SHARED_FILES_DIR", "/app/shared_files")
+
+# Кэш разобранных выгрузок (pickle): закрытая папка приложения, не внутри SHARED_FILES_DIR,
+# и общий размер, сверх которого давно не использованные файлы вытесняются
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", "cache/exports")
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Проверка готовности: таймаут ping базы и сколько секунд переиспользуется его результат
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_PING_TIMEOUT_SECONDS", 2))
+HEALTH_CACHE_SECONDS = float(os.environ.get("HEALTH_CACHE_SECONDS", 10))
+
+# Профилирование синхронизации по запросу (profile=cpu|memory): куда сохраняются файлы,
+# сколько строк в отчёте и глубина стека, с которой tracemalloc запоминает аллокации
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", 50))
+PROFILE_MEMORY_FRAMES = int(os.environ.get("PROFILE_MEMORY_FRAMES", 5))
+
+# Ход синхронизации для GET /sync/{tenant}/events: как часто воркер снимает замер и
+# сохраняет его в задачу, и сколько последних замеров хранится
+SYNC_PROGRESS_SECONDS = float(os.environ.get("SYNC_PROGRESS_SECONDS", 1))
+SYNC_PROGRESS_BUFFER = int(os.environ.get("SYNC_PROGRESS_BUFFER", 60))
+
+# Как часто API проверяет, не завершилась ли новая синхронизация, чтобы перестроить
+# индекс поиска по штрихкоду и артикулу в памяти, секунд
+LOOKUP_REFRESH_SECONDS = float(os.environ.get("LOOKUP_REFRESH_SECONDS", 5))
+
 # Режим работы: dev или prod
 ENVIRONMENT = os.environ.get("ENVIRONMENT", "dev").lower()
 IS_DEV = ENVIRONMENT == "dev"
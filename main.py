@@ -1,14 +1,72 @@
-import asyncio
-from fastapi import FastAPI, Depends, File, UploadFile
-from fastapi.responses import FileResponse
-from tasks.sync_nursace import sync_torgsoft_csv_nursace
-from tasks.sync_marella import sync_torgsoft_csv_marella
+import logging
+import re
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, Depends, File, Header, Query, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from tasks.sync_nursace import NURSACE
+from tasks.sync_marella import MARELLA
+from tasks.dry_run import dry_run_sync
+from tasks.tenants import SCHEDULES, TENANTS
+from tasks.scheduler import SyncScheduler
+from tasks.throttle import default_throttle_settings
+from tasks.time_ranges import parse_time_range
+from tasks.catalog_export import EXPORT_FORMATS, iter_catalog_export
+from tasks.image_index import sync_images
+from tasks.export_files import detect_compression
+from tasks.search import search_products
+from tasks.lookup_index import LookupIndexes
+from tasks.health import readiness
+from tasks.sync_history import sync_history
+from tasks.sync_progress import iter_progress_events
+from tasks.reconcile import reconcile
+from tasks.profiling import PROFILE_ARTIFACTS, profile_path
+from tasks.job_queue import enqueue_job, get_job, queue_status, set_job_throttle
+from migrations import check_schema
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.nursace_database import get_async_session
 from config.marella_database import get_async_session as get_async_session_marella
 import os
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Загрузка файла читается и пишется блоками такого размера
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Имя загружаемого файла: только латиница, цифры, "_", "-" и "." и одно из расширений
+UPLOAD_NAME_RE = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]*$")
+UPLOAD_EXTENSIONS = (".csv", ".csv.gz", ".zip", ".csv.zst", ".jpg", ".jpeg", ".png", ".webp")
+
+
+async def check_tenant_schemas() -> dict:
+    # Синхронизация рассчитывает на уникальные ключи из миграций, поэтому
+    # при старте сверяем схему каждой базы и предупреждаем о расхождении
+    result = {}
+    for name, tenant in TENANTS.items():
+        try:
+            result[name] = await check_schema(tenant.engine)
+        except Exception as e:
+            result[name] = {"ok": False, "error": str(e)}
+        if not result[name]["ok"]:
+            logger.error(f"Схема базы {name} не соответствует ожидаемой: {result[name]}. "
+                         f"Выполните: python -m migrations upgrade {name}")
+    return result
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.schema = await check_tenant_schemas()
+    app.state.scheduler = SyncScheduler(TENANTS, SCHEDULES)
+    app.state.scheduler.start()
+    app.state.lookup = LookupIndexes(TENANTS)
+    await app.state.lookup.start()
+    yield
+    await app.state.lookup.stop()
+    await app.state.scheduler.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 async def base_router():
@@ -16,6 +74,21 @@ async def base_router():
         "message": "Hello world"
     }
 
+@app.get("/health/live", tags=["health"])
+async def health_live():
+    # Процесс жив и обрабатывает запросы; базы не проверяются
+    return {"status": "ok"}
+
+@app.get("/health/ready", tags=["health"])
+async def health_ready():
+    # 503, если хотя бы одна база магазина недоступна. Свежесть каталога
+    # (lag_seconds) на готовность не влияет, по ней настраиваются алерты
+    ready, tenants = await readiness(TENANTS)
+    return JSONResponse(
+        jsonable_encoder({"status": "ok" if ready else "unavailable", "tenants": tenants}),
+        status_code=200 if ready else 503,
+    )
+
 @app.get("/files", tags=["files"])
 async def list_files():
     folder_path = "/app/shared_files"
@@ -43,22 +116,218 @@ async def download_file(filename: str):
 
 @app.post("/upload", tags=["files"])
 async def upload_file(file: UploadFile = File(...)):
-    dest = f"/app/shared_files/{file.filename}"
-    with open(dest, "wb") as f:
-        f.write(await file.read())
-    return {"message": f"{file.filename} uploaded successfully"}
+    # Файл пишется частями через временный и переименовывается, чтобы синхронизация
+    # не прочитала недописанную выгрузку. Сжатые выгрузки (.csv.gz, .zip, .csv.zst)
+    # сохраняются как есть: синхронизация распаковывает их на лету
+    filename = os.path.basename(file.filename or "")
+    if not UPLOAD_NAME_RE.match(filename) or not filename.lower().endswith(UPLOAD_EXTENSIONS):
+        return {"error": f"Недопустимое имя файла: {file.filename}"}
+    dest = f"/app/shared_files/{filename}"
+    tmp_path = f"{dest}.{os.getpid()}.part"
+    compression = None
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if f.tell() == 0:
+                    compression = detect_compression(chunk)
+                f.write(chunk)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {"message": f"{filename} uploaded successfully", "compression": compression}
+
+
+@app.get("/{tenant}/export", tags=["export"])
+async def export_catalog(tenant: str, format: Literal["csv", "jsonl"] = "csv", gzip: bool = False):
+    # Каталог с путями категорий, справочниками и ценами в валюте, потоком из базы
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"{tenant}_catalog.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", f"{filename}.gz"
+    return StreamingResponse(
+        iter_catalog_export(sync_tenant, format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/{tenant}/search", tags=["search"])
+async def search_router(tenant: str, q: str, limit: int = 20):
+    # Поиск товаров по фрагменту названия, артикулу или штрихкоду;
+    # полный штрихкод ищется точным совпадением
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    return await search_products(sync_tenant, q, limit)
+
+
+@app.get("/{tenant}/lookup", tags=["search"])
+async def lookup_router(tenant: str, barcode: str | None = None, articul: str | None = None):
+    # Товар по штрихкоду или товары по артикулу с ценой и остатком — из индекса в памяти,
+    # без запроса к базе; индекс перестраивается после каждой успешной синхронизации
+    if TENANTS.get(tenant) is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    if (barcode is None) == (articul is None):
+        return {"error": "Укажите barcode или articul"}
+    index = app.state.lookup.get(tenant)
+    if index is None:
+        return {"error": "Индекс ещё не построен", **app.state.lookup.status(tenant)}
+    if barcode is not None:
+        item = index.by_barcode_item(barcode)
+        items = [item] if item else []
+    else:
+        items = index.by_articul_items(articul)
+    return {"items": items, "run_id": index.run_id, "built_at": index.built_at}
+
+
+@app.get("/{tenant}/lookup/status", tags=["search"])
+async def lookup_status_router(tenant: str):
+    if TENANTS.get(tenant) is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    return app.state.lookup.status(tenant)
+
+
+@app.post("/{tenant}/images/sync", tags=["sync"])
+async def sync_images_router(tenant: str):
+    # Пересканирует папку изображений без полной синхронизации каталога
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    return await sync_images(sync_tenant)
+
+
+@app.get("/sync/{tenant}/jobs/{job_id}", tags=["sync"])
+async def sync_job_status(tenant: str, job_id: int):
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    job = await get_job(sync_tenant, job_id)
+    if job is None:
+        return {"error": f"Задача {job_id} не найдена"}
+    return job
+
+
+@app.put("/sync/{tenant}/jobs/{job_id}/throttle", tags=["sync"])
+async def sync_job_throttle(
+    tenant: str,
+    job_id: int,
+    rows_per_second: float | None = Query(None, ge=0),
+    statements_per_second: float | None = Query(None, ge=0),
+    active_hours: str | None = None,
+    max_commit_latency_ms: float | None = Query(None, ge=0),
+    reset: bool = False,
+):
+    # Бюджет записи задачи; выполняющаяся синхронизация подхватит его в течение нескольких секунд.
+    # 0 снимает ограничение, reset=true возвращает значения по умолчанию
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    try:
+        parse_time_range(active_hours or "")
+    except ValueError:
+        return {"error": f"Неверный диапазон часов: {active_hours}"}
+    settings = {
+        "rows_per_second": rows_per_second,
+        "statements_per_second": statements_per_second,
+        "active_hours": active_hours,
+        "max_commit_latency_ms": max_commit_latency_ms,
+    }
+    if reset:
+        settings = {key: None for key in settings}
+    else:
+        settings = {key: value for key, value in settings.items() if value is not None}
+    throttle = await set_job_throttle(sync_tenant, job_id, settings)
+    if throttle is None:
+        return {"error": f"Задача {job_id} не найдена"}
+    return {"job_id": job_id, "throttle": {**default_throttle_settings(), **throttle}}
+
+
+@app.get("/sync/{tenant}/jobs/{job_id}/profile", tags=["sync"])
+async def sync_job_profile(tenant: str, job_id: int, artifact: Literal["report", "pstats"] = "report"):
+    # Профиль задачи, запущенной с profile=cpu|memory: текстовый отчёт или pstats (только cpu)
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    job = await get_job(sync_tenant, job_id)
+    if job is None:
+        return {"error": f"Задача {job_id} не найдена"}
+    if job["profile"] not in PROFILE_ARTIFACTS or artifact not in PROFILE_ARTIFACTS[job["profile"]]:
+        return {"error": f"У задачи {job_id} нет профиля {artifact}"}
+    path = profile_path(tenant, job_id, job["profile"], artifact)
+    if not os.path.isfile(path):
+        return {"error": f"Профиль задачи {job_id} ещё не готов"}
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+@app.get("/sync/{tenant}/history", tags=["sync"])
+async def sync_history_router(tenant: str, limit: int = 50, days: int = 30):
+    # Последние прогоны синхронизации и p50/p95 длительности и скорости за days дней
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    return await sync_history(sync_tenant, limit, days)
+
+
+@app.get("/sync/{tenant}/events", tags=["sync"])
+async def sync_events_router(tenant: str, job_id: int | None = None, last_event_id: str | None = Header(None)):
+    # Ход синхронизации потоком Server-Sent Events: строки, скорость, ETA, этап и ошибки.
+    # Без job_id — выполняющаяся задача, иначе ожидающая или последняя завершённая
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    return StreamingResponse(
+        iter_progress_events(sync_tenant, job_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/sync/{tenant}/reconcile", tags=["sync"])
+async def reconcile_router(tenant: str, repair: bool = False):
+    # Сверка базы с выгрузкой по контрольным суммам диапазонов good_id;
+    # repair=true перезаписывает расходящиеся товары без полной синхронизации
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    return await reconcile(sync_tenant, repair)
+
+
+@app.get("/sync/{tenant}/schedule", tags=["sync"])
+async def sync_schedule(tenant: str):
+    # Расписание, ближайший запуск и итог последней синхронизации
+    sync_tenant = TENANTS.get(tenant)
+    if sync_tenant is None:
+        return {"error": f"Неизвестный магазин: {tenant}"}
+    scheduler = getattr(app.state, "scheduler", None)
+    return {
+        "schedule": scheduler.status(tenant) if scheduler else {"enabled": False},
+        "queue": await queue_status(sync_tenant),
+    }
 
 
 @app.post("/", tags=["sync"])
 async def sync_router(
     synced: bool,
+    dry_run: bool = False,
+    profile: Literal["cpu", "memory"] | None = None,
     session: AsyncSession = Depends(get_async_session)
 ):
+    if synced and dry_run:
+        # Только считает изменения, в базу ничего не пишется
+        return await dry_run_sync(NURSACE)
     if synced:
         print("Syncing products...")
-        task = asyncio.create_task(sync_torgsoft_csv_nursace())
+        # Синхронизацию выполняет воркер (worker.py), здесь задача только ставится в очередь.
+        # С profile=cpu|memory прогон идёт под профилировщиком, файлы — в /sync/nursace/jobs/{job_id}/profile
+        job_id, coalesced = await enqueue_job(NURSACE, profile)
         return {
-            "message": "start product sync"
+            "message": "start product sync",
+            "job_id": job_id,
+            "coalesced": coalesced
         }
     else:
         print("Products not synced")
@@ -86,13 +355,22 @@ async def sync_router(
 @app.post("/marella", tags=["sync"])
 async def sync_router_marella(
     synced: bool,
+    dry_run: bool = False,
+    profile: Literal["cpu", "memory"] | None = None,
     session: AsyncSession = Depends(get_async_session_marella)
 ):
+    if synced and dry_run:
+        # Только считает изменения, в базу ничего не пишется
+        return await dry_run_sync(MARELLA)
     if synced:
         print("Syncing products...")
-        task = asyncio.create_task(sync_torgsoft_csv_marella())
+        # Синхронизацию выполняет воркер (worker.py), здесь задача только ставится в очередь.
+        # С profile=cpu|memory прогон идёт под профилировщиком, файлы — в /sync/marella/jobs/{job_id}/profile
+        job_id, coalesced = await enqueue_job(MARELLA, profile)
         return {
-            "message": "start product sync"
+            "message": "start product sync",
+            "job_id": job_id,
+            "coalesced": coalesced
         }
     else:
         print("Products not synced")
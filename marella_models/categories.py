@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from config.marella_database import Base
 
@@ -10,6 +10,11 @@ class Category(Base):
     parent_category_id = Column(Integer, ForeignKey('categories.category_id'))
     synchronization_section = Column(String(255))
     good_type_name = Column(String(255))
+
+    __table_args__ = (
+        # NULL-родитель приравнивается к 0, чтобы корневые имена тоже были уникальны
+        Index('uq_categories_name', func.coalesce(parent_category_id, 0), category_name, unique=True),
+    )
     
     parent = relationship("Category", remote_side=[category_id], back_populates="children")
     children = relationship("Category", back_populates="parent")
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index
 from sqlalchemy.orm import relationship
 from config.marella_database import Base
 
 class Manufacturer(Base):
     __tablename__ = 'manufacturers'
+    __table_args__ = (
+        Index('uq_manufacturers_name', 'manufacturer_name', unique=True),
+    )
     
     manufacturer_id = Column(Integer, primary_key=True)
     manufacturer_name = Column(String(100), nullable=False)
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float
+from sqlalchemy import Column, Integer, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from config.marella_database import Base
 
 class ProductCurrencyPrice(Base):
     __tablename__ = 'product_currency_prices'
+    __table_args__ = (
+        Index('uq_product_currency_prices_good_currency', 'good_id', 'currency_id', unique=True),
+    )
     
     price_id = Column(Integer, primary_key=True)
     good_id = Column(Integer, ForeignKey('products.good_id'))
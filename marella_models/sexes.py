@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index
 from sqlalchemy.orm import relationship
 from config.marella_database import Base
 
 class Sex(Base):
     __tablename__ = 'sexes'
+    __table_args__ = (
+        Index('uq_sexes_name', 'sex_name', unique=True),
+    )
     
     sex_id = Column(Integer, primary_key=True)
     sex_name = Column(String(50), nullable=False)  # 0 - не определен, 1 - мужской, и т.д.
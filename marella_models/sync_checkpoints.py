@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, func
+from config.marella_database import Base
+
+class SyncCheckpoint(Base):
+    __tablename__ = 'sync_checkpoints'
+
+    checkpoint_key = Column(String(50), primary_key=True)  # Поток записи, для одного прогона — "main"
+    fingerprint = Column(String(64), nullable=False)  # sha256 файла выгрузки
+    position = Column(Integer, nullable=False)  # Сколько товаров уже записано в порядке обработки
+    stats = Column(JSON)  # Частичная статистика на момент чекпойнта
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,75 @@
+import logging
+
+from sqlalchemy import text
+
+from migrations.versions import MIGRATIONS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = max(migration.version for migration in MIGRATIONS)
+
+# Ключ advisory-lock, чтобы две миграции одной базы не шли одновременно
+MIGRATION_LOCK_KEY = 7_310_026_030
+
+
+async def _applied_versions(conn) -> set:
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer PRIMARY KEY,
+            name varchar(255) NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+        """
+    ))
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return set(result.scalars().all())
+
+
+async def upgrade(engine, name: str = "") -> list[int]:
+    """
+    Применяет недостающие миграции в одной транзакции.
+
+    Returns:
+        list[int]: Версии применённых миграций.
+    """
+    applied_now = []
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        applied = await _applied_versions(conn)
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            logger.info(f"[{name}] Миграция {migration.version}: {migration.name}")
+            await migration.apply(conn, lambda message: logger.info(f"[{name}] {message}"))
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": migration.version, "name": migration.name},
+            )
+            applied_now.append(migration.version)
+    return applied_now
+
+
+async def check_schema(engine) -> dict:
+    """
+    Сверяет схему базы с ожидаемой версией.
+
+    Returns:
+        dict: Текущая и ожидаемая версии, список отсутствующих индексов и флаг ok.
+    """
+    async with engine.connect() as conn:
+        exists = (await conn.execute(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))).scalar()
+        version = 0
+        if exists:
+            version = (await conn.execute(text("SELECT coalesce(max(version), 0) FROM schema_migrations"))).scalar()
+        result = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"))
+        indexes = set(result.scalars().all())
+
+    expected = [name for migration in MIGRATIONS for name in migration.indexes]
+    missing = [name for name in expected if name not in indexes]
+    return {
+        "version": version,
+        "expected_version": SCHEMA_VERSION,
+        "missing_indexes": missing,
+        "ok": version >= SCHEMA_VERSION and not missing,
+    }
@@ -0,0 +1,33 @@
+"""
+Миграции схемы баз магазинов.
+
+    python -m migrations upgrade [nursace|marella]
+    python -m migrations check [nursace|marella]
+"""
+import asyncio
+import logging
+import sys
+
+from migrations import check_schema, upgrade
+from tasks.tenants import TENANTS
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main(command: str, names: list[str]):
+    for name in names or list(TENANTS):
+        tenant = TENANTS[name]
+        if command == "upgrade":
+            applied = await upgrade(tenant.engine, name)
+            print(f"{name}: применены миграции {applied}" if applied else f"{name}: схема актуальна")
+        elif command == "check":
+            print(f"{name}: {await check_schema(tenant.engine)}")
+        else:
+            raise SystemExit(__doc__)
+        await tenant.engine.dispose()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    asyncio.run(main(sys.argv[1], sys.argv[2:]))
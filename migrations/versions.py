@@ -0,0 +1,283 @@
+from sqlalchemy import text
+
+# Справочники: таблица -> (первичный ключ, ключ уникальности, ссылки на таблицу)
+DIMENSIONS = {
+    "manufacturers": ("manufacturer_id", ("manufacturer_name",), (("products", "manufacturer_id"), ("collections", "manufacturer_id"))),
+    "seasons": ("season_id", ("season_name",), (("products", "season_id"),)),
+    "sexes": ("sex_id", ("sex_name",), (("products", "sex_id"),)),
+    "materials": ("material_id", ("material_name",), (("products", "material_id"),)),
+    "measure_units": ("measure_unit_id", ("unit_name",), (("products", "measure_unit_id"), ("products", "guarantee_mes_unit_id"))),
+    "currencies": ("currency_id", ("currency_name",), (("product_currency_prices", "currency_id"),)),
+    "categories": (
+        "category_id", ("COALESCE(parent_category_id, 0)", "category_name"),
+        (("products", "category_id"), ("categories", "parent_category_id")),
+    ),
+    "collections": (
+        "collection_id", ("COALESCE(parent_collection_id, 0)", "collection_name"),
+        (("products", "collection_id"), ("collections", "parent_collection_id")),
+    ),
+}
+
+
+async def merge_duplicates(conn, table: str, pk: str, key: tuple, references: tuple) -> int:
+    """
+    Сливает записи с одинаковым ключом в запись с наименьшим id.
+
+    Ссылки на удаляемые записи переводятся на оставшуюся. Для иерархий слияние
+    родителей может породить новые дубликаты среди детей, поэтому шаг
+    повторяется, пока дубликаты не закончатся.
+
+    Returns:
+        int: Количество удалённых дубликатов.
+    """
+    removed = 0
+    while True:
+        await conn.execute(text("DROP TABLE IF EXISTS _merge_map"))
+        await conn.execute(text(
+            f"""
+            CREATE TEMP TABLE _merge_map AS
+            SELECT old_id, new_id FROM (
+                SELECT {pk} AS old_id, min({pk}) OVER (PARTITION BY {', '.join(key)}) AS new_id
+                FROM {table}
+            ) AS m
+            WHERE old_id <> new_id
+            """
+        ))
+        count = (await conn.execute(text("SELECT count(*) FROM _merge_map"))).scalar()
+        if not count:
+            break
+        for ref_table, ref_column in references:
+            await conn.execute(text(
+                f"UPDATE {ref_table} SET {ref_column} = m.new_id FROM _merge_map m WHERE {ref_table}.{ref_column} = m.old_id"
+            ))
+        await conn.execute(text(f"DELETE FROM {table} USING _merge_map m WHERE {table}.{pk} = m.old_id"))
+        removed += count
+    await conn.execute(text("DROP TABLE IF EXISTS _merge_map"))
+    return removed
+
+
+async def delete_duplicates(conn, table: str, pk: str, key: tuple, keep: str = "max") -> int:
+    # Для таблиц без входящих ссылок дубликаты просто удаляются
+    result = await conn.execute(text(
+        f"""
+        DELETE FROM {table} AS t
+        USING (
+            SELECT {pk} AS id, {keep}({pk}) OVER (PARTITION BY {', '.join(key)}) AS keep_id FROM {table}
+        ) AS d
+        WHERE t.{pk} = d.id AND d.id <> d.keep_id
+        """
+    ))
+    return result.rowcount
+
+
+async def v1_unique_keys(conn, log):
+    """Уникальные ключи справочников, аналогов и цен в валюте."""
+    for table, (pk, key, references) in DIMENSIONS.items():
+        removed = await merge_duplicates(conn, table, pk, key, references)
+        if removed:
+            log(f"{table}: слито дубликатов: {removed}")
+    removed = await delete_duplicates(conn, "analogs", "analog_id", ("good_id", "analog_good_id"), keep="min")
+    if removed:
+        log(f"analogs: удалено дубликатов: {removed}")
+    # Из цен в валюте оставляем последнюю записанную
+    removed = await delete_duplicates(conn, "product_currency_prices", "price_id", ("good_id", "currency_id"), keep="max")
+    if removed:
+        log(f"product_currency_prices: удалено дубликатов: {removed}")
+
+    for table, (pk, key, references) in DIMENSIONS.items():
+        columns = ", ".join(f"({column})" if "(" in column else column for column in key)
+        await conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_name ON {table} ({columns})"))
+    await conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_analogs_pair ON analogs (good_id, analog_good_id)"))
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_product_currency_prices_good_currency "
+        "ON product_currency_prices (good_id, currency_id)"
+    ))
+
+
+async def v2_sync_checkpoints(conn, log):
+    """Таблица чекпойнтов, с которых продолжается прерванная синхронизация."""
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS sync_checkpoints (
+            checkpoint_key varchar(50) PRIMARY KEY,
+            fingerprint varchar(64) NOT NULL,
+            position integer NOT NULL,
+            stats json,
+            updated_at timestamptz DEFAULT now()
+        )
+        """
+    ))
+
+
+async def v3_attribute_keys(conn, log):
+    """Уникальный ключ атрибутов товара: одно значение на (good_id, attribute_name)."""
+    removed = await delete_duplicates(conn, "product_attributes", "attribute_id", ("good_id", "attribute_name"), keep="max")
+    if removed:
+        log(f"product_attributes: удалено дубликатов: {removed}")
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_product_attributes_good_name "
+        "ON product_attributes (good_id, attribute_name)"
+    ))
+
+
+async def v4_sync_jobs(conn, log):
+    """Очередь задач синхронизации, которую разбирают воркеры."""
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS sync_jobs (
+            job_id serial PRIMARY KEY,
+            status varchar(20) NOT NULL DEFAULT 'pending',
+            attempts integer NOT NULL DEFAULT 0,
+            max_attempts integer NOT NULL DEFAULT 3,
+            run_after timestamptz NOT NULL DEFAULT now(),
+            worker varchar(255),
+            heartbeat_at timestamptz,
+            result json,
+            error text,
+            created_at timestamptz DEFAULT now(),
+            started_at timestamptz,
+            finished_at timestamptz
+        )
+        """
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sync_jobs_status_run_after ON sync_jobs (status, run_after)"
+    ))
+
+
+async def v5_coalesce_pending_jobs(conn, log):
+    """Не больше одной ожидающей задачи синхронизации: повторные запуски сливаются в неё."""
+    result = await conn.execute(text(
+        """
+        UPDATE sync_jobs SET status = 'failed', error = 'объединена с более ранней задачей', finished_at = now()
+        WHERE status = 'pending'
+          AND job_id <> (SELECT min(job_id) FROM sync_jobs WHERE status = 'pending')
+        """
+    ))
+    if result.rowcount:
+        log(f"sync_jobs: объединено ожидающих задач: {result.rowcount}")
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_sync_jobs_pending ON sync_jobs (status) WHERE status = 'pending'"
+    ))
+
+
+async def v6_sync_job_throttle(conn, log):
+    """Бюджет записи задачи синхронизации, который воркер перечитывает на лету."""
+    await conn.execute(text("ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS throttle json"))
+
+
+async def v7_sync_job_profile(conn, log):
+    """Режим профилирования задачи синхронизации."""
+    await conn.execute(text("ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS profile varchar(20)"))
+
+
+async def v8_sync_runs(conn, log):
+    """История прогонов синхронизации: длительность, этапы и статистика."""
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            run_id serial PRIMARY KEY,
+            tenant varchar(50) NOT NULL,
+            fingerprint varchar(64),
+            started_at timestamptz NOT NULL,
+            finished_at timestamptz NOT NULL,
+            duration_seconds double precision NOT NULL,
+            rows integer,
+            rows_per_second double precision,
+            stages json,
+            stats json,
+            error text
+        )
+        """
+    ))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sync_runs_started_at ON sync_runs (started_at)"))
+
+
+async def v9_product_catalog_view(conn, log):
+    """Денормализованная витрина каталога; заполняется первой синхронизацией."""
+    exists = (await conn.execute(text("SELECT to_regclass('product_catalog_view') IS NOT NULL"))).scalar()
+    if not exists:
+        # Типы столбцов берутся из products, поэтому у магазинов они совпадают со своими товарами
+        await conn.execute(text(
+            """
+            CREATE TABLE product_catalog_view AS
+            SELECT good_id, good_name, short_name, description, articul, barcode,
+                   retail_price, wholesale_price, retail_price_with_discount, price_discount_percent,
+                   warehouse_quantity, display, closeout, product_size, fashion_name,
+                   category_id, NULL::text AS category_path, collection_id, NULL::text AS collection_path,
+                   manufacturer_id, NULL::text AS manufacturer, NULL::text AS country, NULL::text AS season,
+                   NULL::text AS sex, color_id, NULL::text AS material, NULL::text AS measure_unit,
+                   NULL::json AS currency_prices, now() AS refreshed_at
+            FROM products
+            WITH NO DATA
+            """
+        ))
+        await conn.execute(text("ALTER TABLE product_catalog_view ADD PRIMARY KEY (good_id)"))
+        await conn.execute(text("ALTER TABLE product_catalog_view ALTER COLUMN good_name SET NOT NULL"))
+        await conn.execute(text("ALTER TABLE product_catalog_view ALTER COLUMN refreshed_at SET DEFAULT now()"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_product_catalog_view_category_id ON product_catalog_view (category_id)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_product_catalog_view_manufacturer_id ON product_catalog_view (manufacturer_id)"
+    ))
+
+
+async def v10_product_search(conn, log):
+    """Индексы поиска товаров: триграммные по названию, артикулу и штрихкоду, btree по штрихкоду."""
+    # Точное совпадение полного штрихкода не зависит от pg_trgm
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_barcode ON products (barcode)"))
+    available = (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')"
+    ))).scalar()
+    if not available:
+        log("pg_trgm недоступен: поиск по фрагменту будет идти без триграммных индексов")
+        return
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for column in ("good_name", "articul", "barcode"):
+        await conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_products_{column}_trgm ON products USING gin ({column} gin_trgm_ops)"
+        ))
+
+
+async def v11_sync_job_progress(conn, log):
+    """Последние замеры хода задачи синхронизации для потока событий."""
+    await conn.execute(text("ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS progress json"))
+
+
+class Migration:
+    def __init__(self, version: int, name: str, apply, indexes: tuple = ()):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        # Индексы, по которым проверяется, что миграция действительно применена
+        self.indexes = indexes
+
+
+MIGRATIONS = [
+    Migration(
+        1, "unique_keys", v1_unique_keys,
+        indexes=(
+            *(f"uq_{table}_name" for table in DIMENSIONS),
+            "uq_analogs_pair",
+            "uq_product_currency_prices_good_currency",
+        ),
+    ),
+    Migration(2, "sync_checkpoints", v2_sync_checkpoints, indexes=("sync_checkpoints_pkey",)),
+    Migration(3, "attribute_keys", v3_attribute_keys, indexes=("uq_product_attributes_good_name",)),
+    Migration(4, "sync_jobs", v4_sync_jobs, indexes=("ix_sync_jobs_status_run_after",)),
+    Migration(5, "coalesce_pending_jobs", v5_coalesce_pending_jobs, indexes=("uq_sync_jobs_pending",)),
+    Migration(6, "sync_job_throttle", v6_sync_job_throttle),
+    Migration(7, "sync_job_profile", v7_sync_job_profile),
+    Migration(8, "sync_runs", v8_sync_runs, indexes=("ix_sync_runs_started_at",)),
+    Migration(
+        9, "product_catalog_view", v9_product_catalog_view,
+        indexes=(
+            "product_catalog_view_pkey",
+            "ix_product_catalog_view_category_id",
+            "ix_product_catalog_view_manufacturer_id",
+        ),
+    ),
+    Migration(10, "product_search", v10_product_search, indexes=("ix_products_barcode",)),
+    Migration(11, "sync_job_progress", v11_sync_job_progress),
+]
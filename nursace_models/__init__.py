@@ -13,6 +13,10 @@ from .product_attributes import ProductAttribute
 from .product_currency_prices import ProductCurrencyPrice
 from .analogs import Analog
 from .product_images import ProductImage
+from .sync_checkpoints import SyncCheckpoint
+from .sync_jobs import SyncJob
+from .sync_runs import SyncRun
+from .product_catalog_view import ProductCatalogView
 
 __all__ = [
     'Base',
@@ -30,4 +34,8 @@ __all__ = [
     'ProductCurrencyPrice',
     'Analog',
     'ProductImage',
+    'SyncCheckpoint',
+    'SyncJob',
+    'SyncRun',
+    'ProductCatalogView',
 ]
\ No newline at end of file
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
 class Analog(Base):
     __tablename__ = 'analogs'
+    __table_args__ = (
+        Index('uq_analogs_pair', 'good_id', 'analog_good_id', unique=True),
+    )
     
     analog_id = Column(Integer, primary_key=True)
     good_id = Column(Integer, ForeignKey('products.good_id'))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
@@ -9,6 +9,11 @@ class Collection(Base):
     collection_name = Column(String(255), nullable=False)
     parent_collection_id = Column(Integer, ForeignKey('collections.collection_id'))
     manufacturer_id = Column(Integer, ForeignKey('manufacturers.manufacturer_id'))
+
+    __table_args__ = (
+        # NULL-родитель приравнивается к 0, чтобы корневые имена тоже были уникальны
+        Index('uq_collections_name', func.coalesce(parent_collection_id, 0), collection_name, unique=True),
+    )
     
     parent = relationship("Collection", remote_side=[collection_id], back_populates="children")
     children = relationship("Collection", back_populates="parent")
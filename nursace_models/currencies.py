@@ -1,9 +1,12 @@
-from sqlalchemy import Column,  Integer,  String
+from sqlalchemy import Column,  Integer,  String, Index
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
 class Currency(Base):
     __tablename__ = 'currencies'
+    __table_args__ = (
+        Index('uq_currencies_name', 'currency_name', unique=True),
+    )
     
     currency_id = Column(Integer, primary_key=True)
     currency_name = Column(String(50), nullable=False)
@@ -1,9 +1,12 @@
-from sqlalchemy import Column,  Integer,  String
+from sqlalchemy import Column,  Integer,  String, Index
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
 class Material(Base):
     __tablename__ = 'materials'
+    __table_args__ = (
+        Index('uq_materials_name', 'material_name', unique=True),
+    )
     
     material_id = Column(Integer, primary_key=True)
     material_name = Column(String(200), nullable=False)
@@ -1,9 +1,12 @@
-from sqlalchemy import Column,  Integer,  String
+from sqlalchemy import Column,  Integer,  String, Index
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
 class MeasureUnit(Base):
     __tablename__ = 'measure_units'
+    __table_args__ = (
+        Index('uq_measure_units_name', 'unit_name', unique=True),
+    )
     
     measure_unit_id = Column(Integer, primary_key=True)
     unit_name = Column(String(255), nullable=False)
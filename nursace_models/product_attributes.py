@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
 class ProductAttribute(Base):
     __tablename__ = 'product_attributes'
+    __table_args__ = (
+        Index('uq_product_attributes_good_name', 'good_id', 'attribute_name', unique=True),
+    )
     
     attribute_id = Column(Integer, primary_key=True)
     good_id = Column(Integer, ForeignKey('products.good_id'))
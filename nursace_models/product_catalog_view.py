@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, JSON, Index, func
+from config.nursace_database import Base
+
+# Витрина каталога: товар с путями и названиями справочников и ценами в одной строке.
+# Обновляется синхронизацией (tasks.catalog_view), витрина магазина читает только её
+class ProductCatalogView(Base):
+    __tablename__ = 'product_catalog_view'
+    __table_args__ = (
+        Index('ix_product_catalog_view_category_id', 'category_id'),
+        Index('ix_product_catalog_view_manufacturer_id', 'manufacturer_id'),
+    )
+
+    good_id = Column(Integer, primary_key=True)
+    good_name = Column(String(500), nullable=False)
+    short_name = Column(String(255))
+    description = Column(String(255))
+    articul = Column(String(30))
+    barcode = Column(String(40))
+    retail_price = Column(Float)
+    wholesale_price = Column(Float)
+    retail_price_with_discount = Column(Float)
+    price_discount_percent = Column(Float)
+    warehouse_quantity = Column(Float)
+    display = Column(Integer)
+    closeout = Column(Integer)
+    product_size = Column(Float)
+    fashion_name = Column(String(255))
+    category_id = Column(Integer)
+    category_path = Column(Text)  # "Аксессуары, Бумажники"
+    collection_id = Column(Integer)
+    collection_path = Column(Text)
+    manufacturer_id = Column(Integer)
+    manufacturer = Column(Text)
+    country = Column(Text)
+    season = Column(Text)
+    sex = Column(Text)
+    color_id = Column(Integer)
+    material = Column(Text)
+    measure_unit = Column(Text)
+    currency_prices = Column(JSON(none_as_null=True))  # {валюта: {retail_price, wholesale_price}}
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now())
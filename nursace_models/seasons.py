@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index
 from sqlalchemy.orm import relationship
 from config.nursace_database import Base
 
 class Season(Base):
     __tablename__ = 'seasons'
+    __table_args__ = (
+        Index('uq_seasons_name', 'season_name', unique=True),
+    )
     
     season_id = Column(Integer, primary_key=True)
     season_name = Column(String(100), nullable=False)
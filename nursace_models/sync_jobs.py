@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Index, func, text
+from config.nursace_database import Base
+
+class SyncJob(Base):
+    __tablename__ = 'sync_jobs'
+    __table_args__ = (
+        Index('ix_sync_jobs_status_run_after', 'status', 'run_after'),
+        # Не больше одной ожидающей задачи: новые запуски сливаются в неё
+        Index('uq_sync_jobs_pending', 'status', unique=True, postgresql_where=text("status = 'pending'")),
+    )
+
+    job_id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, server_default='pending')  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, server_default='0')
+    max_attempts = Column(Integer, nullable=False, server_default='3')
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # Не раньше этого времени (повтор с задержкой)
+    worker = Column(String(255))  # Кто взял задачу
+    heartbeat_at = Column(DateTime(timezone=True))  # Обновляется воркером, пока задача выполняется
+    result = Column(JSON)  # Статистика синхронизации
+    error = Column(Text)
+    throttle = Column(JSON)  # Бюджет записи, меняется на лету через API
+    profile = Column(String(20))  # cpu или memory: прогон под профилировщиком
+    progress = Column(JSON)  # Последние замеры хода синхронизации (GET /sync/{tenant}/events)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, JSON, Index
+from config.nursace_database import Base
+
+class SyncRun(Base):
+    __tablename__ = 'sync_runs'
+    __table_args__ = (
+        Index('ix_sync_runs_started_at', 'started_at'),
+    )
+
+    run_id = Column(Integer, primary_key=True)
+    tenant = Column(String(50), nullable=False)
+    fingerprint = Column(String(64))  # sha256 файла выгрузки
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=False)
+    duration_seconds = Column(Float, nullable=False)
+    rows = Column(Integer)  # Обработано строк товаров
+    rows_per_second = Column(Float)
+    stages = Column(JSON)  # Время этапов в секундах: parse, rows, prepare, write, deactivate, images
+    stats = Column(JSON)  # Итоговая статистика синхронизации
+    error = Column(Text)
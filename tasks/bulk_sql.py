@@ -0,0 +1,136 @@
+from sqlalchemy import Integer, bindparam, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY
+
+
+async def count_missing_products(session, product_model, seen_good_ids) -> tuple[int, int]:
+    """
+    Считает товары с остатком, которых нет в выгрузке, и все товары с остатком.
+
+    Returns:
+        tuple: Сколько товаров будет деактивировано и сколько товаров с остатком всего.
+    """
+    table = product_model.__tablename__
+    stmt = text(
+        f"""
+        SELECT
+            count(*) FILTER (
+                WHERE NOT EXISTS (SELECT 1 FROM unnest(:seen) AS s(good_id) WHERE s.good_id = p.good_id)
+            ) AS missing,
+            count(*) AS active
+        FROM {table} AS p
+        WHERE p.warehouse_quantity IS DISTINCT FROM 0
+        """
+    ).bindparams(bindparam("seen", type_=ARRAY(Integer)))
+    row = (await session.execute(stmt, {"seen": list(seen_good_ids)})).one()
+    return row.missing, row.active
+
+
+def deactivation_too_large(missing: int, active: int, max_share: float) -> bool:
+    # Обрезанная выгрузка (например, недокачанная по FTP) не должна обнулить весь каталог
+    return max_share > 0 and active > 0 and missing / active > max_share
+
+
+async def deactivate_missing_products(session, product_model, seen_good_ids) -> list[int]:
+    """
+    Обнуляет остаток товаров, которых нет в последней выгрузке, одним UPDATE с анти-джойном.
+
+    display не меняется: его задаёт только персонал, и вернувшийся в выгрузку
+    товар снова виден, как только у него появится остаток. Строки, у которых
+    остаток уже нулевой, не переписываются.
+
+    Returns:
+        list: GoodID деактивированных товаров.
+    """
+    table = product_model.__tablename__
+    stmt = text(
+        f"""
+        UPDATE {table} AS p
+        SET warehouse_quantity = 0
+        WHERE p.warehouse_quantity IS DISTINCT FROM 0
+          AND NOT EXISTS (
+              SELECT 1 FROM unnest(:seen) AS s(good_id) WHERE s.good_id = p.good_id
+          )
+        RETURNING p.good_id
+        """
+    ).bindparams(bindparam("seen", type_=ARRAY(Integer)))
+    result = await session.execute(stmt, {"seen": list(seen_good_ids)})
+    return list(result.scalars().all())
+
+
+async def insert_analogs(session, analog_model, product_model, pairs: list) -> list[tuple[int, int]]:
+    """
+    Добавляет связи аналогов одним INSERT ... SELECT FROM unnest.
+
+    Пары, у которых товара или аналога нет в таблице товаров, пропускаются
+    (иначе внешний ключ отменил бы всю вставку), существующие — тоже.
+
+    Returns:
+        list: Добавленные пары (good_id, analog_good_id).
+    """
+    analogs = analog_model.__tablename__
+    products = product_model.__tablename__
+    stmt = text(
+        f"""
+        INSERT INTO {analogs} (good_id, analog_good_id)
+        SELECT a.good_id, a.analog_good_id
+        FROM unnest(:good_ids, :analog_good_ids) AS a(good_id, analog_good_id)
+        WHERE EXISTS (SELECT 1 FROM {products} AS p WHERE p.good_id = a.good_id)
+          AND EXISTS (SELECT 1 FROM {products} AS p WHERE p.good_id = a.analog_good_id)
+        ON CONFLICT DO NOTHING
+        RETURNING good_id, analog_good_id
+        """
+    ).bindparams(
+        bindparam("good_ids", type_=ARRAY(Integer)),
+        bindparam("analog_good_ids", type_=ARRAY(Integer)),
+    )
+    result = await session.execute(
+        stmt,
+        {"good_ids": [pair[0] for pair in pairs], "analog_good_ids": [pair[1] for pair in pairs]},
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def update_columns_from_values(session, model, key, columns, rows) -> int:
+    """
+    Обновляет только указанные колонки одним UPDATE ... FROM (VALUES ...).
+
+    Args:
+        key: Колонка (или кортеж колонок), по которой сопоставляются строки.
+        columns: Обновляемые колонки.
+        rows: Список словарей с ключом и значениями колонок.
+
+    Returns:
+        int: Количество обновлённых строк.
+    """
+    if not rows:
+        return 0
+    table = model.__table__
+    dialect = postgresql.dialect()
+    keys = (key,) if isinstance(key, str) else tuple(key)
+    names = [*keys, *columns]
+    types = {name: table.c[name].type.compile(dialect=dialect) for name in names}
+    # Имена колонок вроде "order" совпадают с ключевыми словами SQL
+    quote = dialect.identifier_preparer.quote
+
+    params = {}
+    tuples = []
+    for i, row in enumerate(rows):
+        cells = []
+        for j, name in enumerate(names):
+            param = f"p{i}_{j}"
+            params[param] = row[name]
+            cells.append(f"CAST(:{param} AS {types[name]})")
+        tuples.append(f"({', '.join(cells)})")
+
+    assignments = ", ".join(f"{quote(name)} = v.{quote(name)}" for name in columns)
+    stmt = text(
+        f"""
+        UPDATE {table.name} AS t
+        SET {assignments}
+        FROM (VALUES {', '.join(tuples)}) AS v({', '.join(quote(name) for name in names)})
+        WHERE {' AND '.join(f"t.{quote(k)} = v.{quote(k)}" for k in keys)}
+        """
+    )
+    result = await session.execute(stmt, params)
+    return result.rowcount
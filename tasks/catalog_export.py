@@ -0,0 +1,166 @@
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import JSON, func
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+
+from tasks.torgsoft_sync import SyncTenant
+
+# Сколько строк забирать из серверного курсора за раз
+EXPORT_YIELD_PER = 1000
+
+# Внешние ключи товара, которые в выгрузке заменяются названиями
+REFERENCE_FIELDS = (
+    "category_id", "manufacturer_id", "collection_id", "season_id", "sex_id", "color_id",
+    "material_id", "measure_unit_id", "guarantee_mes_unit_id",
+)
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+
+def build_paths(rows, id_field: str, name_field: str, parent_field: str) -> dict:
+    # id -> путь вида "Аксессуары, Бумажники", как в GoodTypeFull выгрузки Торгсофт
+    nodes = {row[id_field]: row for row in rows}
+    paths = {}
+
+    def path_of(node_id):
+        if node_id not in paths:
+            node = nodes[node_id]
+            parent_id = node[parent_field]
+            prefix = path_of(parent_id) + ", " if parent_id in nodes else ""
+            paths[node_id] = prefix + node[name_field]
+        return paths[node_id]
+
+    for node_id in nodes:
+        path_of(node_id)
+    return paths
+
+
+async def load_reference_data(conn, m) -> tuple[dict, dict, list]:
+    # Справочники небольшие, поэтому пути строятся в памяти, а не рекурсивным запросом
+    result = await conn.execute(select(m.Category.category_id, m.Category.category_name, m.Category.parent_category_id))
+    category_paths = build_paths(result.mappings().all(), "category_id", "category_name", "parent_category_id")
+    result = await conn.execute(
+        select(m.Collection.collection_id, m.Collection.collection_name, m.Collection.parent_collection_id)
+    )
+    collection_paths = build_paths(result.mappings().all(), "collection_id", "collection_name", "parent_collection_id")
+    result = await conn.execute(select(m.Currency.currency_name).order_by(m.Currency.currency_id))
+    currencies = list(result.scalars().all())
+    return category_paths, collection_paths, currencies
+
+
+def currency_prices_subquery(m):
+    # Цены в валюте собираются в один JSON-объект {валюта: {retail_price, wholesale_price}}
+    price = m.ProductCurrencyPrice
+    return (
+        select(func.json_object_agg(
+            m.Currency.currency_name,
+            func.json_build_object("retail_price", price.retail_price, "wholesale_price", price.wholesale_price),
+            type_=JSON,
+        ))
+        .select_from(price)
+        .join(m.Currency, m.Currency.currency_id == price.currency_id)
+        .where(price.good_id == m.Product.good_id)
+        .scalar_subquery()
+    )
+
+
+def _export_query(m):
+    Product = m.Product
+    GuaranteeUnit = aliased(m.MeasureUnit)
+    currency_prices = currency_prices_subquery(m)
+    columns = [column for column in Product.__table__.columns if column.name not in REFERENCE_FIELDS]
+    return (
+        select(
+            *columns,
+            Product.category_id,
+            Product.collection_id,
+            m.Manufacturer.manufacturer_name.label("manufacturer"),
+            m.Manufacturer.country.label("country"),
+            m.Season.season_name.label("season"),
+            m.Sex.sex_name.label("sex"),
+            m.Material.material_name.label("material"),
+            m.MeasureUnit.unit_name.label("measure_unit"),
+            GuaranteeUnit.unit_name.label("guarantee_mes_unit"),
+            currency_prices.label("currency_prices"),
+        )
+        .outerjoin(m.Manufacturer, m.Manufacturer.manufacturer_id == Product.manufacturer_id)
+        .outerjoin(m.Season, m.Season.season_id == Product.season_id)
+        .outerjoin(m.Sex, m.Sex.sex_id == Product.sex_id)
+        .outerjoin(m.Material, m.Material.material_id == Product.material_id)
+        .outerjoin(m.MeasureUnit, m.MeasureUnit.measure_unit_id == Product.measure_unit_id)
+        .outerjoin(GuaranteeUnit, GuaranteeUnit.measure_unit_id == Product.guarantee_mes_unit_id)
+        .order_by(Product.good_id)
+    ), [column.name for column in columns]
+
+
+async def iter_catalog_export(tenant: SyncTenant, export_format: str = "csv", compress: bool = False):
+    """
+    Отдаёт каталог магазина частями по мере чтения из серверного курсора.
+
+    Товары читаются через stream() с yield_per, поэтому память не растёт с
+    размером каталога, а первые байты уходят сразу после первой порции строк.
+    Категория и коллекция выгружаются полным путём, справочники — названиями,
+    цены в валюте — объектом (jsonl) или парами колонок на валюту (csv).
+
+    Args:
+        export_format: "csv" или "jsonl".
+        compress: Сжимать поток в gzip.
+    """
+    m = tenant.models
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        if compressor:
+            # Сбрасываем сжатый блок сразу, чтобы клиент получал данные по мере чтения
+            return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    async with tenant.engine.connect() as conn:
+        category_paths, collection_paths, currencies = await load_reference_data(conn, m)
+        stmt, product_columns = _export_query(m)
+        names = [
+            *product_columns, "category_path", "collection_path", "manufacturer", "country", "season",
+            "sex", "material", "measure_unit", "guarantee_mes_unit",
+        ]
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == "csv":
+            price_columns = [f"{currency}_{field}" for currency in currencies for field in ("retail_price", "wholesale_price")]
+            writer.writerow([*names, *price_columns])
+            yield encode(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+
+        result = await conn.stream(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+        async for partition in result.mappings().partitions():
+            for row in partition:
+                paths = {
+                    "category_path": category_paths.get(row["category_id"]),
+                    "collection_path": collection_paths.get(row["collection_id"]),
+                }
+                record = {name: paths[name] if name in paths else row[name] for name in names}
+                prices = row["currency_prices"] or {}
+                if export_format == "csv":
+                    writer.writerow([
+                        *(record[name] for name in names),
+                        *(prices.get(currency, {}).get(field) for currency in currencies
+                          for field in ("retail_price", "wholesale_price")),
+                    ])
+                else:
+                    record["currency_prices"] = prices
+                    buffer.write(json.dumps(record, ensure_ascii=False, default=str))
+                    buffer.write("\n")
+            yield encode(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,123 @@
+import logging
+
+from sqlalchemy import Integer, any_, bindparam, delete, func
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.future import select
+
+from tasks.catalog_export import currency_prices_subquery, load_reference_data
+from tasks.torgsoft_sync import SyncTenant
+
+logger = logging.getLogger(__name__)
+
+# Сколько товаров витрины пересчитывается одной транзакцией
+REFRESH_CHUNK_SIZE = 1000
+
+# Поля товара, которые переносятся в витрину как есть
+PRODUCT_FIELDS = (
+    "good_id", "good_name", "short_name", "description", "articul", "barcode",
+    "retail_price", "wholesale_price", "retail_price_with_discount", "price_discount_percent",
+    "warehouse_quantity", "display", "closeout", "product_size", "fashion_name",
+    "category_id", "collection_id", "manufacturer_id", "color_id",
+)
+
+
+def _view_query(m, ids):
+    Product = m.Product
+    return (
+        select(
+            *(getattr(Product, field) for field in PRODUCT_FIELDS),
+            m.Manufacturer.manufacturer_name.label("manufacturer"),
+            m.Manufacturer.country.label("country"),
+            m.Season.season_name.label("season"),
+            m.Sex.sex_name.label("sex"),
+            m.Material.material_name.label("material"),
+            m.MeasureUnit.unit_name.label("measure_unit"),
+            currency_prices_subquery(m).label("currency_prices"),
+        )
+        .outerjoin(m.Manufacturer, m.Manufacturer.manufacturer_id == Product.manufacturer_id)
+        .outerjoin(m.Season, m.Season.season_id == Product.season_id)
+        .outerjoin(m.Sex, m.Sex.sex_id == Product.sex_id)
+        .outerjoin(m.Material, m.Material.material_id == Product.material_id)
+        .outerjoin(m.MeasureUnit, m.MeasureUnit.measure_unit_id == Product.measure_unit_id)
+        .where(Product.good_id == any_(ids))
+    )
+
+
+async def refresh_catalog_view(tenant: SyncTenant, good_ids=None) -> int:
+    """
+    Пересчитывает строки витрины product_catalog_view.
+
+    Строки пересчитываются порциями по REFRESH_CHUNK_SIZE, каждая порция —
+    один INSERT ... ON CONFLICT DO UPDATE в своей транзакции. Читатели
+    витрины не блокируются и всё время видят либо старую, либо новую строку.
+
+    Args:
+        good_ids: Товары, которые изменились. None — пересчитать витрину целиком
+            и удалить строки товаров, которых больше нет.
+
+    Returns:
+        int: Количество пересчитанных строк.
+    """
+    m = tenant.models
+    View = m.ProductCatalogView
+    async with tenant.session_maker() as session:
+        category_paths, collection_paths, _ = await load_reference_data(session, m)
+        if good_ids is None:
+            result = await session.execute(select(m.Product.good_id))
+            ids = sorted(result.scalars().all())
+            await session.execute(delete(View).where(View.good_id.not_in(select(m.Product.good_id))))
+            await session.commit()
+        else:
+            ids = sorted(good_ids)
+
+    refreshed = 0
+    for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+        chunk = ids[start:start + REFRESH_CHUNK_SIZE]
+        async with tenant.session_maker() as session:
+            chunk_ids = bindparam("ids", chunk, type_=ARRAY(Integer))
+            result = await session.execute(_view_query(m, chunk_ids))
+            rows = []
+            for row in result.mappings():
+                row = dict(row)
+                row["category_path"] = category_paths.get(row["category_id"])
+                row["collection_path"] = collection_paths.get(row["collection_id"])
+                rows.append(row)
+            if rows:
+                stmt = pg_insert(View)
+                columns = [column for column in rows[0] if column != "good_id"]
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[View.good_id],
+                    set_={**{column: stmt.excluded[column] for column in columns}, "refreshed_at": func.now()},
+                )
+                await session.execute(stmt, rows)
+            if good_ids is not None and len(rows) < len(chunk):
+                # Товар удалён из products — убираем и из витрины
+                present = {row["good_id"] for row in rows}
+                gone = bindparam("gone", [good_id for good_id in chunk if good_id not in present], type_=ARRAY(Integer))
+                await session.execute(delete(View).where(View.good_id == any_(gone)))
+            await session.commit()
+        refreshed += len(rows)
+    return refreshed
+
+
+async def catalog_view_is_empty(tenant: SyncTenant) -> bool:
+    async with tenant.session_maker() as session:
+        result = await session.execute(select(tenant.models.ProductCatalogView.good_id).limit(1))
+        return result.first() is None
+
+
+async def refresh_after_sync(tenant: SyncTenant, good_ids: set | None) -> int:
+    """
+    Обновляет витрину после синхронизации (см. after_write в run_sync).
+
+    Пересчитываются только изменённые товары. Витрина пересчитывается
+    целиком, если она ещё пуста или список изменений неполный (прогон
+    продолжил прерванный).
+    """
+    if good_ids is None or await catalog_view_is_empty(tenant):
+        good_ids = None
+    elif not good_ids:
+        return 0
+    refreshed = await refresh_catalog_view(tenant, good_ids)
+    tenant.log("info", f"Витрина каталога: обновлено строк {refreshed}" + (" (полностью)" if good_ids is None else ""))
+    return refreshed
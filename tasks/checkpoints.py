@@ -0,0 +1,45 @@
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+
+# Ключ чекпойнта прогона без шардирования
+CHECKPOINT_KEY = "main"
+
+# Счётчики разбора файла считаются заново при каждом запуске и из чекпойнта не восстанавливаются
+PARSE_STATS_KEYS = ("skipped_products", "rows_without_goodid", "rows_failed")
+
+
+def shard_checkpoint_key(index: int, count: int) -> str:
+    # При другом числе шардов ключи не совпадут, и прогон начнётся заново
+    return CHECKPOINT_KEY if count == 1 else f"shard-{index}-of-{count}"
+
+
+async def load_checkpoint(session, model, key: str = CHECKPOINT_KEY):
+    result = await session.execute(select(model).where(model.checkpoint_key == key))
+    return result.scalar_one_or_none()
+
+
+async def save_checkpoint(session, model, fingerprint: str, position: int, stats: dict, key: str = CHECKPOINT_KEY):
+    """
+    Записывает чекпойнт в текущей транзакции.
+
+    Вызывается в той же сессии, что и запись батча, поэтому чекпойнт
+    фиксируется ровно вместе с данными, которые он описывает.
+    """
+    values = {"checkpoint_key": key, "fingerprint": fingerprint, "position": position, "stats": stats}
+    stmt = pg_insert(model).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.checkpoint_key],
+        set_={
+            "fingerprint": stmt.excluded.fingerprint,
+            "position": stmt.excluded.position,
+            "stats": stmt.excluded.stats,
+            "updated_at": func.now(),
+        },
+    )
+    await session.execute(stmt)
+
+
+async def clear_checkpoints(session, model):
+    # Удаляет чекпойнты всех шардов, в том числе оставшиеся от другого числа шардов
+    await session.execute(delete(model))
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import text
+
+from config.config import SYNC_MAX_DEACTIVATE_SHARE
+from tasks.bulk_sql import deactivation_too_large
+from tasks.torgsoft_csv import convert_float_columns
+from tasks.torgsoft_sync import (
+    STATS_KEYS, CatalogState, DimensionResolver, SyncTenant, attribute_changes, classify_product,
+    currency_price_data, collect_export_rows, load_export, parse_analog_ids,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк разбирать за раз при колоночном преобразовании чисел
+CHUNK_SIZE = 1000
+
+# Поле товара, которое ссылается на справочник
+DIMENSION_FIELDS = {
+    "categories": ("category_id",),
+    "manufacturers": ("manufacturer_id",),
+    "collections": ("collection_id",),
+    "seasons": ("season_id",),
+    "sexes": ("sex_id",),
+    "materials": ("material_id",),
+    "measure_units": ("measure_unit_id", "guarantee_mes_unit_id"),
+    "currencies": ("currency_id",),
+}
+
+
+async def dry_run_sync(tenant: SyncTenant, sample_size: int = 20) -> dict:
+    """
+    Считает, что изменит синхронизация, ничего не записывая в базу.
+
+    Текущие товары, справочники, аналоги и цены в валюте читаются несколькими
+    массовыми запросами в транзакции только для чтения, выгрузка сравнивается
+    с ними в памяти в отдельном потоке, чтобы не блокировать event loop API.
+
+    Returns:
+        dict: Количество создаваемых, обновляемых и деактивируемых записей,
+            счётчики изменённых полей и примеры изменений.
+    """
+    started = time.perf_counter()
+    stats = Counter({key: 0 for key in STATS_KEYS})
+    resolver = DimensionResolver(tenant.models)
+    state = CatalogState(tenant.models)
+
+    try:
+        parsed_rows, _ = await load_export(tenant, stats)
+    except FileNotFoundError:
+        return {"error": f"Файл {tenant.csv_path} не найден"}
+
+    async with tenant.session_maker() as session:
+        await session.execute(text("SET TRANSACTION READ ONLY"))
+        await resolver.load(session)
+        await state.load(session)
+        await session.rollback()
+
+    report = await asyncio.to_thread(_dry_run_report, tenant, resolver, state, parsed_rows, stats, sample_size)
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def _dry_run_report(
+    tenant: SyncTenant,
+    resolver: DimensionResolver,
+    state: CatalogState,
+    parsed_rows: list,
+    stats: Counter,
+    sample_size: int,
+) -> dict:
+    products = Counter()
+    field_changes = Counter()
+    new_dimensions = defaultdict(set)
+    analogs_to_create = set()
+    prices = Counter()
+    attributes = Counter()
+    samples = {"create": [], "update": [], "fast_update": [], "deactivate": []}
+    seen_good_ids = set()
+
+    # Повторы GoodID схлопываются так же, как при синхронизации
+    rows = list(collect_export_rows(tenant, parsed_rows, stats).values())
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        floats = convert_float_columns([pending.row_idx for pending in chunk], tenant.float_columns)
+        for row_index, pending in enumerate(chunk):
+            good_id = pending.good_id
+            try:
+                data = tenant.build_product_data(pending.row_idx, good_id)
+                floats.fill(data, row_index)
+                analog_ids = parse_analog_ids(pending.row_idx)
+                attribute_creates, attribute_updates, attribute_deletes = attribute_changes(
+                    tenant, state.attributes, good_id, pending.row_idx,
+                )
+            except Exception as e:
+                stats["rows_failed"] += 1
+                logger.error(f"Ошибка при обработке строки {pending.row_number}: {str(e)}")
+                continue
+            seen_good_ids.add(good_id)
+
+            ids, missing = resolver.lookup_partial(pending.dims)
+            for table, name in missing:
+                new_dimensions[table].add(name)
+                # Новое значение справочника показываем в diff по имени
+                for id_field in DIMENSION_FIELDS[table]:
+                    if ids[id_field] is None:
+                        ids[id_field] = f"new:{name}"
+            currency_id = ids.pop("currency_id")
+            data.update(ids)
+
+            current = state.products.get(good_id)
+            kind, changed = classify_product(tenant, current, data)
+            products[kind] += 1
+            if kind == "create":
+                if len(samples["create"]) < sample_size:
+                    samples["create"].append({"good_id": good_id, "good_name": data.get("good_name")})
+            elif kind in ("full", "fast"):
+                field_changes.update(changed)
+                sample = samples["update" if kind == "full" else "fast_update"]
+                if len(sample) < sample_size:
+                    sample.append({
+                        "good_id": good_id,
+                        "changes": {f: {"old": current[f], "new": data[f]} for f in sorted(changed)},
+                    })
+
+            attributes["create"] += len(attribute_creates)
+            attributes["update"] += len(attribute_updates)
+            attributes["delete"] += len(attribute_deletes)
+
+            for analog_id in analog_ids:
+                if (good_id, analog_id) not in state.analogs:
+                    analogs_to_create.add((good_id, analog_id))
+
+            price_data = currency_price_data(pending.row_idx, data)
+            if currency_id and price_data:
+                current_price = state.currency_prices.get((good_id, currency_id))
+                if current_price is None:
+                    prices["create"] += 1
+                elif current_price != price_data:
+                    prices["update"] += 1
+
+    # Деактивация выполняется только после прогона без ошибок и не для обрезанной выгрузки
+    deactivation_skipped = bool(stats["rows_failed"]) or not seen_good_ids
+    deactivate = []
+    if not deactivation_skipped:
+        active = [row for row in state.products.values() if row["warehouse_quantity"] != 0]
+        deactivate = [row for row in active if row["good_id"] not in seen_good_ids]
+        if deactivation_too_large(len(deactivate), len(active), SYNC_MAX_DEACTIVATE_SHARE):
+            deactivation_skipped, deactivate = True, []
+    samples["deactivate"] = [
+        {"good_id": row["good_id"], "good_name": row["good_name"]} for row in deactivate[:sample_size]
+    ]
+    samples["dimensions"] = {table: sorted(names)[:sample_size] for table, names in new_dimensions.items()}
+
+    return {
+        "dry_run": True,
+        "tenant": tenant.name,
+        "file": tenant.csv_path,
+        "rows": {
+            "products": sum(products.values()),
+            "skipped_products": stats["skipped_products"],
+            "rows_without_goodid": stats["rows_without_goodid"],
+            "rows_failed": stats["rows_failed"],
+        },
+        "products": {
+            "create": products["create"],
+            "update": products["full"],
+            "fast_update": products["fast"],
+            "unchanged": products["unchanged"],
+            "deactivate": len(deactivate),
+        },
+        "deactivation_skipped": deactivation_skipped,
+        "dimensions_to_create": {table: len(names) for table, names in new_dimensions.items()},
+        "field_changes": dict(field_changes.most_common()),
+        "analogs_to_create": len(analogs_to_create),
+        "currency_prices": {"create": prices["create"], "update": prices["update"]},
+        "attributes": {"create": attributes["create"], "update": attributes["update"], "delete": attributes["delete"]},
+        "samples": samples,
+    }
@@ -0,0 +1,114 @@
+import logging
+import os
+import pickle
+
+from config.config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES
+from tasks.torgsoft_csv import intern_value
+
+logger = logging.getLogger(__name__)
+
+# Меняется при любом изменении разбора строк, чтобы старый кэш не использовался
+PARSER_VERSION = 2
+
+# Сколько разобранных строк сохраняется одним pickle-блоком
+CACHE_CHUNK_SIZE = 2000
+
+
+def cache_path(fingerprint: str) -> str:
+    # Кэш — это pickle, поэтому он лежит в закрытой папке приложения, а не рядом с
+    # выгрузкой: в папку выгрузки пишут FTP и /upload, и подложенный файл исполнил бы код
+    return os.path.join(EXPORT_CACHE_DIR, f"{fingerprint}-v{PARSER_VERSION}.pkl")
+
+
+def _unpack_chunk(rows: list) -> list:
+    # Схема и значения ExportRecord восстанавливаются общими (см. ExportRecord.restore),
+    # путь категории интернируется здесь
+    return [
+        (good_id, row_number, record, tuple(map(intern_value, category_names)))
+        for good_id, row_number, record, category_names in rows
+    ]
+
+
+def write_cache(path: str, rows: list, counters: dict):
+    """
+    Сохраняет разобранные строки выгрузки блоками pickle (protocol 5).
+
+    Файл пишется через временный и переименовывается, поэтому читатель
+    никогда не увидит недописанный кэш.
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for start in range(0, len(rows), CACHE_CHUNK_SIZE):
+            pickle.dump(("rows", rows[start:start + CACHE_CHUNK_SIZE]), f, protocol=5)
+        pickle.dump(("end", counters), f, protocol=5)
+    os.replace(tmp_path, path)
+    evict_cache(os.path.dirname(path), keep=path)
+
+
+def iter_cache(path: str):
+    """
+    Отдаёт блоки разобранных строк из кэша по одному.
+
+    Последним элементом отдаётся словарь счётчиков разбора. Если файл
+    оборван, последним элементом не будет словаря — читатель должен
+    считать такой кэш недействительным.
+    """
+    with open(path, "rb") as f:
+        while True:
+            try:
+                kind, payload = pickle.load(f)
+            except EOFError:
+                return
+            if kind == "end":
+                yield payload
+                return
+            yield _unpack_chunk(payload)
+
+
+def read_cache(path: str) -> tuple[list, dict] | None:
+    """
+    Читает кэш целиком.
+
+    Returns:
+        tuple | None: Разобранные строки и счётчики разбора, либо None, если
+            кэша нет или он повреждён (повреждённый файл удаляется).
+    """
+    if not os.path.exists(path):
+        return None
+    rows = []
+    try:
+        for item in iter_cache(path):
+            if isinstance(item, dict):
+                # Отмечаем использование для вытеснения по LRU
+                os.utime(path)
+                return rows, item
+            rows.extend(item)
+    except Exception as e:
+        logger.warning(f"Кэш выгрузки {path} повреждён: {str(e)}")
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return None
+
+
+def evict_cache(cache_dir: str, max_bytes: int = EXPORT_CACHE_MAX_BYTES, keep: str | None = None):
+    # Удаляет давно не использованные файлы, пока кэш не уложится в лимит
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
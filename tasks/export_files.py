@@ -0,0 +1,86 @@
+import gzip
+import io
+import os
+import zipfile
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:  # есть в requirements.txt; без него не читаются только выгрузки .zst
+    zstandard = None
+
+# Сжатие определяется по первым байтам файла, а не по расширению
+MAGIC_BYTES = {
+    "gzip": b"\x1f\x8b",
+    "zip": b"PK\x03\x04",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+# Сжатые выгрузки, которые ищутся рядом с csv_path: TSGoods.csv.gz, TSGoods.zip, TSGoods.csv.zst
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def detect_compression(head: bytes) -> str | None:
+    for name, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def export_candidates(csv_path: str) -> list[str]:
+    base, _ = os.path.splitext(csv_path)
+    return [csv_path, *(csv_path + suffix for suffix in COMPRESSED_SUFFIXES), base + ".zip"]
+
+
+def resolve_export_path(csv_path: str) -> str:
+    """
+    Возвращает самый свежий из файлов выгрузки: csv_path или его сжатые варианты.
+
+    Raises:
+        FileNotFoundError: Нет ни одного из файлов.
+    """
+    existing = []
+    for path in export_candidates(csv_path):
+        try:
+            existing.append((os.stat(path).st_mtime, path))
+        except OSError:
+            continue
+    if not existing:
+        raise FileNotFoundError(csv_path)
+    return max(existing)[1]
+
+
+def _zip_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    csv_members = [info for info in members if info.filename.lower().endswith(".csv")]
+    if not (csv_members or members):
+        raise ValueError("В архиве нет файла выгрузки")
+    return (csv_members or members)[0]
+
+
+def open_export_stream(export_file: BinaryIO) -> tuple[io.TextIOBase, str | None]:
+    """
+    Открывает файл выгрузки как текстовый поток для csv.
+
+    Сжатая выгрузка (gzip, zip, zstd) распаковывается по мере чтения:
+    распакованный файл целиком не создаётся ни на диске, ни в памяти, а
+    обычный CSV читается с диска блоками.
+
+    Returns:
+        tuple: Текстовый поток и вид сжатия (None для обычного CSV).
+    """
+    start = export_file.tell()
+    compression = detect_compression(export_file.read(4))
+    export_file.seek(start)
+    if compression == "gzip":
+        binary = gzip.GzipFile(fileobj=export_file)
+    elif compression == "zip":
+        archive = zipfile.ZipFile(export_file)
+        binary = archive.open(_zip_member(archive))
+    elif compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Для выгрузки .zst нужен пакет zstandard (pip install -r requirements.txt)")
+        binary = zstandard.ZstdDecompressor().stream_reader(export_file, read_across_frames=True)
+    else:
+        binary = export_file
+    return io.TextIOWrapper(binary, encoding="utf-8", newline=""), compression
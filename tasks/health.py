@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from config.config import HEALTH_CACHE_SECONDS, HEALTH_PING_TIMEOUT_SECONDS
+from tasks.export_files import export_candidates
+from tasks.sync_history import SYNCED_ROWS_KEYS
+from tasks.torgsoft_sync import SyncTenant
+
+logger = logging.getLogger(__name__)
+
+_checks: dict[str, tuple[float, dict]] = {}
+_locks: dict[str, asyncio.Lock] = {}
+
+
+def newest_file_mtime(paths: list[str]) -> float | None:
+    # Время изменения самого свежего из существующих файлов
+    newest = None
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        newest = max(newest or 0, mtime)
+    return newest
+
+
+async def _query_tenant(tenant: SyncTenant) -> dict:
+    # Один запрос и проверяет соединение, и даёт последнюю успешную синхронизацию
+    async with tenant.engine.connect() as conn:
+        result = await conn.execute(text(
+            "SELECT started_at, finished_at, result FROM sync_jobs "
+            "WHERE status = 'done' ORDER BY finished_at DESC LIMIT 1"
+        ))
+        return result.mappings().first()
+
+
+async def _check_tenant(tenant: SyncTenant) -> dict:
+    started = time.perf_counter()
+    try:
+        last = await asyncio.wait_for(_query_tenant(tenant), HEALTH_PING_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": f"нет ответа за {HEALTH_PING_TIMEOUT_SECONDS} с"}
+    except Exception as e:
+        logger.warning(f"[{tenant.name}] База недоступна: {str(e)}")
+        return {"ok": False, "error": str(e)}
+
+    check = {"ok": True, "ping_ms": round((time.perf_counter() - started) * 1000, 1)}
+    stats = (last["result"] or {}) if last else {}
+    check["last_sync_at"] = last["finished_at"] if last else None
+    check["rows_synced"] = sum(stats.get(key, 0) for key in SYNCED_ROWS_KEYS) if last else None
+
+    # Отставание: сколько самый свежий файл выгрузки магазина ждёт синхронизации.
+    # Смотрятся только его csv_path и сжатые варианты — загрузки другого магазина
+    # в общую папку не дают ложного отставания
+    newest = newest_file_mtime(export_candidates(tenant.csv_path))
+    check["newest_file_at"] = datetime.fromtimestamp(newest, timezone.utc) if newest else None
+    if newest is None:
+        check["lag_seconds"] = None
+    elif last and last["started_at"].timestamp() >= newest:
+        check["lag_seconds"] = 0
+    else:
+        check["lag_seconds"] = round(time.time() - newest)
+    return check
+
+
+async def tenant_health(tenant: SyncTenant) -> dict:
+    """
+    Состояние базы и свежесть каталога магазина.
+
+    Результат переиспользуется HEALTH_CACHE_SECONDS, а одновременные проверки
+    ждут одну и ту же, поэтому частые пробы балансировщика не занимают
+    соединения пула. Ping ограничен HEALTH_PING_TIMEOUT_SECONDS.
+    """
+    lock = _locks.setdefault(tenant.name, asyncio.Lock())
+    async with lock:
+        cached = _checks.get(tenant.name)
+        if cached is not None and time.monotonic() - cached[0] < HEALTH_CACHE_SECONDS:
+            return cached[1]
+        check = await _check_tenant(tenant)
+        check["checked_at"] = datetime.now(timezone.utc)
+        _checks[tenant.name] = (time.monotonic(), check)
+        return check
+
+
+async def readiness(tenants: dict) -> tuple[bool, dict]:
+    checks = await asyncio.gather(*(tenant_health(tenant) for tenant in tenants.values()))
+    result = dict(zip(tenants, checks))
+    return all(check["ok"] for check in checks), result
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import Counter
+
+from sqlalchemy import Integer, any_, bindparam, delete, insert
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.future import select
+
+from tasks.bulk_sql import update_columns_from_values
+from tasks.torgsoft_sync import SyncTenant
+
+logger = logging.getLogger(__name__)
+
+# 26925.jpg — главное изображение товара 26925, 26925_2.jpg — второе и т.д.
+IMAGE_NAME_RE = re.compile(r"^(\d+)(?:_(\d+))?\.(?:jpe?g|png|webp|gif)$", re.IGNORECASE)
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(root: str) -> str:
+    # Манифест лежит рядом с папкой, а не внутри неё: запись внутрь меняла бы mtime корня
+    root = os.path.normpath(root)
+    return os.path.join(os.path.dirname(root), f".{os.path.basename(root)}_manifest.json")
+
+
+def load_manifest(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"version": MANIFEST_VERSION, "dirs": {}, "skipped": []}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "dirs": {}, "skipped": []}
+    return manifest
+
+
+def save_manifest(path: str, manifest: dict):
+    # Пишем через временный файл, чтобы прерванная запись не портила кэш
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def scan_images(root: str, manifest: dict) -> tuple[list[str], bool]:
+    """
+    Обходит папку изображений, перечитывая только изменившиеся каталоги.
+
+    Добавление, удаление или переименование файла меняет mtime его каталога,
+    поэтому для неизменившегося каталога список файлов берётся из манифеста,
+    и повторный обход сводится к одному stat на каталог.
+
+    Returns:
+        tuple: Относительные пути всех изображений и признак того, что
+            хотя бы один каталог изменился.
+    """
+    cached_dirs = manifest["dirs"]
+    dirs = {}
+    changed = False
+    files = []
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+        mtime_ns = os.stat(abs_dir).st_mtime_ns
+        entry = cached_dirs.get(rel_dir)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            changed = True
+            entry = {"mtime_ns": mtime_ns, "files": [], "subdirs": []}
+            with os.scandir(abs_dir) as it:
+                for item in it:
+                    if item.name.startswith("."):
+                        continue
+                    if item.is_dir(follow_symlinks=False):
+                        entry["subdirs"].append(item.name)
+                    elif IMAGE_NAME_RE.match(item.name):
+                        entry["files"].append(item.name)
+        dirs[rel_dir] = entry
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        files.extend(prefix + name for name in entry["files"])
+        stack.extend(prefix + name for name in entry["subdirs"])
+
+    if dirs.keys() != cached_dirs.keys():
+        changed = True
+    manifest["dirs"] = dirs
+    return files, changed
+
+
+def plan_images(paths: list[str]) -> dict:
+    """
+    Раскладывает файлы по товарам.
+
+    Returns:
+        dict: image_url -> {"good_id", "is_main", "order"}. Главным становится
+            файл без суффикса, а если его нет — файл с наименьшим номером.
+    """
+    by_good = {}
+    for path in paths:
+        match = IMAGE_NAME_RE.match(path.rsplit("/", 1)[-1])
+        good_id = int(match.group(1))
+        order = int(match.group(2)) if match.group(2) else 0
+        by_good.setdefault(good_id, []).append((order, path))
+
+    planned = {}
+    for good_id, images in by_good.items():
+        images.sort()
+        for index, (order, path) in enumerate(images):
+            planned[path] = {"good_id": good_id, "is_main": index == 0, "order": order}
+    return planned
+
+
+async def sync_images(tenant: SyncTenant) -> dict:
+    """
+    Приводит product_images в соответствие с файлами в папке изображений магазина.
+
+    Текущие строки читаются одним запросом, новые вставляются и лишние
+    удаляются массово, is_main и order обновляются одним UPDATE. Файлы товаров,
+    которых ещё нет в базе, пропускаются, а их GoodID запоминаются в манифесте.
+    Если ни один каталог не изменился и ни один из пропущенных товаров не
+    появился, сравнение с базой не выполняется.
+
+    Returns:
+        dict: Количество созданных, обновлённых, удалённых и пропущенных изображений.
+    """
+    try:
+        return await _sync_images(tenant)
+    except Exception as e:
+        logger.error(f"[{tenant.name}] Ошибка при синхронизации изображений: {str(e)}")
+        return {"images_error": str(e)}
+
+
+async def _sync_images(tenant: SyncTenant) -> dict:
+    stats = Counter(images_created=0, images_updated=0, images_deleted=0, images_skipped=0)
+    root = tenant.images_dir
+    if not root or not os.path.isdir(root):
+        return dict(stats)
+
+    manifest_path = manifest_path_for(root)
+    manifest = load_manifest(manifest_path)
+    paths, changed = await asyncio.to_thread(scan_images, root, manifest)
+    Image = tenant.models.ProductImage
+    Product = tenant.models.Product
+    if not changed:
+        skipped = manifest["skipped"]
+        if not skipped:
+            return dict(stats)
+        async with tenant.session_maker() as session:
+            ids = bindparam("ids", skipped, type_=ARRAY(Integer))
+            result = await session.execute(select(Product.good_id).where(Product.good_id == any_(ids)).limit(1))
+            if result.first() is None:
+                stats["images_skipped"] = len(skipped)
+                return dict(stats)
+
+    planned = plan_images(paths)
+    async with tenant.session_maker() as session:
+        result = await session.execute(select(Image.image_id, Image.image_url, Image.is_main, Image.order))
+        current = {row.image_url: row for row in result.all()}
+        result = await session.execute(select(Product.good_id))
+        known_goods = set(result.scalars().all())
+
+        creates, updates = [], []
+        skipped = set()
+        for url, data in planned.items():
+            if data["good_id"] not in known_goods:
+                skipped.add(data["good_id"])
+                stats["images_skipped"] += 1
+                continue
+            row = current.get(url)
+            if row is None:
+                creates.append({"image_url": url, **data})
+            elif row.is_main != data["is_main"] or row.order != data["order"]:
+                updates.append({"image_id": row.image_id, "is_main": data["is_main"], "order": data["order"]})
+        # Ссылки на внешние URL добавлены вручную и не удаляются
+        deletes = [row.image_id for url, row in current.items() if url not in planned and "://" not in url]
+
+        if deletes:
+            ids = bindparam("ids", deletes, type_=ARRAY(Integer))
+            await session.execute(delete(Image).where(Image.image_id == any_(ids)))
+        if creates:
+            await session.execute(insert(Image), creates)
+        if updates:
+            await update_columns_from_values(session, Image, "image_id", ["is_main", "order"], updates)
+        await session.commit()
+
+    stats["images_created"] = len(creates)
+    stats["images_updated"] = len(updates)
+    stats["images_deleted"] = len(deletes)
+    manifest["skipped"] = sorted(skipped)
+    await asyncio.to_thread(save_manifest, manifest_path, manifest)
+    tenant.log("info", f"Изображения: {dict(stats)}")
+    return dict(stats)
@@ -0,0 +1,287 @@
+import json
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from tasks.torgsoft_sync import SyncTenant
+
+# Задача в статусе running без heartbeat дольше этого времени считается брошенной
+JOB_STALE_SECONDS = 300
+
+# Задержка перед повтором упавшей задачи растёт с номером попытки
+RETRY_DELAY_SECONDS = 60
+
+# Ключ advisory-lock, под которым задача забирается из очереди
+JOB_CLAIM_LOCK_KEY = 7_310_026_038
+
+
+def _job_dict(row) -> dict | None:
+    return dict(row) if row is not None else None
+
+
+async def enqueue_job(tenant: SyncTenant, profile: str | None = None) -> tuple[int, bool]:
+    """
+    Ставит синхронизацию магазина в очередь.
+
+    В очереди может быть только одна ожидающая задача (уникальный индекс
+    uq_sync_jobs_pending). Если она уже есть, новый запуск сливается с ней:
+    пока идёт синхронизация, все запросы на запуск дают ровно один следующий прогон.
+    Режим профилирования (cpu или memory) переносится и на слитую задачу.
+
+    Returns:
+        tuple: job_id и признак того, что запуск слился с уже ожидающей задачей.
+    """
+    async with tenant.session_maker() as session:
+        result = await session.execute(
+            text(
+                "INSERT INTO sync_jobs (profile) VALUES (:profile) "
+                "ON CONFLICT (status) WHERE status = 'pending' DO NOTHING RETURNING job_id"
+            ),
+            {"profile": profile},
+        )
+        job_id = result.scalar_one_or_none()
+        coalesced = job_id is None
+        if coalesced:
+            result = await session.execute(
+                text(
+                    "UPDATE sync_jobs SET profile = COALESCE(:profile, profile) "
+                    "WHERE status = 'pending' RETURNING job_id"
+                ),
+                {"profile": profile},
+            )
+            job_id = result.scalar_one_or_none()
+        await session.commit()
+    if job_id is None:
+        # Ожидающую задачу забрали между вставкой и выборкой — ставим заново
+        return await enqueue_job(tenant, profile)
+    return job_id, coalesced
+
+
+async def claim_job(tenant: SyncTenant, worker: str) -> dict | None:
+    """
+    Забирает следующую задачу магазина.
+
+    Задачи одного магазина выполняются по одной: пока у другой задачи свежий
+    heartbeat, новая не выдаётся. Забор идёт под advisory-lock и с
+    FOR UPDATE SKIP LOCKED, поэтому несколько воркеров не возьмут одну задачу.
+    Брошенная задача (воркер упал, heartbeat устарел) выдаётся повторно, пока
+    не исчерпаны попытки; после этого она завершается как failed, чтобы
+    задача, которая роняет воркер, не выдавалась бесконечно.
+
+    Returns:
+        dict | None: Задача или None, если выполнять нечего.
+    """
+    async with tenant.session_maker() as session:
+        await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": JOB_CLAIM_LOCK_KEY})
+        await session.execute(
+            text(
+                """
+                UPDATE sync_jobs
+                SET status = 'failed', finished_at = now(),
+                    error = 'Воркер не завершил задачу: попытки исчерпаны'
+                WHERE status = 'running' AND attempts >= max_attempts
+                  AND heartbeat_at < now() - make_interval(secs => :stale)
+                """
+            ),
+            {"stale": JOB_STALE_SECONDS},
+        )
+        result = await session.execute(
+            text(
+                """
+                UPDATE sync_jobs
+                SET status = 'running', attempts = attempts + 1, worker = :worker,
+                    started_at = now(), heartbeat_at = now(), error = NULL, progress = NULL
+                WHERE job_id = (
+                    SELECT job_id FROM sync_jobs
+                    WHERE (status = 'pending' AND run_after <= now())
+                       OR (status = 'running' AND attempts < max_attempts
+                           AND heartbeat_at < now() - make_interval(secs => :stale))
+                    ORDER BY job_id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM sync_jobs
+                    WHERE status = 'running' AND heartbeat_at >= now() - make_interval(secs => :stale)
+                )
+                RETURNING job_id, attempts, max_attempts, worker, throttle, profile
+                """
+            ),
+            {"worker": worker, "stale": JOB_STALE_SECONDS},
+        )
+        job = _job_dict(result.mappings().first())
+        await session.commit()
+    return job
+
+
+async def heartbeat(tenant: SyncTenant, job: dict) -> dict | None:
+    """
+    Продлевает задачу, пока она за этим воркером, и возвращает её текущий бюджет записи.
+
+    Returns:
+        dict | None: Настройки бюджета ({} — значения по умолчанию) или None,
+            если задача не найдена или уже не за этим воркером.
+    """
+    async with tenant.session_maker() as session:
+        result = await session.execute(
+            text(
+                "UPDATE sync_jobs SET heartbeat_at = now() "
+                "WHERE job_id = :job_id AND status = 'running' AND worker = :worker RETURNING throttle"
+            ),
+            {"job_id": job["job_id"], "worker": job["worker"]},
+        )
+        row = result.first()
+        await session.commit()
+    return None if row is None else (row.throttle or {})
+
+
+async def save_job_progress(tenant: SyncTenant, job_id: int, progress: list):
+    async with tenant.session_maker() as session:
+        await session.execute(
+            text("UPDATE sync_jobs SET progress = CAST(:progress AS json) WHERE job_id = :job_id"),
+            {"progress": json.dumps(progress, ensure_ascii=False), "job_id": job_id},
+        )
+        await session.commit()
+
+
+async def get_job_progress(tenant: SyncTenant, job_id: int) -> dict | None:
+    async with tenant.session_maker() as session:
+        result = await session.execute(
+            text("SELECT status, attempts, error, progress FROM sync_jobs WHERE job_id = :job_id"),
+            {"job_id": job_id},
+        )
+        return _job_dict(result.mappings().first())
+
+
+async def set_job_throttle(tenant: SyncTenant, job_id: int, settings: dict) -> dict | None:
+    """
+    Меняет бюджет записи задачи.
+
+    Переданные настройки дополняют уже заданные; None снимает настройку, и
+    действует значение по умолчанию. Выполняющаяся задача подхватит новый
+    бюджет со следующим heartbeat.
+
+    Returns:
+        dict | None: Итоговые настройки или None, если задачи нет.
+    """
+    async with tenant.session_maker() as session:
+        result = await session.execute(
+            text("SELECT throttle FROM sync_jobs WHERE job_id = :job_id FOR UPDATE"),
+            {"job_id": job_id},
+        )
+        row = result.first()
+        if row is None:
+            return None
+        throttle = {key: value for key, value in {**(row.throttle or {}), **settings}.items() if value is not None}
+        await session.execute(
+            text("UPDATE sync_jobs SET throttle = CAST(:throttle AS json) WHERE job_id = :job_id"),
+            {"throttle": json.dumps(throttle), "job_id": job_id},
+        )
+        await session.commit()
+    return throttle
+
+
+async def complete_job(tenant: SyncTenant, job: dict, result: dict) -> str | None:
+    """
+    Записывает итог задачи.
+
+    Если синхронизация вернула ошибку и попытки не исчерпаны, задача снова
+    становится pending с отложенным run_after. Если в очереди уже есть
+    ожидающая задача, повтор не нужен: задача завершается как failed, а
+    следующий прогон выполнит ожидающая.
+
+    Итог записывается, только если задача всё ещё выполняется этим воркером:
+    воркер, которого сочли упавшим, не перезапишет задачу, которую уже забрал
+    другой.
+
+    Returns:
+        str | None: Итоговый статус или None, если задача больше не за этим воркером.
+    """
+    error = result.get("error") if isinstance(result, dict) else None
+    if error is None:
+        status, delay = "done", 0
+    elif job["attempts"] < job["max_attempts"]:
+        status, delay = "pending", RETRY_DELAY_SECONDS * job["attempts"]
+    else:
+        status, delay = "failed", 0
+    try:
+        finished = await _finish_job(tenant, job, status, result, error, delay)
+    except IntegrityError:
+        status = "failed"
+        finished = await _finish_job(tenant, job, status, result, error, 0)
+    return status if finished else None
+
+
+async def _finish_job(tenant: SyncTenant, job: dict, status: str, result: dict, error: str | None, delay: float) -> bool:
+    async with tenant.session_maker() as session:
+        update = await session.execute(
+            text(
+                """
+                UPDATE sync_jobs
+                SET status = :status, result = CAST(:result AS json), error = :error,
+                    finished_at = CASE WHEN :finished THEN now() END,
+                    run_after = now() + make_interval(secs => :delay)
+                WHERE job_id = :job_id AND status = 'running' AND worker = :worker
+                """
+            ),
+            {
+                "status": status,
+                "result": json.dumps(result, ensure_ascii=False, default=str),
+                "error": error,
+                "finished": status != "pending",
+                "delay": delay,
+                "job_id": job["job_id"],
+                "worker": job["worker"],
+            },
+        )
+        await session.commit()
+    return update.rowcount == 1
+
+
+async def get_job(tenant: SyncTenant, job_id: int) -> dict | None:
+    async with tenant.session_maker() as session:
+        result = await session.execute(
+            text(
+                """
+                SELECT job_id, status, attempts, max_attempts, run_after, worker, heartbeat_at,
+                       result, error, throttle, profile, created_at, started_at, finished_at
+                FROM sync_jobs WHERE job_id = :job_id
+                """
+            ),
+            {"job_id": job_id},
+        )
+        return _job_dict(result.mappings().first())
+
+
+async def queue_status(tenant: SyncTenant) -> dict:
+    """Ожидающая и выполняющаяся задачи магазина и итог последней завершённой."""
+    async with tenant.session_maker() as session:
+        result = await session.execute(text(
+            """
+            (SELECT 'pending' AS kind, job_id, status, run_after, started_at, finished_at, error, result
+             FROM sync_jobs WHERE status = 'pending' LIMIT 1)
+            UNION ALL
+            (SELECT 'running', job_id, status, run_after, started_at, finished_at, error, result
+             FROM sync_jobs WHERE status = 'running' ORDER BY started_at DESC LIMIT 1)
+            UNION ALL
+            (SELECT 'last', job_id, status, run_after, started_at, finished_at, error, result
+             FROM sync_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT 1)
+            """
+        ))
+        rows = {row["kind"]: row for row in result.mappings().all()}
+    return {
+        "pending": {"job_id": rows["pending"]["job_id"], "run_after": rows["pending"]["run_after"]} if "pending" in rows else None,
+        "running": {"job_id": rows["running"]["job_id"], "started_at": rows["running"]["started_at"]} if "running" in rows else None,
+        "last": {
+            "job_id": rows["last"]["job_id"],
+            "status": rows["last"]["status"],
+            "finished_at": rows["last"]["finished_at"],
+            "error": rows["last"]["error"],
+        } if "last" in rows else None,
+    }
+
+
+async def last_enqueued_at(tenant: SyncTenant):
+    async with tenant.session_maker() as session:
+        result = await session.execute(text("SELECT max(created_at) FROM sync_jobs"))
+        return result.scalar_one_or_none()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import math
+import time
+from array import array
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from config.config import LOOKUP_REFRESH_SECONDS
+from tasks.torgsoft_sync import SyncTenant
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк товаров читается из курсора за раз при построении индекса
+BUILD_PARTITION_SIZE = 10000
+
+
+def articul_key(articul: str) -> str:
+    # Артикул сравнивается без учёта регистра, как в поиске товаров
+    return articul.strip().casefold()
+
+
+class LookupIndex:
+    """
+    Индекс товаров магазина в памяти: штрихкод -> товар, артикул -> товары.
+
+    Данные товаров лежат в параллельных массивах (array), словари хранят
+    только позицию в них: для артикула с одним товаром — int, с несколькими —
+    кортеж позиций. Индекс не меняется после построения, обновление — это
+    замена целого объекта.
+    """
+
+    __slots__ = (
+        "good_ids", "retail_prices", "discount_prices", "stock", "display",
+        "by_barcode", "by_articul", "run_id", "built_at", "build_seconds", "barcode_conflicts",
+    )
+
+    def __init__(self, run_id: int | None):
+        self.good_ids = array("i")
+        self.retail_prices = array("d")
+        self.discount_prices = array("d")
+        self.stock = array("d")
+        self.display = array("b")
+        self.by_barcode = {}
+        self.by_articul = {}
+        self.run_id = run_id
+        self.built_at = datetime.now(timezone.utc)
+        self.build_seconds = 0.0
+        self.barcode_conflicts = 0
+
+    def add(self, good_id: int, barcode, articul, retail_price, discount_price, stock, display):
+        position = len(self.good_ids)
+        self.good_ids.append(good_id)
+        self.retail_prices.append(math.nan if retail_price is None else retail_price)
+        self.discount_prices.append(math.nan if discount_price is None else discount_price)
+        self.stock.append(math.nan if stock is None else stock)
+        self.display.append(display or 0)
+        if barcode:
+            barcode = barcode.strip()
+            # Товары идут по good_id, при повторе штрихкода остаётся меньший
+            if barcode in self.by_barcode:
+                self.barcode_conflicts += 1
+            else:
+                self.by_barcode[barcode] = position
+        if articul and articul.strip():
+            key = articul_key(articul)
+            existing = self.by_articul.get(key)
+            if existing is None:
+                self.by_articul[key] = position
+            elif isinstance(existing, int):
+                self.by_articul[key] = (existing, position)
+            else:
+                self.by_articul[key] = (*existing, position)
+
+    def item(self, position: int) -> dict:
+        def value(number: float):
+            return None if math.isnan(number) else number
+
+        return {
+            "good_id": self.good_ids[position],
+            "retail_price": value(self.retail_prices[position]),
+            "retail_price_with_discount": value(self.discount_prices[position]),
+            "warehouse_quantity": value(self.stock[position]),
+            "display": self.display[position],
+        }
+
+    def by_barcode_item(self, barcode: str) -> dict | None:
+        position = self.by_barcode.get(barcode.strip())
+        return None if position is None else self.item(position)
+
+    def by_articul_items(self, articul: str) -> list[dict]:
+        positions = self.by_articul.get(articul_key(articul), ())
+        if isinstance(positions, int):
+            positions = (positions,)
+        return [self.item(position) for position in positions]
+
+    def status(self) -> dict:
+        return {
+            "products": len(self.good_ids),
+            "barcodes": len(self.by_barcode),
+            "articuls": len(self.by_articul),
+            "barcode_conflicts": self.barcode_conflicts,
+            "run_id": self.run_id,
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+        }
+
+
+async def last_successful_run(tenant: SyncTenant) -> int | None:
+    async with tenant.session_maker() as session:
+        result = await session.execute(text("SELECT max(run_id) FROM sync_runs WHERE error IS NULL"))
+        return result.scalar_one_or_none()
+
+
+async def build_lookup_index(tenant: SyncTenant, run_id: int | None = None) -> LookupIndex:
+    """Строит индекс одним потоковым запросом по всем товарам магазина."""
+    started = time.perf_counter()
+    index = LookupIndex(run_id)
+    async with tenant.session_maker() as session:
+        result = await session.stream(text(
+            """
+            SELECT good_id, barcode, articul, retail_price, retail_price_with_discount, warehouse_quantity, display
+            FROM products ORDER BY good_id
+            """
+        ))
+        async for rows in result.partitions(BUILD_PARTITION_SIZE):
+            for row in rows:
+                index.add(*row)
+    index.build_seconds = round(time.perf_counter() - started, 3)
+    return index
+
+
+class LookupIndexes:
+    """
+    Индексы поиска по штрихкоду и артикулу для всех магазинов.
+
+    Синхронизацию выполняет воркер в другом процессе, поэтому API раз в
+    LOOKUP_REFRESH_SECONDS сверяет номер последнего успешного прогона в
+    sync_runs с тем, по которому построен индекс. Новый индекс строится
+    рядом со старым и подменяется одним присваиванием — запросы всё время
+    читают либо старый, либо новый индекс целиком.
+    """
+
+    def __init__(self, tenants: dict):
+        self.tenants = tenants
+        self.indexes: dict[str, LookupIndex] = {}
+        self.errors: dict[str, str] = {}
+        self._task = None
+
+    def get(self, name: str) -> LookupIndex | None:
+        return self.indexes.get(name)
+
+    async def refresh(self, name: str, force: bool = False) -> bool:
+        tenant = self.tenants[name]
+        try:
+            run_id = await last_successful_run(tenant)
+            current = self.indexes.get(name)
+            if not force and current is not None and current.run_id == run_id:
+                return False
+            index = await build_lookup_index(tenant, run_id)
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.error(f"[{name}] Не удалось построить индекс поиска по штрихкоду: {str(e)}")
+            return False
+        self.indexes[name] = index
+        self.errors.pop(name, None)
+        logger.info(f"[{name}] Индекс поиска по штрихкоду: {len(index.good_ids)} товаров "
+                    f"за {index.build_seconds} с (прогон {run_id})")
+        return True
+
+    async def start(self):
+        # Первое построение — при старте, до приёма запросов
+        await asyncio.gather(*(self.refresh(name, force=True) for name in self.tenants))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(LOOKUP_REFRESH_SECONDS)
+            for name in self.tenants:
+                await self.refresh(name)
+
+    def status(self, name: str) -> dict:
+        index = self.indexes.get(name)
+        return {**(index.status() if index else {"products": None}), "error": self.errors.get(name)}
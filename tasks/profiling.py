@@ -0,0 +1,184 @@
+import asyncio
+import cProfile
+import contextvars
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable
+
+from config.config import PROFILE_DIR, PROFILE_MEMORY_FRAMES, PROFILE_TOP_N
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KINDS = ("cpu", "memory")
+
+# Файлы профиля задачи: cpu — pstats и текстовый отчёт, memory — только отчёт
+PROFILE_ARTIFACTS = {
+    "cpu": {"pstats": "pstats", "report": "txt"},
+    "memory": {"report": "txt"},
+}
+
+
+# Профили потоков (run_in_thread) прогона под cpu-профилировщиком; None — профилирования нет
+_thread_profiles: contextvars.ContextVar[list | None] = contextvars.ContextVar("thread_profiles", default=None)
+
+
+async def run_in_thread(func: Callable[..., Any], *args) -> Any:
+    """
+    asyncio.to_thread, который под cpu-профилированием профилирует и поток.
+
+    cProfile профилирует только поток, в котором включён, а разбор CSV и
+    другие тяжёлые этапы выполняются в потоках. Профиль потока добавляется
+    к профилю прогона в run_profiled.
+    """
+    profiles = _thread_profiles.get()
+    if profiles is None:
+        return await asyncio.to_thread(func, *args)
+
+    def profiled():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: профилировщик прогона уже видит все потоки
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profiler.disable()
+            profiles.append(profiler)
+
+    return await asyncio.to_thread(profiled)
+
+
+def profile_path(tenant_name: str, job_id: int, kind: str, artifact: str) -> str:
+    extension = PROFILE_ARTIFACTS[kind][artifact]
+    return os.path.join(PROFILE_DIR, f"{tenant_name}-job{job_id}-{kind}.{extension}")
+
+
+def _cpu_report(stats: pstats.Stats, top_n: int) -> str:
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top_n)
+    return buffer.getvalue()
+
+
+def _mib(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} МиБ"
+
+
+class MemoryStages:
+    """
+    Пики памяти по этапам синхронизации под tracemalloc.
+
+    На каждой смене этапа запоминается пик закончившегося этапа и пик
+    сбрасывается. Снимок аллокаций берётся на той границе этапов, где занято
+    больше всего памяти (обычно после разбора выгрузки и первого прохода),
+    а не после прогона, когда данные выгрузки уже освобождены.
+    """
+
+    def __init__(self):
+        self.peaks: dict[str, int] = {}
+        self.snapshot = None
+        self.snapshot_stage = None
+        self.snapshot_size = -1
+
+    def end(self, stage: str, next_stage: str | None = None):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peaks[stage] = max(self.peaks.get(stage, 0), peak)
+        tracemalloc.reset_peak()
+        if current > self.snapshot_size:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_stage, self.snapshot_size = stage, current
+
+
+def _memory_report(memory: MemoryStages, top_n: int, frames: int) -> str:
+    # Служебные аллокации самого tracemalloc в отчёт не попадают
+    snapshot = memory.snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    lines = [f"Пик: {_mib(max(memory.peaks.values(), default=0))}", "Пики по этапам:"]
+    lines.extend(f"    {stage}: {_mib(peak)}" for stage, peak in memory.peaks.items())
+    lines += [
+        "",
+        f"Снимок после этапа {memory.snapshot_stage} (занято {_mib(memory.snapshot_size)})",
+        f"Топ {top_n} мест аллокации (глубина стека {frames}):",
+        "",
+    ]
+    for index, stat in enumerate(snapshot.statistics("traceback")[:top_n], 1):
+        lines.append(f"#{index}: {stat.size / 1024:.1f} КиБ в {stat.count} блоках")
+        lines.extend(f"    {line}" for line in stat.traceback.format(most_recent_first=True))
+    return "\n".join(lines) + "\n"
+
+
+async def run_profiled(
+    kind: str,
+    tenant_name: str,
+    job_id: int,
+    run: Callable[[], Awaitable[dict]],
+    progress=None,
+    top_n: int = PROFILE_TOP_N,
+    frames: int = PROFILE_MEMORY_FRAMES,
+) -> tuple[dict, dict]:
+    """
+    Выполняет синхронизацию под профилировщиком и сохраняет результат в PROFILE_DIR.
+
+    cpu — cProfile на время прогона: файл pstats (открывается snakeviz или
+    pstats) и отчёт по top_n функциям. Кроме потока event loop в профиль
+    попадают этапы, вынесенные в потоки через run_in_thread (чтение и разбор
+    выгрузки). memory — tracemalloc с
+    глубиной стека frames: пики памяти по этапам (смена этапа берётся из
+    progress, SyncProgress) и top_n мест аллокации на границе этапов, где
+    занято больше всего памяти.
+
+    Returns:
+        tuple: Результат синхронизации и имена файлов профиля.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    started = time.perf_counter()
+    if kind == "cpu":
+        profiler = cProfile.Profile()
+        thread_profiles = []
+        token = _thread_profiles.set(thread_profiles)
+        profiler.enable()
+        try:
+            result = await run()
+        finally:
+            profiler.disable()
+            _thread_profiles.reset(token)
+        stats = pstats.Stats(profiler)
+        for thread_profile in thread_profiles:
+            stats.add(thread_profile)
+        stats.dump_stats(profile_path(tenant_name, job_id, kind, "pstats"))
+        report = _cpu_report(stats, top_n)
+    else:
+        memory = MemoryStages()
+        if progress is not None:
+            progress.on_stage = memory.end
+        tracemalloc.start(frames)
+        try:
+            result = await run()
+            memory.end(progress.stage if progress is not None else "run")
+        finally:
+            tracemalloc.stop()
+            if progress is not None:
+                progress.on_stage = None
+        report = _memory_report(memory, top_n, frames)
+
+    with open(profile_path(tenant_name, job_id, kind, "report"), "w", encoding="utf-8") as f:
+        f.write(report)
+    artifacts = {
+        "kind": kind,
+        "seconds": round(time.perf_counter() - started, 2),
+        "artifacts": {
+            artifact: os.path.basename(profile_path(tenant_name, job_id, kind, artifact))
+            for artifact in PROFILE_ARTIFACTS[kind]
+        },
+    }
+    logger.info(f"[{tenant_name}] Профиль задачи {job_id}: {artifacts}")
+    return result, artifacts
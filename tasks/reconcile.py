@@ -0,0 +1,315 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import Counter
+
+from sqlalchemy import Float, Integer, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from tasks.catalog_view import refresh_after_sync
+from tasks.torgsoft_csv import convert_float_columns
+from tasks.torgsoft_sync import (
+    STATS_KEYS, CatalogState, DimensionResolver, SyncTenant, collect_export_rows, load_export, sync_batch,
+    write_analogs,
+)
+
+logger = logging.getLogger(__name__)
+
+# Каждый уровень делит диапазон good_id на 2**FANOUT_BITS поддиапазонов
+FANOUT_BITS = 6
+
+# Диапазоны не шире 2**LEAF_BITS good_id сравниваются построчно
+LEAF_BITS = 6
+
+# Дробные поля сравниваются с точностью до 1/FLOAT_SCALE
+FLOAT_SCALE = 10000
+
+# Сколько good_id каждого вида попадает в отчёт
+REPORT_LIMIT = 1000
+
+NULL_MARK = "\\N"
+SEPARATOR = "\x1f"
+
+
+def row_hash(values: list[str]) -> int:
+    # Первые 8 байт md5 как знаковый bigint — так же, как ('x' || md5)::bit(64)::bigint в Postgres
+    digest = hashlib.md5(SEPARATOR.join(values).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def render_value(column, value) -> str:
+    if value is None:
+        return NULL_MARK
+    if isinstance(column.type, Float):
+        return str(round(float(value) * FLOAT_SCALE))
+    return str(value)
+
+
+def hash_sql(columns: list, quote) -> str:
+    # Выражение Postgres, которое даёт тот же хэш строки, что и row_hash
+    parts = ["p.good_id::text"]
+    for column in columns:
+        name = f"p.{quote(column.name)}"
+        if isinstance(column.type, Float):
+            rendered = f"round({name} * {FLOAT_SCALE})::bigint::text"
+        else:
+            rendered = f"{name}::text"
+        parts.append(f"coalesce({rendered}, '{NULL_MARK}')")
+    return f"('x' || substr(md5(concat_ws(chr(31), {', '.join(parts)})), 1, 16))::bit(64)::bigint"
+
+
+def expected_products(tenant: SyncTenant, resolver: DimensionResolver, rows: dict, stats: Counter) -> tuple[dict, list]:
+    """
+    Строит значения товаров так же, как синхронизация, без записи в базу.
+
+    Returns:
+        tuple: good_id -> данные товара и список сравниваемых столбцов.
+    """
+    Product = tenant.models.Product
+    pending_rows = list(rows.values())
+    floats = convert_float_columns([pending.row_idx for pending in pending_rows], tenant.float_columns)
+    products = {}
+    for row_index, pending in enumerate(pending_rows):
+        try:
+            data = tenant.build_product_data(pending.row_idx, pending.good_id)
+            floats.fill(data, row_index)
+        except Exception as e:
+            stats["rows_failed"] += 1
+            logger.error(f"Ошибка при обработке строки {pending.row_number}: {str(e)}")
+            continue
+        # Неизвестное значение справочника остаётся NULL и даст расхождение
+        ids, _ = resolver.lookup_partial(pending.dims)
+        ids.pop("currency_id")
+        data.update(ids)
+        products[pending.good_id] = data
+
+    # Сравниваются поля, которые синхронизация перезаписывает у существующих товаров
+    sample = next(iter(products.values()), {})
+    columns = [
+        column for column in Product.__table__.columns
+        if column.name in sample and column.name not in tenant.update_excluded_fields
+    ]
+    return products, columns
+
+
+def expected_hashes(tenant: SyncTenant, resolver: DimensionResolver, parsed_rows: list, stats: Counter) -> tuple:
+    """
+    Хэши строк выгрузки для сверки (CPU-часть сверки, выполняется в отдельном потоке).
+
+    Returns:
+        tuple: Товары выгрузки по GoodID (PendingRow), good_id -> хэш строки и
+            сравниваемые столбцы.
+    """
+    rows = collect_export_rows(tenant, parsed_rows, stats)
+    products, columns = expected_products(tenant, resolver, rows, stats)
+    hashes = {
+        good_id: row_hash([str(good_id), *(render_value(column, data[column.name]) for column in columns)])
+        for good_id, data in products.items()
+    }
+    return rows, hashes, columns
+
+
+class RangeChecksums:
+    """Суммы хэшей строк по диапазонам good_id на стороне выгрузки и базы."""
+
+    def __init__(self, session, table: str, columns: list, quote, hashes: dict):
+        self.session = session
+        self.hashes = hashes
+        self.ids = sorted(hashes)
+        self.queries = 0
+        self.hash_expr = hash_sql(columns, quote)
+        self.table = table
+
+    def export_buckets(self, shift: int, parents: set | None, parent_shift: int) -> dict:
+        buckets = {}
+        for good_id in self.ids:
+            if parents is not None and good_id >> parent_shift not in parents:
+                continue
+            count, total = buckets.get(good_id >> shift, (0, 0))
+            buckets[good_id >> shift] = (count + 1, total + self.hashes[good_id])
+        return buckets
+
+    def _where(self, parents: set | None) -> str:
+        where = "p.good_id = ANY(:ids)"
+        if parents is not None:
+            where += " AND (p.good_id >> :parent_shift) = ANY(:parents)"
+        return where
+
+    def _params(self, parents: set | None, parent_shift: int) -> tuple[list, dict]:
+        binds = [bindparam("ids", type_=ARRAY(Integer))]
+        params = {"ids": self.ids}
+        if parents is not None:
+            binds.append(bindparam("parents", type_=ARRAY(Integer)))
+            params.update(parents=sorted(parents), parent_shift=parent_shift)
+        return binds, params
+
+    async def db_buckets(self, shift: int, parents: set | None, parent_shift: int) -> dict:
+        binds, params = self._params(parents, parent_shift)
+        stmt = text(
+            f"""
+            SELECT p.good_id >> :shift AS bucket, count(*) AS rows, sum({self.hash_expr}) AS checksum
+            FROM {self.table} AS p
+            WHERE {self._where(parents)}
+            GROUP BY 1
+            """
+        ).bindparams(*binds)
+        self.queries += 1
+        result = await self.session.execute(stmt, {**params, "shift": shift})
+        return {row.bucket: (row.rows, int(row.checksum)) for row in result}
+
+    async def db_rows(self, parents: set, parent_shift: int) -> dict:
+        binds, params = self._params(parents, parent_shift)
+        stmt = text(
+            f"SELECT p.good_id, {self.hash_expr} AS row_hash FROM {self.table} AS p WHERE {self._where(parents)}"
+        ).bindparams(*binds)
+        self.queries += 1
+        result = await self.session.execute(stmt, params)
+        return {row.good_id: row.row_hash for row in result}
+
+    async def drifting(self) -> tuple[list, list, int]:
+        """
+        Находит товары выгрузки, которые в базе отсутствуют или отличаются.
+
+        Первый запрос считает суммы по 2**FANOUT_BITS диапазонам сразу для
+        всей выгрузки. Дальше запрашиваются только поддиапазоны несовпавших
+        диапазонов, пока они не станут не шире 2**LEAF_BITS good_id, — тогда
+        хэши сравниваются построчно. Суммы не зависят от порядка строк.
+
+        Returns:
+            tuple: Отсутствующие в базе good_id, изменённые good_id и число уровней.
+        """
+        if not self.ids:
+            return [], [], 0
+        shift = max(0, self.ids[-1].bit_length() - FANOUT_BITS)
+        parents, parent_shift = None, 0
+        levels = 0
+        while True:
+            levels += 1
+            if parents is not None and parent_shift <= LEAF_BITS:
+                db_hashes = await self.db_rows(parents, parent_shift)
+                missing, changed = [], []
+                for good_id in self.ids:
+                    if good_id >> parent_shift not in parents:
+                        continue
+                    if good_id not in db_hashes:
+                        missing.append(good_id)
+                    elif db_hashes[good_id] != self.hashes[good_id]:
+                        changed.append(good_id)
+                return missing, changed, levels
+            expected = self.export_buckets(shift, parents, parent_shift)
+            actual = await self.db_buckets(shift, parents, parent_shift)
+            mismatched = {bucket for bucket in expected if expected[bucket] != actual.get(bucket)}
+            if not mismatched:
+                return [], [], levels
+            parents, parent_shift = mismatched, shift
+            shift = max(0, shift - FANOUT_BITS)
+
+
+async def _stale_products(session, table: str, ids: list) -> list:
+    # Товары, которых нет в выгрузке, но у которых всё ещё есть остаток
+    stmt = text(
+        f"""
+        SELECT p.good_id FROM {table} AS p
+        WHERE p.warehouse_quantity IS DISTINCT FROM 0
+          AND NOT EXISTS (SELECT 1 FROM unnest(:ids) AS s(good_id) WHERE s.good_id = p.good_id)
+        ORDER BY p.good_id
+        """
+    ).bindparams(bindparam("ids", type_=ARRAY(Integer)))
+    result = await session.execute(stmt, {"ids": ids})
+    return list(result.scalars().all())
+
+
+async def _repair(tenant: SyncTenant, resolver: DimensionResolver, rows: dict, good_ids: list, stale: list) -> dict:
+    # Расходящиеся товары перезаписываются тем же путём, что и при синхронизации
+    stats = Counter({key: 0 for key in STATS_KEYS})
+    batch = {good_id: rows[good_id] for good_id in good_ids}
+    if batch:
+        state = CatalogState(tenant.models)
+        async with tenant.session_maker() as session:
+            await resolver.prepare(session, batch.values(), stats)
+            await session.commit()
+            await state.load(session)
+        await sync_batch(tenant, resolver, state, batch, stats)
+        await write_analogs(tenant, state, batch.values(), stats)
+    touched = set(state.touched) if batch else set()
+    if stale:
+        Product = tenant.models.Product
+        async with tenant.session_maker() as session:
+            result = await session.execute(
+                text(
+                    f"UPDATE {Product.__tablename__} SET warehouse_quantity = 0 WHERE good_id = ANY(:ids)"
+                ).bindparams(bindparam("ids", type_=ARRAY(Integer))),
+                {"ids": stale},
+            )
+            stats["products_deactivated"] = result.rowcount
+            await session.commit()
+        touched.update(stale)
+    stats["catalog_view_refreshed"] = await refresh_after_sync(tenant, touched)
+    return {key: value for key, value in stats.items() if value}
+
+
+async def reconcile(tenant: SyncTenant, repair: bool = False) -> dict:
+    """
+    Сверяет товары в базе с выгрузкой по контрольным суммам диапазонов good_id.
+
+    Хэш строки считается по полям, которые синхронизация перезаписывает, с
+    обеих сторон одинаково: в Postgres агрегатом по таблице, в Python по
+    разобранной выгрузке. Для здорового каталога сверка — это два запроса:
+    суммы по диапазонам и поиск товаров, остаток которых должен быть обнулён.
+
+    Args:
+        repair: Перезаписать расходящиеся товары и обнулить остаток пропавших из выгрузки.
+
+    Returns:
+        dict: Отсутствующие в базе (missing), отличающиеся (changed) и не
+            обнулённые пропавшие из выгрузки (stale) товары, число запросов и
+            уровней, а при repair — статистика исправления.
+    """
+    started = time.perf_counter()
+    stats = Counter()
+    resolver = DimensionResolver(tenant.models)
+    try:
+        parsed_rows, fingerprint = await load_export(tenant, stats)
+    except FileNotFoundError:
+        return {"error": f"Файл {tenant.csv_path} не найден"}
+
+    table = tenant.models.Product.__tablename__
+    async with tenant.session_maker() as session:
+        await session.execute(text("SET TRANSACTION READ ONLY"))
+        await resolver.load(session)
+        await session.rollback()
+
+    # Построение товаров и хэширование всей выгрузки — в отдельном потоке, чтобы не блокировать
+    # event loop API; соединение с базой на это время не занято
+    rows, hashes, columns = await asyncio.to_thread(expected_hashes, tenant, resolver, parsed_rows, stats)
+
+    async with tenant.session_maker() as session:
+        await session.execute(text("SET TRANSACTION READ ONLY"))
+        quote = session.get_bind().dialect.identifier_preparer.quote
+        checksums = RangeChecksums(session, table, columns, quote, hashes)
+        missing, changed, levels = await checksums.drifting()
+        # Строки, которые не разобрались, не считаются пропавшими из выгрузки
+        stale = await _stale_products(session, table, [*rows])
+        await session.rollback()
+
+    report = {
+        "fingerprint": fingerprint,
+        "products": len(hashes),
+        "columns": [column.name for column in columns],
+        "queries": checksums.queries + 1,
+        "levels": levels,
+        "missing_count": len(missing),
+        "changed_count": len(changed),
+        "stale_count": len(stale),
+        "missing": missing[:REPORT_LIMIT],
+        "changed": changed[:REPORT_LIMIT],
+        "stale": stale[:REPORT_LIMIT],
+        "rows_failed": stats["rows_failed"],
+    }
+    if repair and (missing or changed or stale):
+        report["repaired"] = await _repair(tenant, resolver, rows, [*missing, *changed], stale)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    tenant.log("info", f"Сверка с выгрузкой: {report['missing_count']} нет в базе, "
+                       f"{report['changed_count']} отличаются, {report['stale_count']} остались с остатком")
+    return report
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+
+from tasks.job_queue import enqueue_job, last_enqueued_at
+from tasks.time_ranges import LOCAL_TZ, in_time_range, parse_time_range
+
+logger = logging.getLogger(__name__)
+
+# Планировщик просыпается не реже этого интервала, секунд
+MAX_SLEEP_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class SyncSchedule:
+    """Периодическая синхронизация магазина."""
+    interval: timedelta | None = None
+    quiet_hours: tuple[time, time] | None = None
+    jitter_seconds: float = 0
+
+    @classmethod
+    def from_config(cls, interval_minutes: float, quiet_hours: str, jitter_seconds: float) -> "SyncSchedule":
+        return cls(
+            interval=timedelta(minutes=interval_minutes) if interval_minutes > 0 else None,
+            quiet_hours=parse_time_range(quiet_hours),
+            jitter_seconds=jitter_seconds,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval is not None
+
+    def quiet_until(self, moment: datetime) -> datetime | None:
+        # Конец тихих часов, если moment в них попадает
+        if self.quiet_hours is None or not in_time_range(moment, self.quiet_hours):
+            return None
+        end = self.quiet_hours[1]
+        local = moment.astimezone(LOCAL_TZ)
+        until = local.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+        if until <= local:
+            until += timedelta(days=1)
+        return until.astimezone(timezone.utc)
+
+    def next_run(self, after: datetime) -> datetime:
+        moment = after + self.interval + timedelta(seconds=random.uniform(0, self.jitter_seconds))
+        quiet_end = self.quiet_until(moment)
+        if quiet_end is not None:
+            moment = quiet_end + timedelta(seconds=random.uniform(0, self.jitter_seconds))
+        return moment
+
+
+class SyncScheduler:
+    """
+    Ставит синхронизации магазинов в очередь по расписанию.
+
+    Сам планировщик ничего не синхронизирует: задачи выполняет воркер, а
+    запуск по расписанию, как и ручной, сливается с уже ожидающей задачей.
+    """
+
+    def __init__(self, tenants: dict, schedules: dict):
+        self.tenants = tenants
+        self.schedules = {name: schedule for name, schedule in schedules.items() if schedule.enabled}
+        self.next_runs = {}
+        self.last_triggers = {}
+        self._task = None
+
+    def start(self):
+        if self.schedules:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _plan_first_runs(self):
+        now = datetime.now(timezone.utc)
+        for name, schedule in self.schedules.items():
+            try:
+                last = await last_enqueued_at(self.tenants[name])
+            except Exception as e:
+                logger.error(f"[{name}] Не удалось прочитать очередь синхронизаций: {str(e)}")
+                last = None
+            # Без истории первый запуск — через случайную задержку, а не через целый интервал
+            self.next_runs[name] = schedule.next_run(last) if last else schedule.next_run(now - schedule.interval)
+
+    async def _trigger(self, name: str):
+        try:
+            job_id, coalesced = await enqueue_job(self.tenants[name])
+            self.last_triggers[name] = {
+                "at": datetime.now(timezone.utc), "job_id": job_id, "coalesced": coalesced,
+            }
+            logger.info(f"[{name}] Синхронизация по расписанию: задача {job_id}" + (" (объединена)" if coalesced else ""))
+        except Exception as e:
+            self.last_triggers[name] = {"at": datetime.now(timezone.utc), "error": str(e)}
+            logger.error(f"[{name}] Не удалось поставить синхронизацию в очередь: {str(e)}")
+
+    async def _run(self):
+        await self._plan_first_runs()
+        while True:
+            now = datetime.now(timezone.utc)
+            for name, when in list(self.next_runs.items()):
+                if when <= now:
+                    await self._trigger(name)
+                    self.next_runs[name] = self.schedules[name].next_run(now)
+            wake = min(self.next_runs.values())
+            delay = (wake - datetime.now(timezone.utc)).total_seconds()
+            await asyncio.sleep(min(max(delay, 0), MAX_SLEEP_SECONDS))
+
+    def status(self, name: str) -> dict:
+        schedule = self.schedules.get(name)
+        if schedule is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "interval_minutes": schedule.interval.total_seconds() / 60,
+            "quiet_hours": [part.isoformat("minutes") for part in schedule.quiet_hours] if schedule.quiet_hours else None,
+            "jitter_seconds": schedule.jitter_seconds,
+            "next_run": self.next_runs.get(name),
+            "last_trigger": self.last_triggers.get(name),
+        }
@@ -0,0 +1,78 @@
+import re
+
+from sqlalchemy import text
+
+from tasks.torgsoft_sync import SyncTenant
+
+# Полный штрихкод: EAN-8, UPC-A, EAN-13, GTIN-14
+FULL_BARCODE_RE = re.compile(r"^(?:\d{8}|\d{12,14})$")
+
+SEARCH_MAX_LIMIT = 100
+
+RESULT_COLUMNS = "good_id, good_name, articul, barcode, retail_price, warehouse_quantity, display"
+
+# Есть ли pg_trgm в базе магазина (проверяется один раз)
+_trigram_available: dict[str, bool] = {}
+
+
+def like_pattern(query: str) -> str:
+    # Фрагмент для ILIKE: спецсимволы LIKE экранируются
+    return "%" + re.sub(r"([\\%_])", r"\\\1", query) + "%"
+
+
+async def _has_trigram(tenant: SyncTenant, session) -> bool:
+    if tenant.name not in _trigram_available:
+        result = await session.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"))
+        _trigram_available[tenant.name] = bool(result.scalar())
+    return _trigram_available[tenant.name]
+
+
+async def search_products(tenant: SyncTenant, query: str, limit: int = 20) -> dict:
+    """
+    Ищет товары по фрагменту названия, артикулу или штрихкоду.
+
+    Полный штрихкод сначала ищется точным совпадением по btree-индексу. Иначе
+    выполняется ILIKE по трём полям, который использует триграммные GIN-индексы
+    (миграция 10), так что время поиска почти не зависит от размера каталога.
+    Результаты упорядочены: точное совпадение артикула или штрихкода, затем
+    word_similarity с названием. Без pg_trgm ранжирование — по позиции
+    фрагмента в названии.
+
+    Returns:
+        dict: Найденные товары и способ поиска (barcode или fuzzy).
+    """
+    query = query.strip()
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    if not query:
+        return {"query": query, "match": None, "items": []}
+
+    async with tenant.session_maker() as session:
+        if FULL_BARCODE_RE.match(query):
+            result = await session.execute(
+                text(f"SELECT {RESULT_COLUMNS} FROM products WHERE barcode = :query ORDER BY good_id LIMIT :limit"),
+                {"query": query, "limit": limit},
+            )
+            items = [dict(row) for row in result.mappings().all()]
+            if items:
+                return {"query": query, "match": "barcode", "items": items}
+
+        if await _has_trigram(tenant, session):
+            rank = "word_similarity(:query, good_name)"
+        else:
+            rank = "1.0 / (1 + strpos(lower(good_name), lower(:query)))"
+        result = await session.execute(
+            text(
+                f"""
+                SELECT {RESULT_COLUMNS}, {rank} AS rank
+                FROM products
+                WHERE good_name ILIKE :pattern OR articul ILIKE :pattern OR barcode ILIKE :pattern
+                ORDER BY coalesce(lower(articul) = lower(:query) OR barcode = :query, false) DESC, rank DESC, good_id
+                LIMIT :limit
+                """
+            ),
+            {"query": query, "pattern": like_pattern(query), "limit": limit},
+        )
+        items = [dict(row) for row in result.mappings().all()]
+    for item in items:
+        item["rank"] = round(float(item["rank"] or 0), 4)
+    return {"query": query, "match": "fuzzy", "items": items}
@@ -0,0 +1,107 @@
+import logging
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, text
+
+from tasks.torgsoft_sync import SyncTenant
+
+logger = logging.getLogger(__name__)
+
+# Статистика синхронизации, которая считается обработанными строками товаров
+SYNCED_ROWS_KEYS = ("products_created", "products_updated", "products_fast_updated", "products_unchanged")
+
+
+class SyncRunTimer:
+    """Время начала прогона по часам и по монотонному таймеру."""
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+async def record_sync_run(tenant: SyncTenant, timer: SyncRunTimer, stats: dict):
+    """
+    Сохраняет прогон синхронизации в sync_runs.
+
+    Ошибка записи истории только логируется: на результат синхронизации она
+    не влияет.
+    """
+    duration = timer.elapsed()
+    error = stats.get("error")
+    rows = None if error else sum(stats.get(key, 0) for key in SYNCED_ROWS_KEYS)
+    record = {
+        "tenant": tenant.name,
+        "fingerprint": stats.get("fingerprint"),
+        "started_at": timer.started_at,
+        "finished_at": datetime.now(timezone.utc),
+        "duration_seconds": round(duration, 3),
+        "rows": rows,
+        "rows_per_second": round(rows / duration, 1) if rows and duration else None,
+        "stages": stats.get("stages"),
+        "stats": {key: value for key, value in stats.items() if key not in ("fingerprint", "stages", "error")},
+        "error": error,
+    }
+    try:
+        async with tenant.session_maker() as session:
+            await session.execute(insert(tenant.models.SyncRun), record)
+            await session.commit()
+    except Exception as e:
+        logger.error(f"[{tenant.name}] Не удалось сохранить историю синхронизации: {str(e)}")
+
+
+async def sync_history(tenant: SyncTenant, limit: int = 50, days: int = 30) -> dict:
+    """
+    Последние прогоны и сводка за days дней.
+
+    Returns:
+        dict: runs — последние limit прогонов, summary — число прогонов и
+            ошибок, p50/p95 длительности и скорости успешных прогонов,
+            trend — средние длительность, строки и строки/с по дням.
+    """
+    params = {"limit": limit, "days": days}
+    async with tenant.session_maker() as session:
+        result = await session.execute(text(
+            """
+            SELECT run_id, fingerprint, started_at, finished_at, duration_seconds, rows,
+                   rows_per_second, stages, stats, error
+            FROM sync_runs ORDER BY started_at DESC LIMIT :limit
+            """
+        ), params)
+        runs = [dict(row) for row in result.mappings().all()]
+
+        result = await session.execute(text(
+            """
+            SELECT count(*) AS runs,
+                   count(*) FILTER (WHERE error IS NOT NULL) AS failed,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_seconds) FILTER (WHERE error IS NULL) AS duration_p50,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_seconds) FILTER (WHERE error IS NULL) AS duration_p95,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY rows_per_second) FILTER (WHERE error IS NULL) AS rows_per_second_p50,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY rows_per_second) FILTER (WHERE error IS NULL) AS rows_per_second_p95
+            FROM sync_runs WHERE started_at >= now() - make_interval(days => :days)
+            """
+        ), {"days": days})
+        summary = dict(result.mappings().one())
+
+        result = await session.execute(text(
+            """
+            SELECT date_trunc('day', started_at)::date AS day, count(*) AS runs,
+                   avg(duration_seconds) AS duration_avg, avg(rows) AS rows_avg,
+                   avg(rows_per_second) AS rows_per_second_avg
+            FROM sync_runs
+            WHERE started_at >= now() - make_interval(days => :days) AND error IS NULL
+            GROUP BY 1 ORDER BY 1
+            """
+        ), {"days": days})
+        trend = [
+            {key: round(value, 2) if isinstance(value, float) else value for key, value in row.items()}
+            for row in result.mappings().all()
+        ]
+
+    for key, value in summary.items():
+        if isinstance(value, float):
+            summary[key] = round(value, 2)
+    return {"summary": {"days": days, **summary}, "trend": trend, "runs": runs}
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from config.config import SYNC_PROGRESS_BUFFER, SYNC_PROGRESS_SECONDS
+from tasks.job_queue import get_job_progress, queue_status, save_job_progress
+from tasks.torgsoft_sync import SyncTenant
+
+logger = logging.getLogger(__name__)
+
+# Скорость записи считается по стольким последним замерам
+RATE_WINDOW_SAMPLES = 10
+
+# Пустой комментарий SSE, чтобы прокси не закрывали молчащее соединение, секунд
+SSE_KEEPALIVE_SECONDS = 15
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+class SyncProgress:
+    """
+    Ход синхронизации для живого потока событий.
+
+    Синхронизация только сдвигает счётчики — раз на батч, а не на строку.
+    Замеры (sample) снимаются отдельной задачей через равные промежутки и
+    копятся в кольцевом буфере последних SYNC_PROGRESS_BUFFER замеров.
+    """
+
+    def __init__(self, size: int = SYNC_PROGRESS_BUFFER):
+        self.samples = deque(maxlen=size)
+        self.started = time.monotonic()
+        self.stage = "start"
+        self.stage_started = self.started
+        self.rows_total = None
+        self.rows_written = 0
+        self.rows_resumed = 0
+        self.rows_failed = 0
+        self.failed_batches = 0
+        self.seq = 0
+        # Вызывается при смене этапа как on_stage(закончившийся, следующий), например профилировщиком памяти
+        self.on_stage = None
+
+    def begin(self, stage: str):
+        if self.on_stage is not None:
+            self.on_stage(self.stage, stage)
+        self.stage = stage
+        self.stage_started = time.monotonic()
+
+    def set_total(self, rows_total: int, rows_failed: int = 0):
+        # Строки, которые не разобрались, считаются ошибками ещё до записи
+        self.rows_total = rows_total
+        self.rows_failed += rows_failed
+
+    def resume(self, rows: int):
+        self.rows_resumed += rows
+
+    def advance(self, rows: int, rows_failed: int = 0, ok: bool = True):
+        self.rows_written += rows
+        self.rows_failed += rows_failed
+        if not ok:
+            self.failed_batches += 1
+
+    def _rate(self, now: float, rows_written: int) -> float | None:
+        # Скорость по окну последних замеров (до первого замера — с начала прогона),
+        # без строк, пропущенных по чекпойнту
+        window = list(self.samples)[-RATE_WINDOW_SAMPLES:]
+        since, written = (window[0]["_monotonic"], window[0]["_written"]) if window else (self.started, 0)
+        elapsed = now - since
+        if elapsed <= 0:
+            return None
+        return round((rows_written - written) / elapsed, 1)
+
+    def sample(self, stage: str | None = None) -> dict:
+        now = time.monotonic()
+        rows_done = self.rows_written + self.rows_resumed
+        rate = self._rate(now, self.rows_written)
+        eta = None
+        if self.stage == "write" and self.rows_total is not None and rate:
+            eta = round(max(self.rows_total - rows_done, 0) / rate, 1)
+        self.seq += 1
+        sample = {
+            "seq": self.seq,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "stage": stage or self.stage,
+            "stage_seconds": round(now - self.stage_started, 1),
+            "elapsed_seconds": round(now - self.started, 1),
+            "rows_done": rows_done,
+            "rows_total": self.rows_total,
+            "rows_per_second": rate,
+            "eta_seconds": eta,
+            "rows_failed": self.rows_failed,
+            "failed_batches": self.failed_batches,
+            "_monotonic": now,
+            "_written": self.rows_written,
+        }
+        self.samples.append(sample)
+        return sample
+
+    def snapshot(self) -> list[dict]:
+        return [{key: value for key, value in sample.items() if not key.startswith("_")} for sample in self.samples]
+
+
+async def report_progress(tenant: SyncTenant, job_id: int, progress: SyncProgress):
+    """Снимает замер раз в SYNC_PROGRESS_SECONDS и сохраняет буфер в задачу."""
+    while True:
+        await asyncio.sleep(SYNC_PROGRESS_SECONDS)
+        progress.sample()
+        try:
+            await save_job_progress(tenant, job_id, progress.snapshot())
+        except Exception as e:
+            logger.warning(f"[{tenant.name}] Не удалось сохранить ход задачи {job_id}: {str(e)}")
+
+
+def _sse(event: str, data, event_id: str | None = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, ensure_ascii=False, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_event_id(value: str | None) -> tuple[int | None, int]:
+    # id события — "attempt:seq"; непонятный id означает, что досылать надо весь буфер
+    attempt, _, seq = (value or "").partition(":")
+    try:
+        return int(attempt), int(seq)
+    except ValueError:
+        return None, 0
+
+
+async def _current_job_id(tenant: SyncTenant) -> int | None:
+    # Выполняющаяся задача, иначе ожидающая, иначе последняя завершённая
+    status = await queue_status(tenant)
+    for kind in ("running", "pending", "last"):
+        if status[kind] is not None:
+            return status[kind]["job_id"]
+    return None
+
+
+async def iter_progress_events(tenant: SyncTenant, job_id: int | None = None, last_event_id: str | None = None):
+    """
+    Поток Server-Sent Events с ходом задачи синхронизации.
+
+    Ход читается из sync_jobs.progress раз в SYNC_PROGRESS_SECONDS, клиенту
+    уходят замеры с seq больше уже отправленного. id события — "attempt:seq":
+    при переподключении с Last-Event-ID пропущенные замеры той же попытки
+    досылаются из буфера, а если с тех пор началась другая попытка (seq в ней
+    идут заново), буфер отправляется целиком. Поток заканчивается событием
+    done, когда задача завершена.
+    """
+    if job_id is None:
+        job_id = await _current_job_id(tenant)
+        if job_id is None:
+            yield _sse("idle", {"message": "Задач синхронизации нет"})
+            return
+    attempts, last_seq = parse_event_id(last_event_id)
+    status = None
+    silent_since = time.monotonic()
+    while True:
+        job = await get_job_progress(tenant, job_id)
+        if job is None:
+            yield _sse("error", {"error": f"Задача {job_id} не найдена"})
+            return
+        if job["attempts"] != attempts:
+            # Другая попытка начинает замеры заново
+            last_seq = 0
+        if (job["status"], job["attempts"]) != (status, attempts):
+            status, attempts = job["status"], job["attempts"]
+            yield _sse("status", {"job_id": job_id, "status": status, "attempts": job["attempts"]})
+            silent_since = time.monotonic()
+        for sample in job["progress"] or ():
+            if sample["seq"] > last_seq:
+                last_seq = sample["seq"]
+                yield _sse("progress", sample, f"{attempts}:{sample['seq']}")
+                silent_since = time.monotonic()
+        if status in FINISHED_STATUSES:
+            yield _sse("done", {"job_id": job_id, "status": status, "error": job["error"]})
+            return
+        if time.monotonic() - silent_since >= SSE_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            silent_since = time.monotonic()
+        await asyncio.sleep(SYNC_PROGRESS_SECONDS)
@@ -0,0 +1,27 @@
+from config.config import (
+    MARELLA_SYNC_INTERVAL_MINUTES, MARELLA_SYNC_JITTER_SECONDS, MARELLA_SYNC_QUIET_HOURS,
+    NURSACE_SYNC_INTERVAL_MINUTES, NURSACE_SYNC_JITTER_SECONDS, NURSACE_SYNC_QUIET_HOURS,
+)
+from tasks.scheduler import SyncSchedule
+from tasks.sync_nursace import NURSACE, sync_torgsoft_csv_nursace
+from tasks.sync_marella import MARELLA, sync_torgsoft_csv_marella
+
+# Все магазины, которые синхронизируются из Торгсофт
+TENANTS = {tenant.name: tenant for tenant in (NURSACE, MARELLA)}
+
+# Полная синхронизация магазина, которую выполняет воркер
+SYNC_FUNCTIONS = {
+    NURSACE.name: sync_torgsoft_csv_nursace,
+    MARELLA.name: sync_torgsoft_csv_marella,
+}
+
+
+# Периодический запуск синхронизации (см. tasks.scheduler)
+SCHEDULES = {
+    NURSACE.name: SyncSchedule.from_config(
+        NURSACE_SYNC_INTERVAL_MINUTES, NURSACE_SYNC_QUIET_HOURS, NURSACE_SYNC_JITTER_SECONDS,
+    ),
+    MARELLA.name: SyncSchedule.from_config(
+        MARELLA_SYNC_INTERVAL_MINUTES, MARELLA_SYNC_QUIET_HOURS, MARELLA_SYNC_JITTER_SECONDS,
+    ),
+}
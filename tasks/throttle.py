@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from config.config import (
+    SYNC_MAX_COMMIT_LATENCY_MS, SYNC_ROWS_PER_SECOND, SYNC_STATEMENTS_PER_SECOND, SYNC_THROTTLE_HOURS,
+)
+from tasks.time_ranges import in_time_range, parse_time_range
+
+logger = logging.getLogger(__name__)
+
+# Настройки бюджета записи, которые можно менять у задачи на лету
+THROTTLE_SETTINGS = ("rows_per_second", "statements_per_second", "active_hours", "max_commit_latency_ms")
+
+# Границы автоматического снижения скорости при медленных коммитах
+MIN_RATE_FACTOR = 0.1
+BACKOFF_FACTOR = 0.5
+RECOVERY_FACTOR = 1.25
+
+
+def default_throttle_settings() -> dict:
+    return {
+        "rows_per_second": SYNC_ROWS_PER_SECOND,
+        "statements_per_second": SYNC_STATEMENTS_PER_SECOND,
+        "active_hours": SYNC_THROTTLE_HOURS,
+        "max_commit_latency_ms": SYNC_MAX_COMMIT_LATENCY_MS,
+    }
+
+
+class TokenBucket:
+    """
+    Токен-бакет на rate единиц в секунду с запасом на одну секунду.
+
+    Неположительный rate означает «без ограничения»: take не ждёт.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount: float, rate: float):
+        if rate <= 0:
+            return
+        self._refill()
+        self.rate = rate
+        # Запрос больше ёмкости ждёт полного бакета и уводит его в минус,
+        # поэтому средняя скорость всё равно не превышает rate
+        need = min(amount, rate)
+        while self.tokens < need:
+            await asyncio.sleep((need - self.tokens) / rate)
+            self._refill()
+        self.tokens -= amount
+
+
+class WriteThrottle:
+    """
+    Бюджет записи синхронизации: строки и запросы в секунду.
+
+    Ограничение действует только в active_hours (по местному времени), если
+    они заданы. После коммита дольше max_commit_latency_ms скорость
+    снижается вдвое, после быстрых коммитов постепенно возвращается к
+    настроенной. Если бюджет не задан, снижение скорости — это пауза между
+    батчами, так что доля времени на запись равна rate_factor. Все шарды
+    прогона используют один экземпляр.
+    """
+
+    def __init__(self, settings: dict | None = None):
+        self.settings = {}
+        self.rate_factor = 1.0
+        self.rows = None
+        self.statements = None
+        self.last_commit_seconds = 0.0
+        self.configure(settings)
+
+    def configure(self, settings: dict | None):
+        merged = {**default_throttle_settings(), **{k: v for k, v in (settings or {}).items() if k in THROTTLE_SETTINGS}}
+        if merged == self.settings:
+            return
+        self.settings = merged
+        self.active_hours = parse_time_range(merged["active_hours"] or "")
+        # 0, None и отрицательные значения (например, из переменных окружения) — без ограничения
+        self.rows = TokenBucket(merged["rows_per_second"]) if (merged["rows_per_second"] or 0) > 0 else None
+        self.statements = (
+            TokenBucket(merged["statements_per_second"]) if (merged["statements_per_second"] or 0) > 0 else None
+        )
+        self.rate_factor = 1.0
+        logger.info(f"Бюджет записи: {merged}")
+
+    def active(self) -> bool:
+        return self.active_hours is None or in_time_range(datetime.now(timezone.utc), self.active_hours)
+
+    async def acquire(self, rows: int, statements: int):
+        if not self.active():
+            return
+        if self.rows is not None and rows:
+            await self.rows.take(rows, self.settings["rows_per_second"] * self.rate_factor)
+        if self.statements is not None and statements:
+            await self.statements.take(statements, self.settings["statements_per_second"] * self.rate_factor)
+        if self.rows is None and self.statements is None and self.rate_factor < 1.0:
+            await asyncio.sleep(self.last_commit_seconds * (1 / self.rate_factor - 1))
+
+    def observe_commit(self, seconds: float):
+        threshold = self.settings["max_commit_latency_ms"]
+        self.last_commit_seconds = seconds
+        if not threshold or threshold <= 0:
+            return
+        if seconds * 1000 > threshold:
+            factor = max(MIN_RATE_FACTOR, self.rate_factor * BACKOFF_FACTOR)
+            if factor != self.rate_factor:
+                logger.warning(f"Коммит {seconds * 1000:.0f} мс, бюджет записи снижен до {factor:.0%}")
+            self.rate_factor = factor
+        elif self.rate_factor < 1.0:
+            self.rate_factor = min(1.0, self.rate_factor * RECOVERY_FACTOR)
+
+    def status(self) -> dict:
+        return {**self.settings, "rate_factor": round(self.rate_factor, 3), "active": self.active()}
@@ -0,0 +1,23 @@
+from datetime import datetime, time, timedelta, timezone
+
+from config.config import SCHEDULE_UTC_OFFSET_HOURS
+
+# Часы расписаний и бюджетов записи задаются по местному времени
+LOCAL_TZ = timezone(timedelta(hours=SCHEDULE_UTC_OFFSET_HOURS))
+
+
+def parse_time_range(value: str) -> tuple[time, time] | None:
+    # "01:00-06:00" -> (01:00, 06:00); интервал может переходить через полночь ("22:00-07:00")
+    if not value or not value.strip():
+        return None
+    start, end = (time.fromisoformat(part.strip()) for part in value.split("-"))
+    return start, end
+
+
+def in_time_range(moment: datetime, time_range: tuple[time, time]) -> bool:
+    # Попадает ли moment в интервал по местному времени
+    start, end = time_range
+    clock = moment.astimezone(LOCAL_TZ).time()
+    if start <= end:
+        return start <= clock < end
+    return clock >= start or clock < end
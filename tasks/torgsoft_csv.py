@@ -0,0 +1,320 @@
+import logging
+import sys
+from array import array
+from functools import lru_cache
+from config.config import IS_DEV
+
+logger = logging.getLogger(__name__)
+
+# Функция для условного логирования
+def dev_log(level, message):
+    """Логирует сообщение только в dev режиме"""
+    if IS_DEV:
+        if level == "info":
+            logger.info(message)
+        elif level == "debug":
+            logger.debug(message)
+        elif level == "warning":
+            logger.warning(message)
+        elif level == "error":
+            logger.error(message)
+
+# Утилиты для нормализации заголовков CSV
+
+def normalize_header_key(key: str) -> str:
+    if key is None:
+        return key
+    return key.strip().lstrip("\ufeff")
+
+@lru_cache(maxsize=1024)
+def normalize_field_name(name: str) -> str:
+    if name is None:
+        return name
+    name = normalize_header_key(name)
+    # Нижний регистр и удаление не буквенно-цифровых символов
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+def make_row_index(row: dict) -> dict:
+    # Создаёт индекс по нормализованным именам столбцов
+    indexed = {}
+    for k, v in row.items():
+        indexed[normalize_field_name(k)] = v
+    return indexed
+
+class RowSchema:
+    """
+    Нормализованные имена столбцов и их позиции, общие для всех строк выгрузки.
+
+    interned — по флагу на столбец: значения справочных столбцов (INTERNED_FIELDS)
+    интернируются, остальные хранятся как прочитаны.
+    """
+    __slots__ = ("names", "positions", "interned")
+
+    def __init__(self, header: tuple):
+        self.names = tuple(normalize_field_name(name) for name in header)
+        self.positions = {name: index for index, name in enumerate(self.names)}
+        self.interned = tuple(name in INTERNED_FIELDS for name in self.names)
+
+    def intern_values(self, values) -> tuple:
+        return tuple(
+            intern_value(value) if interned else value
+            for value, interned in zip(values, self.interned)
+        )
+
+    def __reduce__(self):
+        return row_schema, (self.names,)
+
+@lru_cache(maxsize=64)
+def row_schema(header: tuple) -> RowSchema:
+    # Одна схема на заголовок: строки выгрузки и блоки кэша делят один объект
+    return RowSchema(header)
+
+def intern_value(value):
+    # Повторяющиеся значения (категории, бренды, цвета) хранятся одной строкой;
+    # интернированные строки освобождаются вместе с последней ссылкой
+    return sys.intern(value) if type(value) is str else value
+
+class ExportRecord:
+    """
+    Строка выгрузки: значения кортежем, имена столбцов — в общей схеме.
+
+    Поддерживает чтение как индексированный словарь (см. make_row_index):
+    get, [], in, keys, values, items, поэтому row_get и разбор колонок
+    работают с ней без изменений. Занимает в несколько раз меньше памяти,
+    чем словарь на строку.
+    """
+    __slots__ = ("schema", "values_")
+
+    def __init__(self, schema: RowSchema, values: tuple):
+        self.schema = schema
+        self.values_ = values
+
+    @classmethod
+    def from_csv(cls, header: tuple, values: list) -> "ExportRecord":
+        # Как DictReader: недостающие значения — None, лишние — списком под ключом None
+        if len(values) > len(header):
+            header, values = header + (None,), [*values[:len(header)], values[len(header):]]
+        elif len(values) < len(header):
+            values = [*values, *([None] * (len(header) - len(values)))]
+        schema = row_schema(header)
+        return cls(schema, schema.intern_values(values))
+
+    def get(self, name, default=None):
+        index = self.schema.positions.get(name)
+        return default if index is None else self.values_[index]
+
+    def __getitem__(self, name):
+        return self.values_[self.schema.positions[name]]
+
+    def __contains__(self, name) -> bool:
+        return name in self.schema.positions
+
+    def __iter__(self):
+        return iter(self.schema.names)
+
+    def __len__(self) -> int:
+        return len(self.values_)
+
+    def keys(self):
+        return self.schema.names
+
+    def values(self):
+        return self.values_
+
+    def items(self):
+        return zip(self.schema.names, self.values_)
+
+    @classmethod
+    def restore(cls, schema: RowSchema, values: tuple) -> "ExportRecord":
+        # После pickle равные строки разных блоков — разные объекты, интернируем заново
+        return cls(schema, schema.intern_values(values))
+
+    def __reduce__(self):
+        return ExportRecord.restore, (self.schema, self.values_)
+
+def records_memory(records: list, sample_size: int = 2000) -> int:
+    """
+    Оценка памяти разобранной выгрузки в байтах на 100 000 строк.
+
+    Считается по первым sample_size строкам: запись, кортеж значений,
+    путь категории и строки; общие объекты (схема, интернированные строки)
+    учитываются один раз.
+    """
+    sample = records[:sample_size]
+    if not sample:
+        return 0
+    seen = set()
+    total = 0
+
+    def add(obj):
+        nonlocal total
+        if id(obj) not in seen:
+            seen.add(id(obj))
+            total += sys.getsizeof(obj)
+
+    for good_id, row_number, record, category_names in sample:
+        for obj in (good_id, row_number, record, record.values_, category_names, *record.values_, *category_names):
+            add(obj)
+    return total * 100_000 // len(sample)
+
+def row_get(indexed_row: dict, *names: str):
+    # Ищет значение по нескольким вариантам имён столбцов
+    for name in names:
+        val = indexed_row.get(normalize_field_name(name))
+        if val is not None:
+            return val
+    return None
+
+def parse_int(value: str) -> int | None:
+    if not value or not str(value).strip():
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        dev_log("warning", f"Не удалось преобразовать в int: {value}")
+        return None
+
+def parse_float(value: str) -> float | None:
+    if not value or not str(value).strip():
+        return None
+    try:
+        return float(str(value).replace(",", ".").strip())
+    except ValueError:
+        dev_log("warning", f"Не удалось преобразовать в float: {value}")
+        return None
+
+def split_path(value) -> list[str]:
+    # Разбивает иерархию вида "Аксессуары, Бумажники" на список имён
+    if not value:
+        return []
+    return [name.strip() for name in str(value).split(",") if name.strip()]
+
+# Числовые поля товара, которые разбираются колонками (поле модели -> варианты имён столбцов)
+FLOAT_COLUMNS = {
+    "retail_price": ("RetailPrice", "Retail Price"),
+    "wholesale_price": ("WholesalePrice", "Wholesale Price"),
+    "retail_price_with_discount": ("RetailPriceWithDiscount",),
+    "prime_cost": ("PrimeCost", "Себестоимость"),
+    "equal_sale_price": ("EqualSalePrice",),
+    "equal_wholesale_price": ("EqualWholesalePrice",),
+    "price_discount_percent": ("PriceDiscountPercent",),
+    "wholesale_count": ("WholesaleCount",),
+    "warehouse_quantity": ("WarehouseQuantity",),
+    "measure": ("Measure",),
+    "height": ("Height",),
+    "width": ("Width",),
+    "retail_price_per_unit": ("RetailPricePerUnit",),
+    "wholesale_price_per_unit": ("WholesalePricePerUnit",),
+}
+
+# Столбцы выгрузки без отдельного поля в модели, которые пишутся в product_attributes
+# (имя атрибута -> варианты имён столбцов)
+ATTRIBUTE_COLUMNS = {
+    "Color": ("Color",),
+    "PCName": ("PCName",),
+    "GoodTypeName": ("GoodTypeName",),
+    "SynchronizationSectionFull": ("SynchronizationSectionFull",),
+    "MinWarehouseQuantity": ("MinWarehouseQuantity",),
+    "WarehouseQuantityForPartner": ("WarehouseQuantityForPartner",),
+    "GuaranteeMesUnit": ("GuaranteeMesUnit",),
+}
+
+# Столбцы справочников (см. extract_dimensions) с немногими различными значениями
+DIMENSION_COLUMNS = (
+    "GoodTypeFull", "GoodType", "Good Type Full", "Good_Type_Full",
+    "Country", "Страна",
+    "ProducerCollectionFull", "ProducerCollection", "Producer Collection Full",
+    "Season", "Сезон",
+    "Sex", "Пол",
+    "Material", "Материал",
+    "MeasureUnit", "Measure Unit", "ЕдИзм",
+    "EqualCurrencyName", "Currency", "Валюта",
+)
+
+# Интернируются только значения справочных столбцов и атрибутов: в названиях,
+# штрихкодах, артикулах и ценах почти все значения разные, и интернирование
+# там только тратит время и место в таблице интернированных строк
+INTERNED_FIELDS = frozenset(
+    normalize_field_name(name)
+    for name in (*DIMENSION_COLUMNS, *(alias for aliases in ATTRIBUTE_COLUMNS.values() for alias in aliases))
+)
+
+NAN = float("nan")
+
+
+class FloatColumns:
+    """
+    Числовые колонки батча в виде array('d').
+
+    Пустые и некорректные значения хранятся как NaN, некорректные дополнительно
+    отмечаются в битовой карте invalid (бит column_index * size + row_index).
+    """
+
+    __slots__ = ("names", "arrays", "invalid", "size")
+
+    def __init__(self, names: list, arrays: list, invalid: bytearray, size: int):
+        self.names = names
+        self.arrays = arrays
+        self.invalid = invalid
+        self.size = size
+
+    def is_invalid(self, column_index: int, row_index: int) -> bool:
+        bit = column_index * self.size + row_index
+        return bool(self.invalid[bit >> 3] & (1 << (bit & 7)))
+
+    def fill(self, data: dict, row_index: int):
+        # Переносит значения строки в словарь полей товара (NaN -> None)
+        for name, values in zip(self.names, self.arrays):
+            value = values[row_index]
+            data[name] = None if value != value else value
+
+
+def _convert_column(values: list, column_index: int, invalid: bytearray) -> array:
+    size = len(values)
+    cleaned = [value.replace(",", ".") if value else "nan" for value in values]
+    try:
+        # Быстрый путь: вся колонка разбирается одним проходом
+        return array("d", map(float, cleaned))
+    except ValueError:
+        pass
+    converted = array("d", bytes(8 * size))
+    for row_index, value in enumerate(cleaned):
+        try:
+            converted[row_index] = float(value)
+        except ValueError:
+            converted[row_index] = NAN
+            # Строка из одних пробелов считается пустой, а не ошибкой
+            if value.strip():
+                bit = column_index * size + row_index
+                invalid[bit >> 3] |= 1 << (bit & 7)
+    return converted
+
+
+def convert_float_columns(rows: list, columns: dict) -> FloatColumns:
+    """
+    Разбирает числовые колонки батча строк за один проход на колонку.
+
+    Args:
+        rows: Индексированные строки (см. make_row_index).
+        columns: Поле товара -> варианты имён столбцов.
+    """
+    size = len(rows)
+    names = list(columns)
+    invalid = bytearray((size * len(names) + 7) // 8)
+    arrays = []
+    for column_index, name in enumerate(names):
+        keys = [normalize_field_name(alias) for alias in columns[name]]
+        if len(keys) == 1:
+            key = keys[0]
+            values = [row.get(key) for row in rows]
+        else:
+            values = [next((row[k] for k in keys if row.get(k) is not None), None) for row in rows]
+        arrays.append(_convert_column(values, column_index, invalid))
+
+    result = FloatColumns(names, arrays, invalid, size)
+    if any(invalid):
+        for column_index, name in enumerate(names):
+            bad = sum(result.is_invalid(column_index, i) for i in range(size))
+            if bad:
+                dev_log("warning", f"Не удалось преобразовать в float: {bad} значений в колонке {name}")
+    return result
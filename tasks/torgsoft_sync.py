@@ -0,0 +1,1046 @@
+import asyncio
+import csv
+import hashlib
+import itertools
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Awaitable, BinaryIO, Callable
+
+from sqlalchemy import Integer, any_, bindparam, delete, insert, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from tasks.export_cache import cache_path, read_cache, write_cache
+from tasks.export_files import open_export_stream, resolve_export_path
+from tasks.profiling import run_in_thread
+from tasks.checkpoints import (
+    PARSE_STATS_KEYS, clear_checkpoints, load_checkpoint, save_checkpoint, shard_checkpoint_key,
+)
+from config.config import SYNC_MAX_DEACTIVATE_SHARE
+from tasks.bulk_sql import (
+    count_missing_products, deactivate_missing_products, deactivation_too_large, insert_analogs,
+    update_columns_from_values,
+)
+from tasks.torgsoft_csv import (
+    ATTRIBUTE_COLUMNS, FLOAT_COLUMNS, ExportRecord, convert_float_columns, intern_value, normalize_header_key, parse_int,
+    records_memory, row_get, split_path,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Выгрузка читается с диска блоками такого размера
+EXPORT_READ_CHUNK_SIZE = 1024 * 1024
+
+# Поля, которые чаще всего меняются между выгрузками. Если у существующего товара
+# отличаются только они, товар обновляется узким UPDATE без полной перезаписи строки.
+VOLATILE_FIELDS = ("warehouse_quantity", "retail_price", "price_discount_percent", "retail_price_with_discount")
+
+SEX_NAMES = {
+    0: "Не определен",
+    1: "Мужской",
+    2: "Женский",
+    3: "Мальчик",
+    4: "Девочка",
+    5: "Унисекс"
+}
+
+STATS_KEYS = (
+    "products_created",
+    "products_updated",
+    "products_fast_updated",
+    "products_unchanged",
+    "products_deactivated",
+    "categories_created",
+    "manufacturers_created",
+    "collections_created",
+    "seasons_created",
+    "sexes_created",
+    "materials_created",
+    "measure_units_created",
+    "currencies_created",
+    "attributes_created",
+    "attributes_updated",
+    "attributes_deleted",
+    "currency_prices_created",
+    "analogs_created",
+    "skipped_products",
+    "rows_without_goodid",
+    "rows_failed",
+)
+
+
+@dataclass(frozen=True)
+class SyncTenant:
+    """Описание магазина: модели, подключение и отличия в разборе выгрузки."""
+    name: str
+    models: ModuleType
+    engine: AsyncEngine
+    session_maker: Callable
+    csv_path: str
+    excluded_root_categories: frozenset
+    # Строит поля товара из строки выгрузки (без ссылок на справочники)
+    build_product_data: Callable[[dict, int], dict]
+    # Числовые поля товара, которые разбираются колонками для всего батча
+    float_columns: dict = field(default_factory=lambda: dict(FLOAT_COLUMNS))
+    # Столбцы выгрузки, которые пишутся атрибутами товара
+    attribute_columns: dict = field(default_factory=lambda: dict(ATTRIBUTE_COLUMNS))
+    # Поля, которые задаются только при создании товара
+    update_excluded_fields: frozenset = field(default_factory=lambda: frozenset({"display", "color_id"}))
+    # Подробное логирование строк и батчей
+    verbose: bool = True
+    # Папка с изображениями товаров (26925.jpg, 26925_2.jpg, ...)
+    images_dir: str | None = None
+    # Число параллельных писателей товаров, каждый на своём соединении из пула
+    write_shards: int = 1
+
+    def log(self, level: str, message: str):
+        if self.verbose:
+            getattr(logger, level)(message)
+
+    @property
+    def fast_fields(self) -> list:
+        # Изменчивые поля, которые этот магазин обновляет у существующих товаров
+        return [f for f in VOLATILE_FIELDS if f not in self.update_excluded_fields]
+
+
+@dataclass(slots=True)
+class RowDimensions:
+    """Имена справочных значений одной строки выгрузки."""
+    category_names: tuple
+    country_name: str
+    collection_names: tuple
+    season_name: str
+    sex_name: str
+    material_name: str
+    measure_unit_name: str
+    currency_name: str | None
+
+
+def extract_dimensions(row_idx: dict, category_names: tuple) -> RowDimensions:
+    sex_value = parse_int(row_get(row_idx, "Sex", "Пол")) or 0
+    return RowDimensions(
+        category_names=category_names,
+        country_name=row_get(row_idx, "Country", "Страна") or "Unknown",
+        collection_names=tuple(map(intern_value, split_path(
+            row_get(row_idx, "ProducerCollectionFull", "ProducerCollection", "Producer Collection Full")
+        ))),
+        season_name=row_get(row_idx, "Season", "Сезон") or "Unknown",
+        sex_name=SEX_NAMES.get(sex_value, "Не определен"),
+        material_name=row_get(row_idx, "Material", "Материал") or "Unknown",
+        measure_unit_name=row_get(row_idx, "MeasureUnit", "Measure Unit", "ЕдИзм") or "Unknown",
+        currency_name=row_get(row_idx, "EqualCurrencyName", "Currency", "Валюта") or None,
+    )
+
+
+class DimensionResolver:
+    """
+    Справочники имя -> id на время прогона.
+
+    Перед записью товаров prepare() собирает все значения справочников из
+    выгрузки, создаёт недостающие одним INSERT ... ON CONFLICT DO NOTHING
+    RETURNING на таблицу (для иерархий — на уровень) и строит полные карты.
+    После этого lookup() подставляет id без обращения к базе.
+    """
+
+    # Сколько строк вставлять одним INSERT
+    insert_chunk_size = 1000
+
+    def __init__(self, models: ModuleType):
+        m = models
+        self.fields = {
+            m.Manufacturer: "manufacturer_name",
+            m.Season: "season_name",
+            m.Sex: "sex_name",
+            m.Material: "material_name",
+            m.MeasureUnit: "unit_name",
+            m.Currency: "currency_name",
+        }
+        # Иерархии ищутся по (id родителя, имя)
+        self.hierarchies = {
+            m.Category: ("category_name", "parent_category_id"),
+            m.Collection: ("collection_name", "parent_collection_id"),
+        }
+        self.models = m
+        self.ids = {model: {} for model in (*self.fields, *self.hierarchies)}
+
+    def _key_columns(self, model) -> tuple:
+        if model in self.hierarchies:
+            name_field, parent_field = self.hierarchies[model]
+            return getattr(model, parent_field), getattr(model, name_field)
+        return (getattr(model, self.fields[model]),)
+
+    async def load(self, session):
+        for model in self.ids:
+            pk = model.__mapper__.primary_key[0]
+            columns = self._key_columns(model)
+            # При дубликатах (до миграции) берём запись с наименьшим id
+            result = await session.execute(select(pk, *columns).order_by(pk.desc()))
+            if model in self.hierarchies:
+                self.ids[model] = {(parent_id, name): pk_value for pk_value, parent_id, name in result.all()}
+            else:
+                self.ids[model] = {name: pk_value for pk_value, name in result.all()}
+
+    async def _insert_missing(self, session, model, rows: list[dict]) -> int:
+        """Вставляет строки справочника, пропуская уже существующие, и дополняет карту id."""
+        pk = model.__mapper__.primary_key[0]
+        columns = self._key_columns(model)
+        known = self.ids[model]
+
+        def key_of(values):
+            return tuple(values) if len(values) > 1 else values[0]
+
+        created = 0
+        for start in range(0, len(rows), self.insert_chunk_size):
+            chunk = rows[start:start + self.insert_chunk_size]
+            result = await session.execute(
+                pg_insert(model).values(chunk).on_conflict_do_nothing().returning(pk, *columns)
+            )
+            for pk_value, *values in result.all():
+                known[key_of(values)] = pk_value
+                created += 1
+
+        # Значения, которые параллельно успел вставить другой прогон
+        names = {row[columns[-1].key] for row in rows if key_of([row[c.key] for c in columns]) not in known}
+        if names:
+            result = await session.execute(select(pk, *columns).where(columns[-1].in_(names)).order_by(pk.desc()))
+            for pk_value, *values in result.all():
+                known.setdefault(key_of(values), pk_value)
+        return created
+
+    async def ensure_values(self, session, model, values: dict) -> int:
+        """Создаёт недостающие значения плоского справочника (имя -> доп. поля)."""
+        name_field = self.fields[model]
+        known = self.ids[model]
+        rows = [{name_field: name, **defaults} for name, defaults in values.items() if name not in known]
+        if not rows:
+            return 0
+        return await self._insert_missing(session, model, rows)
+
+    def path_id(self, model, names) -> int | None:
+        parent_id = None
+        known = self.ids[model]
+        for name in names:
+            parent_id = known.get((parent_id, name))
+            if parent_id is None:
+                return None
+        return parent_id
+
+    async def ensure_paths(self, session, model, paths: dict) -> int:
+        """Создаёт недостающие узлы иерархии уровень за уровнем (путь -> доп. поля)."""
+        name_field, parent_field = self.hierarchies[model]
+        known = self.ids[model]
+        created = 0
+        depth = max((len(path) for path in paths), default=0)
+        for level in range(depth):
+            rows = {}
+            for path, defaults in paths.items():
+                if len(path) <= level:
+                    continue
+                parent_id = self.path_id(model, path[:level]) if level else None
+                key = (parent_id, path[level])
+                if key not in known and key not in rows:
+                    rows[key] = {name_field: path[level], parent_field: parent_id, **defaults}
+            if rows:
+                created += await self._insert_missing(session, model, list(rows.values()))
+        return created
+
+    async def prepare(self, session, rows, stats):
+        """Создаёт все недостающие значения справочников, встречающиеся в выгрузке."""
+        m = self.models
+        flat = {model: {} for model in self.fields}
+        categories, collections = {}, {}
+        for pending in rows:
+            dims = pending.dims
+            flat[m.Manufacturer].setdefault(dims.country_name, {"country": dims.country_name})
+            flat[m.Season].setdefault(dims.season_name, {})
+            flat[m.Sex].setdefault(dims.sex_name, {})
+            flat[m.Material].setdefault(dims.material_name, {})
+            flat[m.MeasureUnit].setdefault(dims.measure_unit_name, {})
+            if dims.currency_name:
+                flat[m.Currency].setdefault(dims.currency_name, {})
+            if dims.category_names:
+                categories.setdefault(tuple(dims.category_names), {"synchronization_section": dims.category_names[0]})
+            if dims.collection_names:
+                collections.setdefault(tuple(dims.collection_names), dims.country_name)
+
+        for model, values in flat.items():
+            stats[f"{model.__tablename__}_created"] += await self.ensure_values(session, model, values)
+        stats["categories_created"] += await self.ensure_paths(session, m.Category, categories)
+        # Новая коллекция привязывается к производителю первой строки, где она встретилась
+        manufacturers = self.ids[m.Manufacturer]
+        stats["collections_created"] += await self.ensure_paths(session, m.Collection, {
+            path: {"manufacturer_id": manufacturers.get(country_name)} for path, country_name in collections.items()
+        })
+
+    def lookup_partial(self, dims: RowDimensions) -> tuple[dict, list]:
+        """
+        Возвращает id справочников без обращения к базе.
+
+        Returns:
+            tuple: id справочников (None для неизвестных значений) и список
+                пар (таблица, имя) значений, которых нет в справочниках.
+        """
+        m = self.models
+        missing = []
+
+        def find(model, name):
+            pk_value = self.ids[model].get(name)
+            if pk_value is None:
+                missing.append((model.__tablename__, name))
+            return pk_value
+
+        def find_path(model, names):
+            known = self.ids[model]
+            pk_value = None
+            for i, name in enumerate(names):
+                pk_value = known.get((pk_value, name))
+                if pk_value is None:
+                    missing.extend((model.__tablename__, rest) for rest in names[i:])
+                    return None
+            return pk_value
+
+        measure_unit_id = find(m.MeasureUnit, dims.measure_unit_name)
+        ids = {
+            "category_id": find_path(m.Category, dims.category_names),
+            "manufacturer_id": find(m.Manufacturer, dims.country_name),
+            "collection_id": find_path(m.Collection, dims.collection_names),
+            "season_id": find(m.Season, dims.season_name),
+            "sex_id": find(m.Sex, dims.sex_name),
+            "material_id": find(m.Material, dims.material_name),
+            "measure_unit_id": measure_unit_id,
+            "guarantee_mes_unit_id": measure_unit_id,
+            "currency_id": find(m.Currency, dims.currency_name) if dims.currency_name else None,
+        }
+        return ids, missing
+
+    def lookup(self, dims: RowDimensions) -> dict | None:
+        """Возвращает id справочников без обращения к базе или None, если чего-то нет."""
+        ids, missing = self.lookup_partial(dims)
+        return None if missing else ids
+
+
+def diff_product(current, data: dict, excluded_fields) -> set:
+    """Возвращает имена полей, значения которых отличаются от текущих в базе."""
+    return {
+        key for key, value in data.items()
+        if key not in excluded_fields and current[key] != value
+    }
+
+
+def classify_product(tenant: SyncTenant, current, data: dict) -> tuple[str, set]:
+    """
+    Определяет, как записать товар.
+
+    Returns:
+        tuple: вид записи ("create", "full", "fast" или "unchanged") и изменённые поля.
+    """
+    if current is None:
+        return "create", set(data)
+    changed = diff_product(current, data, tenant.update_excluded_fields)
+    if not changed:
+        return "unchanged", changed
+    if changed.issubset(tenant.fast_fields):
+        return "fast", changed
+    return "full", changed
+
+
+def attribute_changes(tenant: SyncTenant, current: dict, good_id: int, row_idx: dict) -> tuple[list, list, list]:
+    """
+    Сравнивает атрибуты строки с текущими значениями в базе.
+
+    Args:
+        current: (good_id, attribute_name) -> (attribute_id, attribute_value).
+
+    Returns:
+        tuple: Новые, изменённые и удаляемые атрибуты. Удаляются атрибуты,
+            значение которых в выгрузке стало пустым.
+    """
+    creates, updates, deletes = [], [], []
+    for name, aliases in tenant.attribute_columns.items():
+        value = row_get(row_idx, *aliases)
+        value = str(value).strip() if value is not None else ""
+        row = {"good_id": good_id, "attribute_name": name, "attribute_value": value}
+        existing = current.get((good_id, name))
+        if existing is None:
+            if value:
+                creates.append(row)
+        elif not value:
+            deletes.append({"attribute_id": existing[0], **row})
+        elif existing[1] != value:
+            updates.append({"attribute_id": existing[0], **row})
+    return creates, updates, deletes
+
+
+def parse_analog_ids(row_idx: dict) -> list[int]:
+    analogs_raw = row_get(row_idx, "Analogs")
+    if not analogs_raw:
+        return []
+    return [int(aid) for aid in str(analogs_raw).split(",") if str(aid).strip()]
+
+
+def currency_price_data(row_idx: dict, data: dict) -> dict | None:
+    # Цена в валюте есть, только если в выгрузке заполнена хотя бы одна из цен
+    if not (row_get(row_idx, "EqualSalePrice") or row_get(row_idx, "EqualWholesalePrice")):
+        return None
+    return {
+        "retail_price": data["equal_sale_price"],
+        "wholesale_price": data["equal_wholesale_price"],
+    }
+
+
+@dataclass(slots=True)
+class PendingRow:
+    good_id: int
+    row_number: int
+    row_idx: ExportRecord
+    dims: RowDimensions
+
+
+class CatalogState:
+    """Текущее состояние каталога магазина, загруженное несколькими массовыми запросами."""
+
+    def __init__(self, models: ModuleType):
+        self.models = models
+        self.products = {}
+        self.analogs = set()
+        self.currency_prices = {}
+        self.attributes = {}
+        # GoodID товаров и цен, записанных в этом прогоне (для обновления витрины)
+        self.touched = set()
+
+    async def load(self, session):
+        m = self.models
+        result = await session.execute(select(m.Product.__table__))
+        self.products = {row.good_id: row for row in result.mappings()}
+        result = await session.execute(select(m.Analog.good_id, m.Analog.analog_good_id))
+        self.analogs = set(result.all())
+        price = m.ProductCurrencyPrice
+        result = await session.execute(
+            select(price.good_id, price.currency_id, price.retail_price, price.wholesale_price)
+        )
+        self.currency_prices = {
+            (row.good_id, row.currency_id): {"retail_price": row.retail_price, "wholesale_price": row.wholesale_price}
+            for row in result.all()
+        }
+        attr = m.ProductAttribute
+        result = await session.execute(
+            select(attr.attribute_id, attr.good_id, attr.attribute_name, attr.attribute_value)
+        )
+        self.attributes = {
+            (row.good_id, row.attribute_name): (row.attribute_id, row.attribute_value) for row in result.all()
+        }
+
+
+async def sync_batch(
+    tenant: SyncTenant,
+    resolver: DimensionResolver,
+    state: CatalogState,
+    batch: dict,
+    stats: Counter,
+    before_commit: Callable[..., Awaitable] | None = None,
+    throttle=None,
+) -> bool:
+    """
+    Записывает батч строк в одной транзакции.
+
+    Справочники уже подготовлены, а текущее состояние каталога загружено,
+    поэтому батч не читает из базы: каждая строка классифицируется в памяти
+    (новая, полное обновление, обновление только остатков и цен или без
+    изменений), после чего выполняются массовые INSERT/UPDATE.
+
+    Args:
+        before_commit: Вызывается как before_commit(session, batch_stats) перед
+            коммитом батча, в той же транзакции (например, для записи чекпойнта).
+            Не вызывается, если часть строк батча не разобралась: чекпойнт не
+            должен сдвигаться за строки, которые не записаны.
+        throttle: Бюджет записи (tasks.throttle.WriteThrottle): перед записью
+            батч ждёт токены на свои строки и запросы, время записи сообщается
+            обратно для автоматического снижения скорости.
+
+    Returns:
+        bool: True, если все строки батча записаны.
+    """
+    m = tenant.models
+    Product = m.Product
+    batch_stats = Counter()
+    ok = True
+
+    creates, full_updates, fast_updates = [], [], []
+    fast_columns = tenant.fast_fields
+    new_prices, price_updates = [], []
+    new_attributes, attribute_updates, attribute_deletes = [], [], []
+
+    floats = convert_float_columns([pending.row_idx for pending in batch.values()], tenant.float_columns)
+
+    for row_index, (good_id, pending) in enumerate(batch.items()):
+        row_idx = pending.row_idx
+        try:
+            data = tenant.build_product_data(row_idx, good_id)
+            floats.fill(data, row_index)
+            # Сами аналоги пишутся после всех шардов (write_analogs), здесь только проверяются
+            parse_analog_ids(row_idx)
+            attributes = attribute_changes(tenant, state.attributes, good_id, row_idx)
+            ids = resolver.lookup(pending.dims)
+            if ids is None:
+                raise ValueError("справочники строки не подготовлены")
+        except Exception as e:
+            ok = False
+            batch_stats["rows_failed"] += 1
+            logger.error(f"Ошибка при обработке строки {pending.row_number}: {str(e)}")
+            continue
+        currency_id = ids.pop("currency_id")
+        data.update(ids)
+
+        kind, changed = classify_product(tenant, state.products.get(good_id), data)
+        if kind == "create":
+            tenant.log("info", f"CREATE: GoodID={good_id}")
+            creates.append({"good_id": good_id, "display": 1, **data})
+        elif kind == "unchanged":
+            batch_stats["products_unchanged"] += 1
+        elif kind == "fast":
+            fast_updates.append({"good_id": good_id, **{f: data[f] for f in fast_columns}})
+        else:
+            logger.debug(f"UPDATE: GoodID={good_id} поля: {sorted(changed)}")
+            full_updates.append({"good_id": good_id, **{f: data[f] for f in changed}})
+
+        price_data = currency_price_data(row_idx, data)
+        if currency_id and price_data:
+            current_price = state.currency_prices.get((good_id, currency_id))
+            if current_price is None:
+                new_prices.append({"good_id": good_id, "currency_id": currency_id, **price_data})
+            elif current_price != price_data:
+                price_updates.append({"good_id": good_id, "currency_id": currency_id, **price_data})
+
+        new_attributes.extend(attributes[0])
+        attribute_updates.extend(attributes[1])
+        attribute_deletes.extend(attributes[2])
+
+    batch_stats["products_created"] += len(creates)
+    batch_stats["products_updated"] += len(full_updates)
+    batch_stats["products_fast_updated"] += len(fast_updates)
+    batch_stats["currency_prices_created"] += len(new_prices)
+    batch_stats["attributes_created"] += len(new_attributes)
+    batch_stats["attributes_updated"] += len(attribute_updates)
+    batch_stats["attributes_deleted"] += len(attribute_deletes)
+
+    created_attributes = []
+    writes = [
+        creates, full_updates, fast_updates, new_prices, price_updates,
+        new_attributes, attribute_updates, attribute_deletes,
+    ]
+    if any(writes):
+        if throttle is not None:
+            await throttle.acquire(sum(map(len, writes)), sum(1 for rows in writes if rows))
+        write_started = time.perf_counter()
+        async with tenant.session_maker() as session:
+            try:
+                if creates:
+                    await session.execute(insert(Product), creates)
+                if full_updates:
+                    await session.execute(update(Product), full_updates)
+                if fast_updates:
+                    await update_columns_from_values(session, Product, "good_id", fast_columns, fast_updates)
+                if new_prices:
+                    await session.execute(pg_insert(m.ProductCurrencyPrice).on_conflict_do_nothing(), new_prices)
+                if price_updates:
+                    await update_columns_from_values(
+                        session, m.ProductCurrencyPrice, ("good_id", "currency_id"),
+                        ["retail_price", "wholesale_price"], price_updates,
+                    )
+                if new_attributes:
+                    attr = m.ProductAttribute
+                    result = await session.execute(
+                        pg_insert(attr).on_conflict_do_nothing().returning(
+                            attr.attribute_id, attr.good_id, attr.attribute_name, attr.attribute_value,
+                        ),
+                        new_attributes,
+                    )
+                    created_attributes = result.all()
+                if attribute_updates:
+                    await update_columns_from_values(
+                        session, m.ProductAttribute, "attribute_id", ["attribute_value"], attribute_updates,
+                    )
+                if attribute_deletes:
+                    ids = bindparam("ids", [row["attribute_id"] for row in attribute_deletes], type_=ARRAY(Integer))
+                    await session.execute(delete(m.ProductAttribute).where(m.ProductAttribute.attribute_id == any_(ids)))
+                if before_commit is not None and ok:
+                    await before_commit(session, batch_stats)
+                await session.commit()
+            except Exception as e:
+                logger.error(f"Ошибка при коммите батча: {str(e)}")
+                await session.rollback()
+                return False
+        if throttle is not None:
+            throttle.observe_commit(time.perf_counter() - write_started)
+
+    stats.update(batch_stats)
+
+    # Держим состояние в актуальном виде для следующих батчей
+    for rows in (creates, full_updates, fast_updates, new_prices, price_updates):
+        state.touched.update(row["good_id"] for row in rows)
+    for row in (*new_prices, *price_updates):
+        state.currency_prices[(row["good_id"], row["currency_id"])] = {
+            "retail_price": row["retail_price"], "wholesale_price": row["wholesale_price"],
+        }
+    for row in created_attributes:
+        state.attributes[(row.good_id, row.attribute_name)] = (row.attribute_id, row.attribute_value)
+    for row in attribute_updates:
+        state.attributes[(row["good_id"], row["attribute_name"])] = (row["attribute_id"], row["attribute_value"])
+    for row in attribute_deletes:
+        state.attributes.pop((row["good_id"], row["attribute_name"]), None)
+    return ok
+
+
+
+async def write_analogs(tenant: SyncTenant, state: CatalogState, rows, stats: Counter) -> int:
+    """
+    Добавляет недостающие связи аналогов для строк выгрузки.
+
+    Вызывается после записи всех товаров: analog_good_id — внешний ключ на
+    products, а товар-аналог может записываться другим шардом или более
+    поздним батчем. Аналоги считаются по всем строкам, а не только по
+    записанным в этом прогоне, поэтому прогон, продолживший прерванный,
+    добавит и аналоги уже записанных товаров.
+
+    Returns:
+        int: Количество добавленных связей.
+    """
+    pairs = {}
+    for pending in rows:
+        try:
+            analog_ids = parse_analog_ids(pending.row_idx)
+        except ValueError:
+            continue  # Строка уже учтена в rows_failed при записи товаров
+        for analog_id in analog_ids:
+            if (pending.good_id, analog_id) not in state.analogs:
+                pairs[(pending.good_id, analog_id)] = None
+    if not pairs:
+        return 0
+    async with tenant.session_maker() as session:
+        created = await insert_analogs(session, tenant.models.Analog, tenant.models.Product, list(pairs))
+        await session.commit()
+    state.analogs.update(created)
+    stats["analogs_created"] += len(created)
+    if len(created) < len(pairs):
+        logger.warning(f"[{tenant.name}] Аналоги: пропущено {len(pairs) - len(created)} связей с отсутствующими товарами")
+    return len(created)
+
+
+def open_export(tenant: SyncTenant) -> tuple[BinaryIO, str]:
+    """
+    Открывает выгрузку магазина: csv_path или самый свежий из его сжатых
+    вариантов (.csv.gz, .zip, .csv.zst, см. tasks.export_files).
+
+    sha256 считается блоками по EXPORT_READ_CHUNK_SIZE, после чего файл
+    возвращается на начало — разбор идёт по тому же открытому файлу, поэтому
+    замена выгрузки переименованием (как в /upload) между подсчётом отпечатка
+    и разбором не смешает два файла. Сжатый файл не распаковывается, отпечаток
+    считается по сжатому содержимому.
+
+    Returns:
+        tuple: Открытый файл (закрывает вызывающий) и его sha256.
+    """
+    export_file = open(resolve_export_path(tenant.csv_path), "rb")
+    try:
+        digest = hashlib.sha256()
+        while chunk := export_file.read(EXPORT_READ_CHUNK_SIZE):
+            digest.update(chunk)
+        export_file.seek(0)
+    except BaseException:
+        export_file.close()
+        raise
+    return export_file, digest.hexdigest()
+
+
+def make_reader(tenant: SyncTenant, export_file: BinaryIO) -> csv.DictReader:
+    """
+    Возвращает DictReader по выгрузке с определённым разделителем.
+
+    Строки читаются из потока по мере разбора: сжатая выгрузка распаковывается
+    на лету, а обычная не декодируется в одну большую строку.
+    """
+    stream, compression = open_export_stream(export_file)
+
+    # Определяем разделитель автоматически (поддержка "," и ";") по первым строкам
+    head = list(itertools.islice(stream, 5))
+    try:
+        dialect = csv.Sniffer().sniff("".join(head), delimiters=",;")
+        delimiter = dialect.delimiter
+    except Exception:
+        delimiter = ","
+    tenant.log("info", f"Определён разделитель CSV: '{delimiter}', сжатие: {compression or 'нет'}")
+    return csv.DictReader(itertools.chain(head, stream), delimiter=delimiter)
+
+
+def parse_export_rows(tenant: SyncTenant, reader: csv.DictReader, stats: Counter):
+    """
+    Разбирает строки выгрузки: нормализует заголовки и находит GoodID.
+
+    Разбор не зависит от магазина (tenant нужен только для логов), поэтому
+    его результат кэшируется по содержимому файла. Строки читаются списками
+    значений и хранятся как ExportRecord с общей схемой столбцов и
+    интернированными значениями справочных столбцов, без словаря на строку.
+
+    Yields:
+        tuple: (good_id, номер строки, ExportRecord, путь категории кортежем).
+    """
+    # Детекторы/флаги
+    logged_headers_once = False
+    detected_good_id_key = None  # нормализованное имя ключа GoodID, если найдено эвристикой
+    processed_rows = 0
+
+    header = tuple(reader.fieldnames or ())
+    for values in reader.reader:
+        if not values:
+            continue
+        processed_rows += 1
+        if processed_rows % 1000 == 0:
+            tenant.log("info", f"Прогресс: обработано {processed_rows} строк")
+
+        try:
+            # Индекс по нормализованным именам столбцов (убираем BOM/пробелы, регистр)
+            row_idx = ExportRecord.from_csv(header, values)
+
+            # Однократно логируем заголовки для диагностики
+            if not logged_headers_once:
+                tenant.log("info", f"CSV headers: {[normalize_header_key(k) for k in header]}")
+                logged_headers_once = True
+
+            # Проверяем наличие GoodID (учёт разных вариантов имён)
+            good_id_raw = row_get(row_idx, "GoodID", "Good Id", "Good_Id", "ID", "Id")
+
+            # Если не нашли по алиасам — пробуем автоматически определить колонку GoodID
+            if (not good_id_raw or not str(good_id_raw).strip()):
+                if detected_good_id_key and row_idx.get(detected_good_id_key) is not None:
+                    good_id_raw = row_idx.get(detected_good_id_key)
+                else:
+                    # Эвристика: ищем ключ, содержащий 'good' и оканчивающийся на 'id', либо просто 'id'
+                    candidate_keys = []
+                    for k_norm, v in row_idx.items():
+                        if v is None or not str(v).strip():
+                            continue
+                        if ("good" in k_norm and k_norm.endswith("id")) or k_norm == "id" or k_norm.endswith("id"):
+                            if parse_int(v) is not None:
+                                candidate_keys.append(k_norm)
+                    if candidate_keys:
+                        detected_good_id_key = candidate_keys[0]
+                        good_id_raw = row_idx.get(detected_good_id_key)
+                        tenant.log("info", f"Detected GoodID column: {detected_good_id_key}")
+
+            # Теперь парсим good_id
+            if not good_id_raw or not str(good_id_raw).strip():
+                stats["rows_without_goodid"] += 1
+                logger.debug(f"Пропуск строки без GoodID (row {processed_rows})")
+                continue
+            good_id = parse_int(good_id_raw)
+            if good_id is None:
+                stats["rows_without_goodid"] += 1
+                logger.debug(f"Пропуск строки с некорректным GoodID (row {processed_rows})")
+                continue
+
+            goodtypefull_value = row_get(row_idx, "GoodTypeFull", "GoodType", "Good Type Full", "Good_Type_Full")
+            parsed = (good_id, processed_rows, row_idx, tuple(map(intern_value, split_path(goodtypefull_value))))
+        except Exception as e:
+            stats["rows_failed"] += 1
+            logger.error(f"Ошибка при обработке строки {processed_rows}: {str(e)}")
+            continue
+
+        yield parsed
+
+
+async def load_export(tenant: SyncTenant, stats: Counter) -> tuple[list, str]:
+    """
+    Возвращает разобранные строки выгрузки и отпечаток файла.
+
+    Результат разбора сохраняется в кэш EXPORT_CACHE_DIR (см. tasks.export_cache)
+    по sha256 содержимого и версии парсера. Повторный запуск на том же файле
+    (после сбоя, для второго магазина или после dry run) читает строки из
+    кэша без декодирования CSV и нормализации заголовков.
+    """
+    export_file, fingerprint = await run_in_thread(open_export, tenant)
+    with export_file:
+        path = cache_path(fingerprint)
+        cached = await run_in_thread(read_cache, path)
+        if cached is not None:
+            parsed_rows, counters = cached
+            stats.update(counters)
+            tenant.log("info", f"Выгрузка прочитана из кэша: {len(parsed_rows)} строк")
+            return parsed_rows, fingerprint
+        counters = Counter()
+        # Разбор идёт в отдельном потоке, чтобы не блокировать event loop (API, heartbeat воркера)
+        parsed_rows = await run_in_thread(
+            lambda: list(parse_export_rows(tenant, make_reader(tenant, export_file), counters))
+        )
+    stats.update(counters)
+    try:
+        await run_in_thread(write_cache, path, parsed_rows, dict(counters))
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить кэш выгрузки: {str(e)}")
+    return parsed_rows, fingerprint
+
+
+def iter_export_rows(tenant: SyncTenant, parsed_rows, stats: Counter):
+    """
+    Отдаёт товары выгрузки, которые относятся к магазину.
+
+    Строки из исключённых категорий учитываются в stats и пропускаются.
+    """
+    for good_id, row_number, row_idx, category_names in parsed_rows:
+        # Пропуск строк по верхнему уровню GoodTypeFull (например, Одежда)
+        first_category_name = category_names[0] if category_names else None
+        if first_category_name in tenant.excluded_root_categories:
+            stats["skipped_products"] += 1
+            tenant.log("info", f"SKIP: GoodID={good_id} из-за категории: {first_category_name}")
+            continue
+
+        logger.debug(f"ROW: {row_number} GoodID={good_id} root_category={first_category_name}")
+        yield PendingRow(good_id, row_number, row_idx, extract_dimensions(row_idx, category_names))
+
+
+def collect_export_rows(tenant: SyncTenant, parsed_rows, stats: Counter) -> dict:
+    """
+    Собирает товары выгрузки по GoodID.
+
+    При повторе GoodID побеждает последняя строка (и встаёт на её место в
+    порядке), как и при построчной записи.
+    """
+    rows = {}
+    for pending in iter_export_rows(tenant, parsed_rows, stats):
+        rows.pop(pending.good_id, None)
+        rows[pending.good_id] = pending
+    return rows
+
+
+async def write_shard(
+    tenant: SyncTenant,
+    resolver: DimensionResolver,
+    state: CatalogState,
+    index: int,
+    shard_rows: list,
+    checkpoint,
+    fingerprint: str,
+    throttle=None,
+    progress=None,
+) -> tuple[Counter, set, bool, dict]:
+    """
+    Записывает товары одного шарда батчами, продолжая с его чекпойнта.
+
+    Ход записи (progress, tasks.sync_progress.SyncProgress) сдвигается раз на батч.
+
+    Returns:
+        tuple: Статистика шарда, записанные GoodID, признак прогона без ошибок
+            и отчёт о пропускной способности шарда.
+    """
+    Checkpoint = tenant.models.SyncCheckpoint
+    key = shard_checkpoint_key(index, max(1, tenant.write_shards))
+    commit_batch_size = 500  # Размер батча для коммита
+    shard_stats = Counter()
+    seen_good_ids = set()
+    run_complete = True  # Сбрасывается при ошибке батча
+    started = time.perf_counter()
+
+    resume_from = 0
+    if checkpoint is not None:
+        if checkpoint.fingerprint == fingerprint and checkpoint.position <= len(shard_rows):
+            resume_from = checkpoint.position
+            for name, value in (checkpoint.stats or {}).items():
+                if name not in PARSE_STATS_KEYS:
+                    shard_stats[name] += value
+            seen_good_ids.update(pending.good_id for pending in shard_rows[:resume_from])
+            if progress is not None:
+                progress.resume(resume_from)
+            logger.info(f"[{tenant.name}] Шард {index}: продолжение с чекпойнта, {resume_from} из {len(shard_rows)} товаров")
+        else:
+            logger.info(f"[{tenant.name}] Шард {index}: выгрузка изменилась, чекпойнт сброшен")
+
+    for start in range(resume_from, len(shard_rows), commit_batch_size):
+        batch = {pending.good_id: pending for pending in shard_rows[start:start + commit_batch_size]}
+
+        async def save_progress(session, batch_stats, position=start + len(batch)):
+            progress = {name: shard_stats[name] + batch_stats[name] for name in STATS_KEYS}
+            await save_checkpoint(session, Checkpoint, fingerprint, position, progress, key=key)
+
+        # После первой ошибки (строки или коммита) чекпойнт больше не сдвигается, чтобы следующий
+        # запуск повторил упавший батч; батч с ошибочными строками чекпойнт не сдвигает и сам
+        failed_before = shard_stats["rows_failed"]
+        ok = await sync_batch(tenant, resolver, state, batch, shard_stats, save_progress if run_complete else None, throttle)
+        if progress is not None:
+            progress.advance(len(batch), shard_stats["rows_failed"] - failed_before, ok)
+        if ok:
+            seen_good_ids.update(batch)
+            tenant.log("info", f"Шард {index}: коммит батча, {start + len(batch)} товаров")
+        else:
+            run_complete = False
+
+    elapsed = time.perf_counter() - started
+    written = len(shard_rows) - resume_from
+    report = {
+        "shard": index,
+        "rows": written,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(written / elapsed, 1) if elapsed > 0 else None,
+    }
+    return shard_stats, seen_good_ids, run_complete, report
+
+
+async def run_sync(
+    tenant: SyncTenant,
+    throttle=None,
+    after_write: Callable[[set | None], Awaitable] | None = None,
+    progress=None,
+) -> dict:
+    """
+    Синхронизирует данные из CSV-файла Торгсофт с базой данных магазина.
+
+    Работает в два прохода: сначала все значения справочников из выгрузки
+    создаются массово и загружается текущее состояние каталога, затем товары
+    записываются батчами без чтения из базы.
+
+    Товары делятся на tenant.write_shards шардов по good_id, шарды пишут свои
+    батчи одновременно, каждый в своей сессии. Справочники к этому моменту уже
+    созданы, поэтому шарды не конкурируют за одни и те же строки.
+
+    Вместе с каждым батчем в той же транзакции сохраняется чекпойнт шарда:
+    отпечаток файла, количество записанных товаров шарда и его статистика.
+    Если прогон прервался, следующий запуск с тем же файлом продолжает с
+    чекпойнтов, а при изменившемся файле они игнорируются и перезаписываются.
+
+    Args:
+        throttle: Общий для всех шардов бюджет записи (tasks.throttle.WriteThrottle).
+        after_write: Вызывается после записи как after_write(good_ids) с GoodID
+            изменённых и деактивированных товаров, либо с None, если прогон
+            продолжил прерванный и список неполный (например, для витрины).
+        progress: Ход синхронизации (tasks.sync_progress.SyncProgress): текущий
+            этап и счётчики записанных строк для потока событий.
+
+    Returns:
+        dict: Статистика синхронизации (количество созданных/обновленных записей),
+            отпечаток файла (fingerprint) и время этапов в секундах (stages).
+    """
+    stats = Counter({key: 0 for key in STATS_KEYS})
+    resolver = DimensionResolver(tenant.models)
+    state = CatalogState(tenant.models)
+    Checkpoint = tenant.models.SyncCheckpoint
+    fingerprint = None
+    stages = {}
+    stage_started = time.perf_counter()
+
+    def end_stage(name: str, next_stage: str | None = None):
+        nonlocal stage_started
+        now = time.perf_counter()
+        stages[name] = round(now - stage_started, 3)
+        stage_started = now
+        if progress is not None and next_stage is not None:
+            progress.begin(next_stage)
+
+    try:
+        tenant.log("info", f"Старт синхронизации: {tenant.csv_path}")
+        if progress is not None:
+            progress.begin("parse")
+        parsed_rows, fingerprint = await load_export(tenant, stats)
+        end_stage("parse", "rows")
+        memory = records_memory(parsed_rows)
+        tenant.log("info", f"Память выгрузки: ~{memory / 2**20:.1f} МиБ на 100 тыс. строк")
+
+        rows = collect_export_rows(tenant, parsed_rows, stats)
+        end_stage("rows", "prepare")
+        if progress is not None:
+            progress.set_total(len(rows), stats["rows_failed"])
+
+        # Первый проход: справочники и текущее состояние каталога
+        async with tenant.session_maker() as session:
+            await resolver.load(session)
+            await resolver.prepare(session, rows.values(), stats)
+            await session.commit()
+            await state.load(session)
+            shard_count = max(1, tenant.write_shards)
+            checkpoints = [
+                await load_checkpoint(session, Checkpoint, shard_checkpoint_key(index, shard_count))
+                for index in range(shard_count)
+            ]
+        tenant.log("info", "Справочники подготовлены")
+        end_stage("prepare", "write")
+
+        # Второй проход: товары, по шардам
+        shards = [[] for _ in range(shard_count)]
+        for pending in rows.values():
+            shards[pending.good_id % shard_count].append(pending)
+        results = await asyncio.gather(*(
+            write_shard(tenant, resolver, state, index, shard_rows, checkpoints[index], fingerprint, throttle, progress)
+            for index, shard_rows in enumerate(shards)
+        ))
+
+        end_stage("write", "deactivate")
+
+        seen_good_ids = set()  # GoodID всех товаров, записанных в этом прогоне
+        resumed = any(
+            checkpoint is not None and checkpoint.fingerprint == fingerprint and checkpoint.position
+            for checkpoint in checkpoints
+        )
+        run_complete = True
+        shard_reports = []
+        for shard_stats, shard_seen, shard_complete, report in results:
+            stats.update(shard_stats)
+            seen_good_ids.update(shard_seen)
+            run_complete = run_complete and shard_complete
+            shard_reports.append(report)
+
+        # Аналоги — после всех шардов, когда записаны и товары, и их аналоги
+        try:
+            await write_analogs(tenant, state, rows.values(), stats)
+        except Exception as e:
+            run_complete = False
+            logger.error(f"Ошибка при записи аналогов: {str(e)}")
+
+        # Деактивируем товары, пропавшие из выгрузки, только после полного успешного прогона
+        if run_complete and not stats["rows_failed"]:
+            try:
+                async with tenant.session_maker() as session:
+                    if seen_good_ids:
+                        missing, active = await count_missing_products(session, tenant.models.Product, seen_good_ids)
+                        if deactivation_too_large(missing, active, SYNC_MAX_DEACTIVATE_SHARE):
+                            stats["deactivation_skipped"] = missing
+                            logger.warning(
+                                f"[{tenant.name}] Деактивация пропущена: из выгрузки пропало {missing} из {active} "
+                                f"товаров с остатком (больше {SYNC_MAX_DEACTIVATE_SHARE:.0%}), выгрузка может быть обрезана"
+                            )
+                        else:
+                            deactivated = await deactivate_missing_products(session, tenant.models.Product, seen_good_ids)
+                            stats["products_deactivated"] = len(deactivated)
+                            state.touched.update(deactivated)
+                    await clear_checkpoints(session, Checkpoint)
+                    await session.commit()
+                tenant.log("info", f"Деактивировано товаров: {stats['products_deactivated']}")
+            except Exception as e:
+                logger.error(f"Ошибка при деактивации товаров: {str(e)}")
+        else:
+            logger.warning("Деактивация пропущена: прогон завершён не полностью")
+        end_stage("deactivate", "after_write" if after_write is not None else None)
+
+        if after_write is not None:
+            try:
+                await after_write(None if resumed else state.touched)
+            except Exception as e:
+                logger.error(f"Ошибка после записи товаров: {str(e)}")
+            end_stage("after_write")
+
+    except FileNotFoundError:
+        logger.error(f"Файл {tenant.csv_path} не найден")
+        return {"error": f"Файл {tenant.csv_path} не найден", "fingerprint": fingerprint, "stages": stages}
+    except Exception as e:
+        logger.error(f"Ошибка при синхронизации: {str(e)}")
+        return {"error": f"Ошибка при синхронизации: {str(e)}", "fingerprint": fingerprint, "stages": stages}
+
+    return {
+        **stats,
+        "shards": shard_reports,
+        "fingerprint": fingerprint,
+        "stages": stages,
+        "parsed_bytes_per_100k_rows": memory,
+    }
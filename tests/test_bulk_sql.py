@@ -0,0 +1,15 @@
+from tasks.bulk_sql import deactivation_too_large
+
+
+def test_deactivation_within_share_is_allowed():
+    assert not deactivation_too_large(30, 100, 0.3)
+    assert not deactivation_too_large(0, 0, 0.3)
+
+
+def test_truncated_export_blocks_deactivation():
+    assert deactivation_too_large(31, 100, 0.3)
+    assert deactivation_too_large(100, 100, 0.3)
+
+
+def test_zero_share_disables_the_check():
+    assert not deactivation_too_large(100, 100, 0)
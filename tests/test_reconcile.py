@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from sqlalchemy import Column, Float, Integer, String
+from sqlalchemy.dialects import postgresql
+
+from tasks.reconcile import NULL_MARK, SEPARATOR, hash_sql, render_value, row_hash
+
+COLUMNS = [Column("good_name", String), Column("retail_price", Float), Column("closeout", Integer)]
+
+
+def test_row_hash_is_signed_md5_prefix():
+    digest = hashlib.md5(SEPARATOR.join(["1", "a"]).encode("utf-8")).digest()
+    assert row_hash(["1", "a"]) == int.from_bytes(digest[:8], "big", signed=True)
+    assert -2**63 <= row_hash(["Сумка"]) < 2**63
+
+
+def test_render_value():
+    name, price, closeout = COLUMNS
+    assert render_value(name, None) == NULL_MARK
+    assert render_value(price, 12.34567) == "123457"
+    assert render_value(closeout, 3) == "3"
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_POSTGRES_DSN"), reason="нужен TEST_POSTGRES_DSN")
+def test_hash_sql_matches_row_hash():
+    # Хэш строки в Postgres и в Python должен совпадать, иначе сверка видит расхождения везде
+    import asyncpg
+
+    rows = [(1, "Сумка", 12.34567, 3), (2, None, None, None), (3, "a\\b", 0.00004, -1)]
+    quote = postgresql.dialect().identifier_preparer.quote
+
+    async def query():
+        conn = await asyncpg.connect(os.environ["TEST_POSTGRES_DSN"])
+        try:
+            return await conn.fetch(
+                f"SELECT {hash_sql(COLUMNS, quote)} AS hash "
+                "FROM (SELECT * FROM unnest($1::int[], $2::text[], $3::float8[], $4::int[])) "
+                "AS p(good_id, good_name, retail_price, closeout) ORDER BY p.good_id",
+                *map(list, zip(*rows)),
+            )
+        finally:
+            await conn.close()
+
+    expected = [
+        row_hash([str(row[0]), *(render_value(column, value) for column, value in zip(COLUMNS, row[1:]))])
+        for row in rows
+    ]
+    assert [record["hash"] for record in asyncio.run(query())] == expected
@@ -0,0 +1,98 @@
+import asyncio
+import dataclasses
+from collections import Counter
+
+import nursace_models
+from tasks.sync_nursace import NURSACE
+from tasks.torgsoft_csv import ExportRecord
+from tasks.torgsoft_sync import CatalogState, PendingRow, extract_dimensions, sync_batch
+
+HEADER = ("GoodID", "GoodName", "RetailPrice", "Analogs")
+
+
+class FakeResult:
+    def all(self):
+        return []
+
+
+class FakeSession:
+    def __init__(self, log: list):
+        self.log = log
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, *args, **kwargs):
+        self.log.append("execute")
+        return FakeResult()
+
+    async def commit(self):
+        self.log.append("commit")
+
+    async def rollback(self):
+        self.log.append("rollback")
+
+
+class FakeResolver:
+    def lookup(self, dims):
+        return {
+            "category_id": 1, "manufacturer_id": 1, "collection_id": None, "season_id": 1, "sex_id": 1,
+            "material_id": 1, "measure_unit_id": 1, "guarantee_mes_unit_id": 1, "currency_id": None,
+        }
+
+
+def make_batch(values: list) -> dict:
+    batch = {}
+    for number, row in enumerate(values, 1):
+        record = ExportRecord.from_csv(HEADER, row)
+        good_id = int(row[0])
+        batch[good_id] = PendingRow(good_id, number, record, extract_dimensions(record, ("Сумки",)))
+    return batch
+
+
+def run_batch(batch: dict, failing: set = frozenset()):
+    log, checkpoints = [], []
+
+    def build(row_idx, good_id):
+        if good_id in failing:
+            raise ValueError("некорректная строка")
+        return NURSACE.build_product_data(row_idx, good_id)
+
+    tenant = dataclasses.replace(NURSACE, session_maker=lambda: FakeSession(log), build_product_data=build)
+
+    async def before_commit(session, batch_stats):
+        checkpoints.append(dict(batch_stats))
+
+    stats = Counter()
+    ok = asyncio.run(sync_batch(
+        tenant, FakeResolver(), CatalogState(nursace_models), batch, stats, before_commit,
+    ))
+    return ok, stats, checkpoints, log
+
+
+def test_clean_batch_advances_checkpoint():
+    ok, stats, checkpoints, log = run_batch(make_batch([["1", "a", "10", ""], ["2", "b", "20", "1"]]))
+    assert ok
+    assert stats["products_created"] == 2
+    assert len(checkpoints) == 1
+    assert log[-1] == "commit"
+
+
+def test_batch_with_failed_rows_does_not_advance_checkpoint():
+    # Иначе продолженный прогон пропустил бы неразобранные строки
+    ok, stats, checkpoints, log = run_batch(make_batch([["1", "a", "10", ""], ["2", "b", "20", ""]]), {2})
+    assert not ok
+    assert stats["rows_failed"] == 1
+    assert stats["products_created"] == 1
+    assert checkpoints == []
+    assert log[-1] == "commit"
+
+
+def test_malformed_analogs_fail_the_row_without_writing_them():
+    ok, stats, checkpoints, log = run_batch(make_batch([["1", "a", "10", "x"], ["2", "b", "20", "1"]]))
+    assert not ok
+    assert stats["rows_failed"] == 1
+    assert "analogs_created" not in stats
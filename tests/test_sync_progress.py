@@ -0,0 +1,32 @@
+from tasks.sync_progress import SyncProgress, parse_event_id
+
+
+def test_parse_event_id():
+    assert parse_event_id("2:15") == (2, 15)
+    assert parse_event_id(None) == (None, 0)
+    assert parse_event_id("") == (None, 0)
+    # id старого формата (только seq) и мусор — досылается весь буфер
+    assert parse_event_id("15") == (None, 0)
+    assert parse_event_id("a:b") == (None, 0)
+
+
+def test_samples_are_numbered_and_buffered():
+    progress = SyncProgress(size=2)
+    progress.set_total(10)
+    progress.begin("write")
+    progress.advance(4)
+    for _ in range(3):
+        progress.sample()
+    snapshot = progress.snapshot()
+    assert [sample["seq"] for sample in snapshot] == [2, 3]
+    assert snapshot[-1]["rows_done"] == 4
+    assert not any(key.startswith("_") for key in snapshot[-1])
+
+
+def test_stage_hook_sees_finished_and_next_stage():
+    progress = SyncProgress()
+    seen = []
+    progress.on_stage = lambda finished, next_stage: seen.append((finished, next_stage))
+    progress.begin("parse")
+    progress.begin("rows")
+    assert seen == [("start", "parse"), ("parse", "rows")]
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from tasks.throttle import TokenBucket, WriteThrottle
+
+
+def test_bucket_does_not_wait_for_non_positive_rate():
+    bucket = TokenBucket(5)
+    started = time.monotonic()
+    asyncio.run(bucket.take(100, 0))
+    asyncio.run(bucket.take(100, -3))
+    assert time.monotonic() - started < 0.1
+
+
+def test_bucket_limits_positive_rate():
+    bucket = TokenBucket(100)
+    bucket.tokens = 0
+    started = time.monotonic()
+    asyncio.run(bucket.take(10, 100))
+    assert time.monotonic() - started >= 0.09
+
+
+def test_non_positive_rates_disable_buckets():
+    throttle = WriteThrottle({"rows_per_second": -5, "statements_per_second": 0})
+    assert throttle.rows is None
+    assert throttle.statements is None
+
+    throttle.configure({"rows_per_second": 50})
+    assert throttle.rows is not None
+
+
+def test_negative_commit_latency_disables_backoff():
+    throttle = WriteThrottle({"max_commit_latency_ms": -1})
+    throttle.observe_commit(10.0)
+    assert throttle.rate_factor == 1.0
+
+
+def test_throttle_endpoint_rejects_negative_values():
+    import main
+
+    # Проверка параметров идёт до обращения к базе
+    client = TestClient(main.app)
+    for name in ("rows_per_second", "statements_per_second", "max_commit_latency_ms"):
+        response = client.put(f"/sync/nursace/jobs/1/throttle?{name}=-1")
+        assert response.status_code == 422, name
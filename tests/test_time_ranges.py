@@ -0,0 +1,37 @@
+from datetime import datetime, time
+
+import pytest
+
+from tasks.time_ranges import LOCAL_TZ, in_time_range, parse_time_range
+
+
+def test_parse_time_range():
+    assert parse_time_range("01:00-06:30") == (time(1, 0), time(6, 30))
+    assert parse_time_range(" 22:00 - 07:00 ") == (time(22, 0), time(7, 0))
+    assert parse_time_range("") is None
+    assert parse_time_range("   ") is None
+
+
+def test_parse_time_range_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_time_range("утром")
+
+
+def local(hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 1, 1, hour, minute, tzinfo=LOCAL_TZ)
+
+
+def test_in_time_range_same_day():
+    time_range = parse_time_range("09:00-21:00")
+    assert in_time_range(local(9), time_range)
+    assert in_time_range(local(20, 59), time_range)
+    assert not in_time_range(local(21), time_range)
+    assert not in_time_range(local(8, 59), time_range)
+
+
+def test_in_time_range_over_midnight():
+    time_range = parse_time_range("22:00-07:00")
+    assert in_time_range(local(23), time_range)
+    assert in_time_range(local(3), time_range)
+    assert not in_time_range(local(7), time_range)
+    assert not in_time_range(local(12), time_range)
@@ -0,0 +1,51 @@
+import math
+
+from tasks.torgsoft_csv import ExportRecord, convert_float_columns, row_get
+
+HEADER = ("\ufeffGoodID", "GoodName", "Country", "Color", "RetailPrice")
+
+
+def test_record_reads_like_indexed_row():
+    record = ExportRecord.from_csv(HEADER, ["1", "Сумка", "Италия", "Черный", "10,5"])
+    assert record["goodid"] == "1"
+    assert row_get(record, "Good Name") == "Сумка"
+    assert "country" in record
+    assert dict(record.items())["color"] == "Черный"
+
+
+def test_record_pads_and_collects_extra_values_like_dictreader():
+    short = ExportRecord.from_csv(HEADER, ["1", "Сумка"])
+    assert short.get("retailprice") is None
+    assert len(short) == len(HEADER)
+
+    extra = ExportRecord.from_csv(HEADER, ["1", "Сумка", "Италия", "Черный", "10", "x", "y"])
+    assert extra.get(None) == ["x", "y"]
+
+
+def test_only_dimension_columns_are_interned():
+    first = ExportRecord.from_csv(HEADER, ["1", "".join(["Сум", "ка"]), "".join(["Ита", "лия"]), "Черный", "10"])
+    second = ExportRecord.from_csv(HEADER, ["2", "".join(["Сум", "ка"]), "".join(["Ита", "лия"]), "Черный", "10"])
+    assert first["country"] is second["country"]
+    assert first["goodname"] == second["goodname"]
+    assert first["goodname"] is not second["goodname"]
+
+
+def test_convert_float_columns_marks_invalid_values():
+    rows = [
+        ExportRecord.from_csv(HEADER, ["1", "a", "", "", "10,5"]),
+        ExportRecord.from_csv(HEADER, ["2", "b", "", "", ""]),
+        ExportRecord.from_csv(HEADER, ["3", "c", "", "", "abc"]),
+        ExportRecord.from_csv(HEADER, ["4", "d", "", "", "   "]),
+    ]
+    floats = convert_float_columns(rows, {"retail_price": ("RetailPrice",)})
+    data = [{} for _ in rows]
+    for index, row in enumerate(data):
+        floats.fill(row, index)
+    assert [row["retail_price"] for row in data] == [10.5, None, None, None]
+    assert [floats.is_invalid(0, index) for index in range(len(rows))] == [False, False, True, False]
+
+
+def test_convert_float_columns_missing_column_is_empty():
+    rows = [ExportRecord.from_csv(HEADER, ["1", "a", "", "", "1"])]
+    floats = convert_float_columns(rows, {"measure": ("Measure",)})
+    assert math.isnan(floats.arrays[0][0])
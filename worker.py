@@ -0,0 +1,97 @@
+"""
+Воркер очереди синхронизаций.
+
+    python worker.py
+
+Забирает задачи из таблицы sync_jobs каждого магазина и выполняет полную
+синхронизацию. Можно запускать несколько воркеров: задача выдаётся одному,
+а синхронизации одного магазина не идут одновременно.
+"""
+import asyncio
+import logging
+import os
+import socket
+
+from config.config import WORKER_POLL_SECONDS
+from tasks.job_queue import JOB_STALE_SECONDS, claim_job, complete_job, heartbeat, save_job_progress
+from tasks.profiling import PROFILE_KINDS, run_profiled
+from tasks.sync_progress import SyncProgress, report_progress
+from tasks.tenants import SYNC_FUNCTIONS, TENANTS
+from tasks.throttle import WriteThrottle
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("worker")
+
+# heartbeat заметно чаще, чем задача считается брошенной, и заодно
+# подтягивает бюджет записи, изменённый через API
+HEARTBEAT_SECONDS = min(JOB_STALE_SECONDS / 10, 5)
+
+
+async def keep_alive(tenant, job: dict, throttle: WriteThrottle):
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        try:
+            settings = await heartbeat(tenant, job)
+        except Exception as e:
+            logger.warning(f"[{tenant.name}] Не удалось обновить heartbeat задачи {job['job_id']}: {str(e)}")
+            continue
+        # None — задача не найдена или уже не за этим воркером: бюджет, заданный через API, не сбрасываем
+        if settings is None:
+            logger.warning(f"[{tenant.name}] Задача {job['job_id']} не найдена или у другого воркера")
+        else:
+            throttle.configure(settings)
+
+
+async def run_job(tenant, job: dict):
+    logger.info(f"[{tenant.name}] Задача {job['job_id']}: попытка {job['attempts']} из {job['max_attempts']}")
+    throttle = WriteThrottle(job.get("throttle"))
+    pulse = asyncio.create_task(keep_alive(tenant, job, throttle))
+    # Ход синхронизации для GET /sync/{tenant}/events
+    progress = SyncProgress()
+    reporter = asyncio.create_task(report_progress(tenant, job["job_id"], progress))
+    sync = SYNC_FUNCTIONS[tenant.name]
+    try:
+        if job.get("profile") in PROFILE_KINDS:
+            result, profile = await run_profiled(
+                job["profile"], tenant.name, job["job_id"], lambda: sync(throttle, progress), progress,
+            )
+            result["profile"] = profile
+        else:
+            result = await sync(throttle, progress)
+    except Exception as e:
+        result = {"error": f"Ошибка при синхронизации: {str(e)}"}
+    finally:
+        pulse.cancel()
+        reporter.cancel()
+    progress.sample("error" if result.get("error") else "finished")
+    try:
+        await save_job_progress(tenant, job["job_id"], progress.snapshot())
+    except Exception as e:
+        logger.warning(f"[{tenant.name}] Не удалось сохранить ход задачи {job['job_id']}: {str(e)}")
+    status = await complete_job(tenant, job, result)
+    if status is None:
+        logger.warning(f"[{tenant.name}] Задача {job['job_id']} уже у другого воркера, итог не записан")
+    else:
+        logger.info(f"[{tenant.name}] Задача {job['job_id']}: {status}")
+
+
+async def main():
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Воркер {worker} запущен")
+    while True:
+        claimed = False
+        for tenant in TENANTS.values():
+            try:
+                job = await claim_job(tenant, worker)
+            except Exception as e:
+                logger.error(f"[{tenant.name}] Не удалось получить задачу: {str(e)}")
+                continue
+            if job is not None:
+                claimed = True
+                await run_job(tenant, job)
+        if not claimed:
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())